@@ -1 +1,7 @@
-from app.main import app
\ No newline at end of file
+def __getattr__(name):
+    # Import the application lazily, so importing a submodule (models, services, ...)
+    # does not build the whole app
+    if name == "app":
+        from app.main import app
+        return app
+    raise AttributeError(f"module 'app' has no attribute {name!r}")
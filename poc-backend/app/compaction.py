@@ -0,0 +1,31 @@
+"""
+Run one conversation compaction pass against the configured database.
+
+Usage:
+    python -m app.compaction
+
+Old messages are moved into the compressed archive as configured by the COMPACTION_*
+settings. Safe to run while the application is serving requests.
+"""
+import asyncio
+from app.config import Config
+from app.db import create_engine_from_config, create_session_factory, init_db
+from app.services.archive_service import compact_all
+
+async def main(config=Config):
+    """
+    Compact every conversation once and print what was archived.
+
+    Parameters:
+        config (Config): The application configuration.
+    """
+    engine = create_engine_from_config(config)
+    try:
+        await init_db(engine)
+        result = await compact_all(create_session_factory(engine), config)
+        print(f"Archived {result['messages']} messages from {result['conversations']} conversations")
+    finally:
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -14,17 +14,197 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "jwtsecretkey")
 
+    # Authentication Configuration
+    ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+    PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+    # Capped at the token lifetime
+    PRINCIPAL_CACHE_TTL_SECONDS = min(
+        float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60")), ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    )
+    # Let read-only routes trust the signed token claims without checking the users table
+    AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+    # Password Hashing Configuration
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+    PASSWORD_HASH_MAX_IN_FLIGHT = int(os.getenv("PASSWORD_HASH_MAX_IN_FLIGHT", "32"))
+    PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS = float(os.getenv("PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", "2"))
+
     # Database Configuration
     DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///poc.db")
+    # Log every SQL statement (debugging only: slow, and synchronous on the event loop)
+    DB_ECHO = os.getenv("DB_ECHO", "false").lower() == "true"
+    # Connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))  # -1 disables recycling
+    DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+    # SQLite pragmas applied on every new connection (empty journal mode/synchronous keeps the SQLite default)
+    SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+    # Response Compression Configuration
+    COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+    COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))  # bytes
+    COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))  # requires the 'brotli' package
+
+    # Metrics Configuration
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
 
     # Twilio Configuration
     TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
     TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
     TWILIO_PHONE_NUMBER = os.getenv("TWILIO_PHONE_NUMBER")
 
+    # LLM Backend Configuration
+    LLM_BACKEND = os.getenv("LLM_BACKEND", "huggingface")  # "huggingface", "openai" or "stub"
+
     # Hugging Face LLM API Configuration
     HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
-    HUGGINGFACE_MODEL_URL = os.getenv(
-        "HUGGINGFACE_MODEL_URL",
-        "https://api-inference.huggingface.co/models/meta-llama/llama-3.3-70b-instruct"
+    HUGGINGFACE_CHAT_URL = os.getenv("HUGGINGFACE_CHAT_URL", "https://router.huggingface.co/v1/chat/completions")
+    # Deprecated: when only the legacy HUGGINGFACE_MODEL_URL (".../models/<model>") is set, its model is used
+    HUGGINGFACE_MODEL_URL = os.getenv("HUGGINGFACE_MODEL_URL")
+    HUGGINGFACE_CHAT_MODEL = os.getenv("HUGGINGFACE_CHAT_MODEL") or (
+        HUGGINGFACE_MODEL_URL.rstrip("/").split("/models/", 1)[-1] if HUGGINGFACE_MODEL_URL
+        else "meta-llama/Llama-3.3-70B-Instruct:fireworks-ai"
     )
+
+    # OpenAI-compatible LLM API Configuration
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "http://localhost:8001/v1")
+    OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_MODEL = os.getenv("OPENAI_MODEL", "meta-llama/Llama-3.3-70B-Instruct")
+
+    # Stub LLM Backend Configuration (load testing)
+    LLM_STUB_LATENCY_MS = float(os.getenv("LLM_STUB_LATENCY_MS", "200"))  # mean time to first token
+    LLM_STUB_LATENCY_DISTRIBUTION = os.getenv("LLM_STUB_LATENCY_DISTRIBUTION", "lognormal")  # constant, uniform, exponential, lognormal
+    LLM_STUB_LATENCY_SIGMA = float(os.getenv("LLM_STUB_LATENCY_SIGMA", "0.5"))
+    LLM_STUB_TOKENS_PER_SECOND = float(os.getenv("LLM_STUB_TOKENS_PER_SECOND", "50"))
+    LLM_STUB_REPLY_TOKENS = int(os.getenv("LLM_STUB_REPLY_TOKENS", "60"))
+    LLM_STUB_FAILURE_RATE = float(os.getenv("LLM_STUB_FAILURE_RATE", "0"))
+    LLM_STUB_FAILURE_STATUS = int(os.getenv("LLM_STUB_FAILURE_STATUS", "503"))
+    LLM_STUB_SEED = int(os.getenv("LLM_STUB_SEED", "0"))
+
+    # LLM HTTP Client Configuration
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+    LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+    LLM_READ_TIMEOUT_SECONDS = float(os.getenv("LLM_READ_TIMEOUT_SECONDS", "120"))
+    LLM_POOL_TIMEOUT_SECONDS = float(os.getenv("LLM_POOL_TIMEOUT_SECONDS", "10"))
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "30"))
+
+    # LLM Admission Control Configuration
+    LLM_MAX_CONCURRENT_CALLS = int(os.getenv("LLM_MAX_CONCURRENT_CALLS", "32"))
+    LLM_MAX_QUEUED_CALLS = int(os.getenv("LLM_MAX_QUEUED_CALLS", "64"))
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "10"))
+    # User tiers whose chat turns use the priority lane
+    LLM_PRIORITY_TIERS = [tier.strip() for tier in os.getenv("LLM_PRIORITY_TIERS", "escalated").split(",") if tier.strip()]
+
+    # LLM Resilience Configuration
+    LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "60"))
+    LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "90"))  # all attempts and backoffs of one call
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+    LLM_RETRY_BACKOFF_MS = float(os.getenv("LLM_RETRY_BACKOFF_MS", "200"))
+    LLM_RETRY_BACKOFF_MAX_MS = float(os.getenv("LLM_RETRY_BACKOFF_MAX_MS", "5000"))
+    # Backend for hedged requests ("huggingface", "openai" or "stub"; empty disables hedging)
+    LLM_HEDGE_BACKEND = os.getenv("LLM_HEDGE_BACKEND", "")
+    LLM_HEDGE_MODEL = os.getenv("LLM_HEDGE_MODEL", "")  # overrides the hedge backend's model
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "2000"))  # until enough latencies are observed
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RESET_SECONDS = float(os.getenv("LLM_CIRCUIT_RESET_SECONDS", "30"))
+
+    # Per-user Quota Configuration
+    # Each user gets QUOTA_REQUESTS_PER_WINDOW chat requests and QUOTA_TOKENS_PER_WINDOW LLM tokens
+    # (prompt and completion) per QUOTA_WINDOW_SECONDS, refilled continuously; 0 disables a limit
+    QUOTA_WINDOW_SECONDS = float(os.getenv("QUOTA_WINDOW_SECONDS", "60"))
+    QUOTA_REQUESTS_PER_WINDOW = int(os.getenv("QUOTA_REQUESTS_PER_WINDOW", "30"))
+    QUOTA_TOKENS_PER_WINDOW = int(os.getenv("QUOTA_TOKENS_PER_WINDOW", "100000"))
+    QUOTA_BACKEND = os.getenv("QUOTA_BACKEND", "memory")  # "memory" (per worker) or "sqlite" (shared by workers)
+    QUOTA_SQLITE_PATH = os.getenv("QUOTA_SQLITE_PATH", "quota.db")
+
+    # Write-behind Chat Turn Persistence Configuration
+    # Return replies before the turn is committed; turns are written in batches (lost on a crash)
+    WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_FLUSH_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "5"))
+    WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500"))
+    # Beyond this many queued turns, turns are written synchronously
+    WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "2000"))
+
+    # Idempotency Key Configuration
+    IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))  # how long replies are replayed
+    # A request still in progress after this long is considered abandoned (e.g. its worker died)
+    IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "180"))
+    # How long a retry waits for the original request when it runs on another worker
+    IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+
+    # Chat Job Queue Configuration
+    JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "8"))  # jobs run at once per worker process
+    JOB_POLL_INTERVAL_MS = float(os.getenv("JOB_POLL_INTERVAL_MS", "500"))  # idle workers and job event streams
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "180"))  # longer than LLM_DEADLINE_SECONDS
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    # Also run job workers inside the web process (otherwise run "python -m app.worker")
+    JOB_WORKER_IN_PROCESS = os.getenv("JOB_WORKER_IN_PROCESS", "false").lower() == "true"
+
+    # Technician Dispatch Configuration
+    # User tiers allowed to register as technicians and take calls
+    DISPATCH_TECHNICIAN_TIERS = [tier.strip() for tier in os.getenv("DISPATCH_TECHNICIAN_TIERS", "technician").split(",") if tier.strip()]
+    # Callers in these tiers are served before others who have waited less than DISPATCH_PRIORITY_BOOST_SECONDS longer
+    DISPATCH_PRIORITY_TIERS = [tier.strip() for tier in os.getenv("DISPATCH_PRIORITY_TIERS", "escalated").split(",") if tier.strip()]
+    DISPATCH_PRIORITY_BOOST_SECONDS = float(os.getenv("DISPATCH_PRIORITY_BOOST_SECONDS", "300"))
+    # Technicians not heard from for this long are taken off duty (an open event stream counts)
+    DISPATCH_HEARTBEAT_TIMEOUT_SECONDS = float(os.getenv("DISPATCH_HEARTBEAT_TIMEOUT_SECONDS", "30"))
+    DISPATCH_DEFAULT_CALL_SECONDS = float(os.getenv("DISPATCH_DEFAULT_CALL_SECONDS", "300"))  # ETA until calls complete
+    DISPATCH_KEEPALIVE_SECONDS = float(os.getenv("DISPATCH_KEEPALIVE_SECONDS", "15"))  # event stream keep-alives
+
+    # Conversation Compaction Configuration
+    # Messages beyond the newest COMPACTION_KEEP_MESSAGES that are older than COMPACTION_MIN_AGE_HOURS
+    # and already folded into the conversation summary are moved to the compressed archive
+    COMPACTION_KEEP_MESSAGES = int(os.getenv("COMPACTION_KEEP_MESSAGES", "200"))
+    COMPACTION_MIN_AGE_HOURS = float(os.getenv("COMPACTION_MIN_AGE_HOURS", "24"))
+    COMPACTION_CHUNK_MESSAGES = int(os.getenv("COMPACTION_CHUNK_MESSAGES", "100"))
+    COMPACTION_CODEC = os.getenv("COMPACTION_CODEC", "zstd")  # "zstd" (if installed) or "zlib"
+    # Run compaction in the background every this many seconds (0 disables; see also python -m app.compaction)
+    COMPACTION_INTERVAL_SECONDS = float(os.getenv("COMPACTION_INTERVAL_SECONDS", "0"))
+
+    # Conversation Export Configuration
+    # User tiers allowed to export and import all conversations (see also python -m app.export)
+    ADMIN_TIERS = [tier.strip() for tier in os.getenv("ADMIN_TIERS", "admin").split(",") if tier.strip()]
+    EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "1000"))  # rows per cursor fetch and per INSERT
+
+    # Conversation History Configuration
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+    HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "500"))
+
+    # Conversation Search Configuration
+    SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+    SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+
+    # LLM Context Window Configuration
+    LLM_SYSTEM_PROMPT = os.getenv(
+        "LLM_SYSTEM_PROMPT",
+        "You are a helpful customer service assistant. Answer clearly and concisely."
+    )
+    LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "3000"))
+    LLM_SUMMARY_TOKEN_BUDGET = int(os.getenv("LLM_SUMMARY_TOKEN_BUDGET", "400"))
+    # Exact token counts (opt-in, needs the optional 'tokenizers' package): a Hugging Face tokenizer repo
+    # (downloaded once into the local HF cache; gated repos need HUGGINGFACE_API_KEY) or a local
+    # tokenizer.json path. Unset, tokens are estimated at ~4 characters per token.
+    LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "")
+
+    # LLM Response Cache Configuration
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # "memory" or "sqlite"
+    LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH", "llm_cache.db")
+    LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+    LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Number of messages before the latest one that must also match for a cache hit
+    LLM_CACHE_HISTORY_MESSAGES = int(os.getenv("LLM_CACHE_HISTORY_MESSAGES", "2"))
+    LLM_CACHE_NEAR_DUPLICATES = os.getenv("LLM_CACHE_NEAR_DUPLICATES", "false").lower() == "true"
+    # Maximum SimHash distance (in bits, at most 7) for a near-duplicate hit
+    LLM_CACHE_SIMHASH_DISTANCE = int(os.getenv("LLM_CACHE_SIMHASH_DISTANCE", "3"))
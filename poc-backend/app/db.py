@@ -1,73 +1,152 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from fastapi.requests import HTTPConnection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
 from app.config import Config
-import asyncio
-
-DATABASE_URL = Config.DATABASE_URL
-engine = create_async_engine(DATABASE_URL, echo=True)
-
-# Create a session factory
-AsyncSessionLocal = sessionmaker(
-    autocommit=False,
-    autoflush=False,
-    bind=engine,
-    class_=AsyncSession,
-)
+from app.serialization import json_dumps, json_loads
 
 # Base class for models
 Base = declarative_base()
 
-async def get_db():
+def _is_in_memory_sqlite(url) -> bool:
+    database = url.database or ""
+    return database in ("", ":memory:") or url.query.get("mode") == "memory"
+
+def _engine_options(config, url) -> dict:
     """
-    Dependency function to get a database session.
+    Build the engine options for a database URL. In-memory SQLite uses a single static
+    connection, so the queue pool settings do not apply to it.
+    """
+    options = {
+        "echo": config.DB_ECHO,
+        "pool_pre_ping": config.DB_POOL_PRE_PING,
+        # JSON columns are (de)serialized with orjson when it is installed
+        "json_serializer": json_dumps,
+        "json_deserializer": json_loads,
+    }
+    if url.get_backend_name() == "sqlite" and _is_in_memory_sqlite(url):
+        return options
+    options.update(
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_timeout=config.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+    )
+    return options
 
-    Yields:
-        AsyncSession: An asynchronous database session.
+def _sqlite_pragmas(config) -> list:
     """
-    async with AsyncSessionLocal() as session:
-        yield session
+    Build the PRAGMA statements run on every new SQLite connection.
 
-async def ensure_tables_exist():
+    WAL lets readers proceed while a commit is being written, and synchronous=NORMAL is
+    durable across application crashes in WAL mode (a power loss may lose the last commits).
     """
-    Function to check if 'users' and 'conversations' tables exist and create them if missing.
+    pragmas = []
+    if config.SQLITE_JOURNAL_MODE:
+        pragmas.append(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+    if config.SQLITE_SYNCHRONOUS:
+        pragmas.append(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+    pragmas.append(f"PRAGMA busy_timeout={int(config.SQLITE_BUSY_TIMEOUT_MS)}")
+    pragmas.append(f"PRAGMA mmap_size={int(config.SQLITE_MMAP_SIZE)}")
+    return pragmas
 
-    Raises:
-        SQLAlchemyError: If there is an error executing the SQL commands.
+def create_engine_from_config(config=Config) -> AsyncEngine:
     """
-    try:
-        async with engine.begin() as conn:
-            result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='users'"))
-            users_table_exists = result.scalar() is not None
+    Create the database engine. No connection is opened until the engine is first used.
 
-            result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='conversations'"))
-            conversations_table_exists = result.scalar() is not None
+    Pool settings come from the DB_POOL_* settings. On SQLite, the SQLITE_* pragmas are
+    applied to every new connection.
 
-            if not users_table_exists or not conversations_table_exists:
-                print("🔹 Tables not found, creating tables...")
-                await conn.run_sync(Base.metadata.create_all)
-            else:
-                print("All tables exist.")
-    except SQLAlchemyError as sqlError:
-        print(sqlError)
+    Parameters:
+        config (Config): The application configuration.
+
+    Returns:
+        AsyncEngine: The engine.
+    """
+    url = make_url(config.DATABASE_URL)
+    engine = create_async_engine(url, **_engine_options(config, url))
+
+    if url.get_backend_name() == "sqlite":
+        pragmas = _sqlite_pragmas(config)
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    return engine
+
+def create_session_factory(engine: AsyncEngine) -> sessionmaker:
+    """
+    Create the session factory bound to an engine.
+
+    Parameters:
+        engine (AsyncEngine): The database engine.
+
+    Returns:
+        sessionmaker: A factory of AsyncSession objects.
+    """
+    return sessionmaker(
+        autocommit=False,
+        autoflush=False,
+        bind=engine,
+        class_=AsyncSession,
+    )
+
+async def get_db(connection: HTTPConnection):
+    """
+    Dependency function to get a database session from the application's session factory.
+
+    Parameters:
+        connection (HTTPConnection): The current request or WebSocket connection.
 
-async def init_db():
+    Yields:
+        AsyncSession: An asynchronous database session.
     """
-    Function to initialize the database by creating all tables.
+    async with connection.app.state.session_factory() as session:
+        yield session
+
+def _missing_tables(sync_connection) -> list:
+    existing = set(inspect(sync_connection).get_table_names())
+    return [table.name for table in Base.metadata.sorted_tables if table.name not in existing]
+
+async def init_db(engine: AsyncEngine):
+    """
+    Function to initialize the database by creating missing tables and migrating existing ones.
+
+    Parameters:
+        engine (AsyncEngine): The database engine.
 
     Raises:
         SQLAlchemyError: If there is an error executing the SQL commands.
     """
+    # Imported here so the models are registered on Base before the schema is checked
+    import app.models  # noqa: F401
+    from app.migrations import run_migrations
+
     try:
         async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+            missing_tables = await conn.run_sync(_missing_tables)
+            if missing_tables:
+                print(f"🔹 Creating missing tables: {', '.join(missing_tables)}")
+                await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(run_migrations)
     except SQLAlchemyError as sqlError:
         print(f"Error initializing the database: {sqlError}")
         raise
 
-# Run the ensure_tables_exist function to check and create tables if necessary
-try:
-    asyncio.run(ensure_tables_exist())
-except SQLAlchemyError as sqlError:
-    print(f"Error running ensure_tables_exist: {sqlError}")
\ No newline at end of file
+async def warm_up_pool(engine: AsyncEngine):
+    """
+    Open a first pooled connection so the first request does not pay for it.
+
+    Parameters:
+        engine (AsyncEngine): The database engine.
+    """
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
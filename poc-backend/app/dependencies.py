@@ -1,3 +1,5 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
@@ -7,10 +9,17 @@ from datetime import datetime, timedelta
 from app.config import Config
 from app.db import get_db
 from app.models import User
+from app.services.principal_cache import principal_cache
 from sqlalchemy.future import select
 
-# Bcrypt Password Hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Bcrypt Password Hashing (hashes made with a different cost are upgraded on login)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=Config.BCRYPT_ROUNDS)
+
+# Hashing runs on a dedicated thread pool (bcrypt releases the GIL) so it never blocks the event loop
+password_hash_executor = ThreadPoolExecutor(
+    max_workers=Config.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+password_hash_slots = asyncio.Semaphore(Config.PASSWORD_HASH_MAX_IN_FLIGHT)
 
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -18,7 +27,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 # JWT Settings
 SECRET_KEY = Config.JWT_SECRET_KEY
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ACCESS_TOKEN_EXPIRE_MINUTES = Config.ACCESS_TOKEN_EXPIRE_MINUTES
 
 def hash_password(password: str) -> str:
     """
@@ -45,6 +54,68 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     return pwd_context.verify(plain_password, hashed_password)
 
+async def run_password_hash(function, *args):
+    """
+    Run a password hashing function on the hashing thread pool.
+
+    At most PASSWORD_HASH_MAX_IN_FLIGHT hashes run or wait in the pool at once; callers that
+    cannot get a slot within PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS are turned away.
+
+    Parameters:
+        function (Callable): The blocking hashing function.
+        *args: The arguments for the function.
+
+    Returns:
+        Any: The result of the function.
+
+    Raises:
+        HTTPException: 503 if the hashing queue is full.
+    """
+    try:
+        await asyncio.wait_for(password_hash_slots.acquire(), timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please try again",
+            headers={"Retry-After": "1"},
+        )
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_hash_executor, function, *args)
+    finally:
+        password_hash_slots.release()
+
+async def hash_password_async(password: str) -> str:
+    """
+    Hash a plain text password without blocking the event loop.
+
+    Parameters:
+        password (str): The plain text password to hash.
+
+    Returns:
+        str: The hashed password.
+
+    Raises:
+        HTTPException: 503 if the hashing queue is full.
+    """
+    return await run_password_hash(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """
+    Verify a plain password against a hashed password without blocking the event loop.
+
+    Parameters:
+        plain_password (str): The plain text password.
+        hashed_password (str): The hashed password.
+
+    Returns:
+        tuple[bool, str | None]: Whether the password matches, and a replacement hash if the
+            stored one was made with outdated settings (e.g. a different bcrypt cost).
+
+    Raises:
+        HTTPException: 503 if the hashing queue is full.
+    """
+    return await run_password_hash(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """
     Generate a JWT access token.
@@ -61,32 +132,62 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+def _credentials_exception() -> HTTPException:
     """
-    Retrieve the current user from the JWT token.
+    Build the error returned for missing or invalid credentials.
+
+    Returns:
+        HTTPException: A 401 error asking for a bearer token.
+    """
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def decode_access_token(token: str) -> dict:
+    """
+    Decode and validate a JWT access token.
 
     Parameters:
         token (str): The JWT token.
-        db (AsyncSession): The database session.
 
     Returns:
-        User: The current user.
+        dict: The token claims; "sub" is converted to the integer user ID.
 
     Raises:
-        HTTPException: If the authentication credentials are invalid or the user is not found.
+        HTTPException: If the token is invalid, expired or has no subject.
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Invalid authentication credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
+        payload["sub"] = int(payload["sub"])
+        return payload
+    except (JWTError, KeyError, TypeError, ValueError):
+        raise _credentials_exception()
+
+async def authenticate_token(token: str, db: AsyncSession) -> User:
+    """
+    Resolve a JWT access token to the user it was issued for.
+
+    Recently seen users are served from the principal cache; otherwise the user is loaded
+    from the database and cached until the cache TTL or the token expiry, whichever is sooner.
+
+    Parameters:
+        token (str): The JWT token.
+        db (AsyncSession): The database session.
+
+    Returns:
+        User: The user the token belongs to.
+
+    Raises:
+        HTTPException: If the authentication credentials are invalid or the user is not found.
+    """
+    payload = decode_access_token(token)
+    user_id = payload["sub"]
+
+    user = principal_cache.get(user_id)
+    if user is not None:
+        return user
 
     try:
         # Query user from the database
@@ -99,5 +200,63 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         )
 
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    principal_cache.put(user, payload.get("exp"))
     return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    """
+    Retrieve the current user from the JWT token.
+
+    Parameters:
+        token (str): The JWT token.
+        db (AsyncSession): The database session.
+
+    Returns:
+        User: The current user.
+
+    Raises:
+        HTTPException: If the authentication credentials are invalid or the user is not found.
+    """
+    return await authenticate_token(token, db)
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+    """
+    Retrieve the current user for read-only routes.
+
+    With AUTH_TRUST_TOKEN_CLAIMS enabled, the user is built from the signed token claims
+    without checking that the account still exists, so a deleted user keeps read access
+    until their token expires. Otherwise this behaves like get_current_user.
+
+    Parameters:
+        token (str): The JWT token.
+        db (AsyncSession): The database session.
+
+    Returns:
+        User: The current user (a detached copy when built from the claims).
+
+    Raises:
+        HTTPException: If the authentication credentials are invalid or the user is not found.
+    """
+    if Config.AUTH_TRUST_TOKEN_CLAIMS:
+        payload = decode_access_token(token)
+        if payload.get("username"):
+            return User(id=payload["sub"], username=payload["username"], tier=payload.get("tier", "standard"))
+    return await authenticate_token(token, db)
+
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    """
+    Retrieve the current user for administrative routes.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        User: The current user.
+
+    Raises:
+        HTTPException: 403 if the user's tier is not one of ADMIN_TIERS.
+    """
+    if current_user.tier not in Config.ADMIN_TIERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Administrators only")
+    return current_user
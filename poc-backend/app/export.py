@@ -0,0 +1,68 @@
+"""
+Export every user and conversation in the configured database as NDJSON.
+
+Usage:
+    python -m app.export [PATH] [--gzip]
+
+Writes to PATH ("-" or no PATH for standard output), gzipped with --gzip or when PATH
+ends in ".gz". Rows are streamed, so memory use does not depend on the size of the
+database. The export includes password hashes; keep it private. Load it with
+python -m app.import.
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import sys
+from app.config import Config
+from app.db import create_engine_from_config, create_session_factory, init_db
+from app.services.export_service import export_ndjson
+
+def open_output(path: str, compress: bool):
+    """
+    Open the file the export is written to.
+
+    Parameters:
+        path (str): The file path, or "-" for standard output.
+        compress (bool): Whether to gzip the export.
+
+    Returns:
+        BinaryIO: The opened file.
+    """
+    if path == "-":
+        return gzip.GzipFile(fileobj=sys.stdout.buffer, mode="wb") if compress else sys.stdout.buffer
+    return gzip.open(path, "wb") if compress else open(path, "wb")
+
+async def main(path: str = "-", compress: bool = False, config=Config):
+    """
+    Export the database to a file.
+
+    Parameters:
+        path (str): The file path, or "-" for standard output.
+        compress (bool): Whether to gzip the export.
+        config (Config): The application configuration.
+    """
+    engine = create_engine_from_config(config)
+    stdout = sys.stdout.buffer
+    output = open_output(path, compress or path.endswith(".gz"))
+    try:
+        # Keep messages (e.g. from init_db) out of an export written to standard output
+        with contextlib.redirect_stdout(sys.stderr) if path == "-" else contextlib.nullcontext():
+            await init_db(engine)
+            async with create_session_factory(engine)() as db:
+                async for chunk in export_ndjson(db, config.EXPORT_BATCH_ROWS):
+                    output.write(chunk.encode())
+    finally:
+        # Closing a gzip file writes its trailer; it does not close standard output
+        if output is not stdout:
+            output.close()
+        if path == "-":
+            stdout.flush()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export conversations as NDJSON")
+    parser.add_argument("path", nargs="?", default="-", help='output file ("-" for standard output)')
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.path, arguments.gzip))
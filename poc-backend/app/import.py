@@ -0,0 +1,71 @@
+"""
+Import users and conversations from an NDJSON export into the configured database.
+
+Usage:
+    python -m app.import [PATH]
+
+Reads PATH ("-" or no PATH for standard input), gunzipping it when it is gzipped. Rows
+are written in batches of EXPORT_BATCH_ROWS, so memory use does not depend on the size
+of the export. Existing users are kept, and running an import again only adds what is
+missing, so an interrupted import can be resumed by re-running it.
+"""
+import argparse
+import asyncio
+import gzip
+import sys
+from app.config import Config
+from app.db import create_engine_from_config, create_session_factory, init_db
+from app.services.export_service import import_ndjson
+
+# First bytes of a gzip file
+GZIP_MAGIC = b"\x1f\x8b"
+
+def open_input(path: str):
+    """
+    Open the export to read, gunzipping it if it starts with the gzip magic bytes.
+
+    Parameters:
+        path (str): The file path, or "-" for standard input.
+
+    Returns:
+        BinaryIO: The opened file.
+    """
+    if path == "-":
+        stream = sys.stdin.buffer
+        return gzip.GzipFile(fileobj=stream, mode="rb") if stream.peek(2)[:2] == GZIP_MAGIC else stream
+    with open(path, "rb") as stream:
+        compressed = stream.read(2) == GZIP_MAGIC
+    return gzip.open(path, "rb") if compressed else open(path, "rb")
+
+async def _lines(stream):
+    for line in stream:
+        yield line
+
+async def main(path: str = "-", config=Config):
+    """
+    Import an export into the database and print what was imported.
+
+    Parameters:
+        path (str): The file path, or "-" for standard input.
+        config (Config): The application configuration.
+    """
+    engine = create_engine_from_config(config)
+    stream = open_input(path)
+    try:
+        await init_db(engine)
+        async with create_session_factory(engine)() as db:
+            counts = await import_ndjson(db, _lines(stream), config.EXPORT_BATCH_ROWS)
+        print(
+            f"Imported {counts['users']} users, {counts['conversations']} conversations and "
+            f"{counts['messages']} messages (skipped {counts['skipped_messages']} existing messages)"
+        )
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import conversations from an NDJSON export")
+    parser.add_argument("path", nargs="?", default="-", help='input file ("-" for standard input)')
+    arguments = parser.parse_args()
+    asyncio.run(main(arguments.path))
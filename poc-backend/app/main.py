@@ -1,30 +1,124 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from app.db import init_db
-from app.routes import auth, llm, call
 import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Response
+from fastapi.middleware.cors import CORSMiddleware
+from app.compression import CompressionMiddleware
+from app.config import Config
+from app.db import create_engine_from_config, create_session_factory, init_db, warm_up_pool
+from app.metrics import MetricsMiddleware, instrument_engine, registry
+from app.routes import admin, auth, llm, call
+from app.services.archive_service import run_compaction_periodically
+from app.services.job_service import JobWorker
+from app.services.llm_service import init_llm_backend, close_llm_backend
+from app.services.turn_writer import turn_writer
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan handler.
+
+    On startup, checks and migrates the database schema, opens a first pooled database
+    connection, creates the shared LLM backend and, if enabled, starts the write-behind chat
+    turn writer, periodic conversation compaction and in-process chat job workers. On
+    shutdown, finishes the running jobs, writes every queued turn, then closes the LLM
+    backend and the database connection pool.
+
+    Parameters:
+        app (FastAPI): The application instance.
+    """
+    engine = app.state.engine
+    config = app.state.config
+    await init_db(engine)
+    await warm_up_pool(engine)
+    await init_llm_backend()
+    if config.WRITE_BEHIND_ENABLED:
+        turn_writer.start(app.state.session_factory)
+    compaction_task = None
+    if config.COMPACTION_INTERVAL_SECONDS > 0:
+        compaction_task = asyncio.create_task(
+            run_compaction_periodically(app.state.session_factory, config.COMPACTION_INTERVAL_SECONDS, config)
+        )
+    job_worker = None
+    if config.JOB_WORKER_IN_PROCESS:
+        job_worker = JobWorker(app.state.session_factory, config=config)
+        job_worker.start()
+    try:
+        yield
+    finally:
+        if job_worker is not None:
+            await job_worker.stop()
+        if compaction_task is not None:
+            compaction_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await compaction_task
+        await turn_writer.stop()
+        await close_llm_backend()
+        await engine.dispose()
+
+async def metrics():
+    """
+    Expose the application metrics in the Prometheus text format.
+
+    Returns:
+        Response: The metrics exposition.
+    """
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def create_app(config=Config) -> FastAPI:
+    """
+    Create a FastAPI application instance.
+
+    Nothing touches the database or the LLM provider until the application starts, so
+    creating (or importing) the application is cheap, and tests can create isolated instances.
+
+    Parameters:
+        config (Config): The application configuration (DATABASE_URL, DB_ECHO, METRICS_ENABLED,
+            COMPRESSION_*).
+
+    Returns:
+        FastAPI: The application.
+    """
+    app = FastAPI(title="FastAPI LLM Service", version="1.0", lifespan=lifespan)
+    app.state.config = config
+    app.state.engine = create_engine_from_config(config)
+    app.state.session_factory = create_session_factory(app.state.engine)
+
+    # Enable CORS for frontend communication
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
-# Create FastAPI app instance
-app = FastAPI(title="FastAPI LLM Service", version="1.0")
+    # Compress large responses (gzip, or brotli when installed) as negotiated with the client
+    if config.COMPRESSION_ENABLED:
+        app.add_middleware(
+            CompressionMiddleware,
+            minimum_size=config.COMPRESSION_MINIMUM_SIZE,
+            gzip_level=config.COMPRESSION_GZIP_LEVEL,
+            brotli_quality=config.COMPRESSION_BROTLI_QUALITY,
+        )
 
-# Enable CORS for frontend communication
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # Record request latency, in-flight requests and per-request database usage
+    if config.METRICS_ENABLED:
+        instrument_engine(app.state.engine)
+        app.add_middleware(MetricsMiddleware)
+        app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
 
-# Initialize database
-asyncio.run(init_db())
+    # Include API routes
+    app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
+    app.include_router(llm.router, prefix="/api/llm", tags=["LLM"])
+    app.include_router(call.router, prefix="/api/call", tags=["Call"])
+    app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
+    return app
 
-# Include API routes
-app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
-app.include_router(llm.router, prefix="/api/llm", tags=["LLM"])
-app.include_router(call.router, prefix="/api/call", tags=["Call"])
+# Application instance used by "uvicorn app.main:app"
+# (or use "uvicorn --factory app.main:create_app")
+app = create_app()
 
 # Run the application
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
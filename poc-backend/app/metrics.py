@@ -0,0 +1,341 @@
+import bisect
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+# Default latency buckets (seconds), as used by the Prometheus client libraries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    """
+    Base class of a metric family, with one value per combination of label values.
+
+    A metric built with a callback reads its values at render time instead; the callback
+    returns {tuple of label values: value}. This exposes counters that other components
+    already keep without updating two copies.
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.callback = callback
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+
+    def samples(self) -> list:
+        if self.callback is not None:
+            self._values = {tuple(str(item) for item in key): value for key, value in self.callback().items()}
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(self._values.items())
+        ]
+
+    def render(self) -> list:
+        return self.header() + self.samples()
+
+class Counter(Metric):
+    """
+    Monotonically increasing count.
+    """
+
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+class Gauge(Metric):
+    """
+    Value that goes up and down.
+    """
+
+    metric_type = "gauge"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over fixed buckets, with their count and sum.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), then the sum
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, **labels) -> int:
+        series = self._values.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def total(self, **labels) -> float:
+        series = self._values.get(self._key(labels))
+        return series[1] if series else 0.0
+
+    def samples(self) -> list:
+        lines = []
+        for key, (bucket_counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        return lines
+
+class Registry:
+    """
+    Collection of metric families rendered together in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = (), callback=None) -> Counter:
+        return self.register(Counter(name, documentation, labels, callback))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, callback))
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """
+        Render every metric.
+
+        Returns:
+            str: The exposition text (Prometheus text format 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception as renderError:
+                print(f"Error rendering metric {metric.name}: {renderError}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# HTTP
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests handled, by route template and status code.", ("method", "route", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "http_request_duration_seconds", "Time until the last byte of the response was sent.", ("method", "route")
+)
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests currently being handled.", ("method",))
+
+# Database
+db_queries_total = registry.counter("db_queries_total", "SQL statements executed.")
+db_query_duration_seconds = registry.histogram("db_query_duration_seconds", "Duration of single SQL statements.")
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "SQL statements executed while handling one HTTP request.", ("route",), COUNT_BUCKETS
+)
+db_time_per_request_seconds = registry.histogram(
+    "db_time_per_request_seconds", "Time spent in SQL statements while handling one HTTP request.", ("route",)
+)
+db_pool_wait_seconds = registry.histogram(
+    "db_pool_wait_seconds", "Time spent checking a database connection out of the pool."
+)
+
+# LLM provider
+llm_request_duration_seconds = registry.histogram(
+    "llm_request_duration_seconds", "Duration of LLM provider calls.", ("backend", "operation"), LLM_BUCKETS
+)
+llm_time_to_first_token_seconds = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until a streamed LLM reply produced its first chunk.", ("backend",), LLM_BUCKETS
+)
+llm_requests_total = registry.counter(
+    "llm_requests_total", "LLM provider calls, by outcome.", ("backend", "operation", "outcome")
+)
+llm_tokens_total = registry.counter(
+    "llm_tokens_total", "Tokens reported by the LLM provider.", ("backend", "type")
+)
+llm_stream_chunks_total = registry.counter(
+    "llm_stream_chunks_total", "Chunks received from streamed LLM replies.", ("backend",)
+)
+
+class RequestDatabaseStats:
+    """
+    SQL statement count and time of the HTTP request being handled.
+    """
+
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+# Database statistics of the current HTTP request (None outside of a request)
+request_db_stats: ContextVar[RequestDatabaseStats | None] = ContextVar("request_db_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    db_queries_total.inc()
+    db_query_duration_seconds.observe(elapsed)
+    stats = request_db_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+def _time_checkouts(sync_engine):
+    # Every Connection checks its DBAPI connection out of the pool through raw_connection()
+    raw_connection = sync_engine.raw_connection
+
+    def timed_raw_connection():
+        started = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            db_pool_wait_seconds.observe(time.perf_counter() - started)
+
+    sync_engine.raw_connection = timed_raw_connection
+
+def instrument_engine(engine):
+    """
+    Record SQL statement counts and durations, pool usage and pool waits for an engine.
+
+    Parameters:
+        engine (AsyncEngine): The engine to instrument.
+    """
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+    _time_checkouts(sync_engine)
+
+    def pool_connections():
+        pool = sync_engine.pool
+        values = {("checked_out",): pool.checkedout()} if hasattr(pool, "checkedout") else {}
+        if hasattr(pool, "size"):
+            values[("size",)] = pool.size()
+        if hasattr(pool, "overflow"):
+            values[("overflow",)] = max(0, pool.overflow())
+        return values
+
+    registry.gauge("db_pool_connections", "Database connection pool usage.", ("state",), pool_connections)
+
+def _route_template(scope) -> str:
+    """
+    Label a handled request by the path template of its route (e.g. "/api/items/{item_id}"),
+    which keeps the label cardinality bounded. Requests that matched no route are labelled
+    "unmatched".
+
+    Recent FastAPI versions keep the routes of included routers without the router prefix;
+    the prefix is then the part of the request path in front of what the route matched.
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    path = scope["path"]
+    start = 0
+    while start != -1 and not route.path_regex.match(path[start:]):
+        start = path.find("/", start + 1)
+    return path[:max(start, 0)] + route.path
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route request counts, latency, in-flight requests and
+    per-request database usage. Latency runs until the last body chunk, so it covers the
+    whole of a streamed response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        started = time.perf_counter()
+        stats = RequestDatabaseStats()
+        stats_token = request_db_stats.set(stats)
+        http_requests_in_flight.inc(method=method)
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_db_stats.reset(stats_token)
+            http_requests_in_flight.dec(method=method)
+            # Routing has filled in the matched route by now
+            route = _route_template(scope)
+            http_requests_total.inc(method=method, route=route, status=status_code)
+            http_request_duration_seconds.observe(time.perf_counter() - started, method=method, route=route)
+            db_queries_per_request.observe(stats.queries, route=route)
+            db_time_per_request_seconds.observe(stats.seconds, route=route)
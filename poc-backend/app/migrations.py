@@ -0,0 +1,203 @@
+import json
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.engine import Connection
+from app.models import Conversation, Message, MessageArchive, User
+from app.services.archive_service import decompress_messages
+from app.services.search_service import SEARCH_TABLE
+
+# Number of exploded message rows inserted per statement
+MIGRATION_BATCH_SIZE = 1000
+# Number of legacy conversation blobs read per query
+MIGRATION_BLOB_BATCH_SIZE = 100
+# Copy of the legacy conversation blobs, kept after they are exploded into messages
+LEGACY_BLOBS_TABLE = "legacy_conversation_blobs"
+
+def _add_missing_columns(connection: Connection, table):
+    """
+    Add any column declared on a model's table that is missing from the database.
+
+    New columns must be nullable or carry a server default so existing rows stay valid.
+
+    Parameters:
+        connection (Connection): A synchronous connection inside a transaction.
+        table (Table): The table whose columns should exist.
+    """
+    existing = {column["name"] for column in inspect(connection).get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing:
+            print(f"🔹 Adding missing column {table.name}.{column.name}...")
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+
+def _ensure_indexes(connection: Connection, table):
+    """
+    Create any index declared on a model's table that is missing from the database.
+
+    create_all() only creates indexes together with new tables, so indexes added to an
+    existing table (e.g. conversations.user_id) have to be created here.
+
+    Parameters:
+        connection (Connection): A synchronous connection inside a transaction.
+        table (Table): The table whose indexes should exist.
+    """
+    existing = {index["name"]: bool(index["unique"]) for index in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            print(f"🔹 Creating missing index {index.name}...")
+            index.create(connection)
+        elif index.unique and not existing[index.name]:
+            _make_index_unique(connection, table, index)
+
+def _make_index_unique(connection: Connection, table, index):
+    """
+    Replace a non-unique index with the unique one declared on the model (e.g. one
+    conversation per user). Left as it is while the table holds duplicates, which have to
+    be resolved by hand first.
+
+    Parameters:
+        connection (Connection): A synchronous connection inside a transaction.
+        table (Table): The table of the index.
+        index (Index): The index as declared on the model.
+    """
+    columns = [column.name for column in index.columns]
+    column_list = ", ".join(columns)
+    duplicates = connection.execute(text(
+        f"SELECT {column_list} FROM {table.name} GROUP BY {column_list} HAVING COUNT(*) > 1 LIMIT 5"
+    )).all()
+    if duplicates:
+        print(f"Cannot make index {index.name} unique: {table.name} has duplicate {column_list} values {duplicates}")
+        return
+    print(f"🔹 Making index {index.name} unique...")
+    connection.execute(text(f"DROP INDEX {index.name}"))
+    index.create(connection)
+
+def _explode_conversation_blobs(connection: Connection):
+    """
+    Move conversations stored in the legacy 'conversations.messages' JSON column into
+    one 'messages' row per message, then drop the legacy column.
+
+    The blobs are first copied to the LEGACY_BLOBS_TABLE table, which is kept so the
+    migration can be checked or undone; drop it by hand once the history is verified.
+    Conversations are read MIGRATION_BLOB_BATCH_SIZE at a time, so memory use does not
+    depend on the size of the database. Everything runs in the startup transaction: if
+    the migration fails, the database is left as it was.
+
+    Parameters:
+        connection (Connection): A synchronous connection inside a transaction.
+    """
+    columns = {column["name"] for column in inspect(connection).get_columns(Conversation.__tablename__)}
+    if "messages" not in columns:
+        return
+
+    print(f"🔹 Migrating conversation history into the messages table (blobs kept in {LEGACY_BLOBS_TABLE})...")
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {LEGACY_BLOBS_TABLE} (conversation_id INTEGER PRIMARY KEY, messages TEXT NOT NULL)"
+    ))
+    connection.execute(text(
+        f"INSERT INTO {LEGACY_BLOBS_TABLE} (conversation_id, messages) "
+        f"SELECT id, CAST(messages AS TEXT) FROM conversations "
+        f"WHERE id NOT IN (SELECT conversation_id FROM {LEGACY_BLOBS_TABLE})"
+    ))
+
+    batch = []
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            text("SELECT id, messages FROM conversations WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": MIGRATION_BLOB_BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for conversation_id, blob in rows:
+            history = json.loads(blob) if isinstance(blob, (str, bytes)) else (blob or [])
+            for seq, message in enumerate(history, start=1):
+                batch.append({
+                    "conversation_id": conversation_id,
+                    "seq": seq,
+                    "role": message.get("role", "user"),
+                    "content": message.get("content", ""),
+                })
+                if len(batch) >= MIGRATION_BATCH_SIZE:
+                    connection.execute(Message.__table__.insert(), batch)
+                    batch = []
+    if batch:
+        connection.execute(Message.__table__.insert(), batch)
+
+    connection.execute(text("ALTER TABLE conversations DROP COLUMN messages"))
+
+def _ensure_search_index(connection: Connection):
+    """
+    Create the full-text index of message content and the trigger that keeps it up to date,
+    and backfill it from existing (and archived) messages when it is first created.
+
+    On SQLite this is an FTS5 table filled by an insert trigger on messages. Messages moved
+    to the archive by compaction stay indexed. On PostgreSQL it is a GIN index on the
+    message tsvector. Other databases have no index and search is unavailable.
+
+    Parameters:
+        connection (Connection): A synchronous connection inside a transaction.
+    """
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_messages_content_tsv "
+            "ON messages USING GIN (to_tsvector('english', content))"
+        ))
+        return
+    if dialect != "sqlite" or SEARCH_TABLE in inspect(connection).get_table_names():
+        return
+
+    try:
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "content, conversation_id UNINDEXED, seq UNINDEXED, role UNINDEXED, tokenize='porter unicode61')"
+        ))
+    except Exception as ftsError:
+        print(f"Full-text search is unavailable (SQLite without FTS5?): {ftsError}")
+        return
+
+    print("🔹 Building the message search index...")
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+        f"INSERT INTO {SEARCH_TABLE} (content, conversation_id, seq, role) "
+        "VALUES (new.content, new.conversation_id, new.seq, new.role); END"
+    ))
+    # Archived messages stay indexed, so rows only go away with their conversation
+    connection.execute(text(
+        f"CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN "
+        f"DELETE FROM {SEARCH_TABLE} WHERE conversation_id = old.id; END"
+    ))
+    connection.execute(text(
+        f"INSERT INTO {SEARCH_TABLE} (content, conversation_id, seq, role) "
+        "SELECT content, conversation_id, seq, role FROM messages"
+    ))
+    archives = connection.execute(
+        MessageArchive.__table__.select().with_only_columns(
+            MessageArchive.conversation_id, MessageArchive.codec, MessageArchive.payload
+        )
+    ).all()
+    for conversation_id, codec, payload in archives:
+        rows = [
+            {"content": message["content"], "conversation_id": conversation_id, "seq": message["seq"], "role": message["role"]}
+            for message in decompress_messages(codec, payload)
+        ]
+        connection.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (content, conversation_id, seq, role) "
+            "VALUES (:content, :conversation_id, :seq, :role)"
+        ), rows)
+
+def run_migrations(connection: Connection):
+    """
+    Bring an existing database schema up to date with the models. Safe to run on every start.
+
+    Parameters:
+        connection (Connection): A synchronous connection inside a transaction
+            (use with AsyncConnection.run_sync).
+    """
+    _explode_conversation_blobs(connection)
+    _add_missing_columns(connection, User.__table__)
+    _add_missing_columns(connection, Conversation.__table__)
+    _ensure_indexes(connection, Conversation.__table__)
+    _ensure_search_index(connection)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import declarative_base
+from datetime import datetime
 from app.db import Base
 
 class User(Base):
@@ -10,12 +11,14 @@ class User(Base):
         id (int): The unique identifier for the user.
         username (str): The unique username for the user.
         password_hash (str): The hashed password for the user.
+        tier (str): The support tier of the user (e.g. "standard" or "escalated").
     """
     __tablename__ = "users"
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(80), unique=True, nullable=False)
     password_hash = Column(String(256), nullable=False)
+    tier = Column(String(32), nullable=False, default="standard", server_default="standard")
 
 
 class Conversation(Base):
@@ -24,12 +27,153 @@ class Conversation(Base):
 
     Attributes:
         id (int): The unique identifier for the conversation.
-        user_id (int): The user ID associated with the conversation.
-        messages (JSON): The conversation history stored as JSON.
+        user_id (int): The user ID associated with the conversation (one conversation per user).
+        summary (str): Rolling summary of the messages that no longer fit in the LLM context.
+        summary_seq (int): The seq of the last message folded into the summary (0 if none).
     """
     __tablename__ = "conversations"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, nullable=False)
-    messages = Column(JSON, nullable=False)
+    user_id = Column(Integer, nullable=False, index=True, unique=True)
+    summary = Column(Text, nullable=True)
+    summary_seq = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class Message(Base):
+    """
+    Represents a single message (one side of a chat turn) in a conversation.
+
+    Messages are append-only and keyed by their position in the conversation,
+    so saving a turn is two inserts regardless of how long the conversation is.
+
+    Attributes:
+        conversation_id (int): The conversation the message belongs to.
+        seq (int): The 1-based position of the message within the conversation.
+        role (str): Who sent the message ("user" or "llm").
+        content (str): The message text.
+        created_at (datetime): When the message was stored.
+    """
+    __tablename__ = "messages"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    role = Column(String(16), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+
+class MessageArchive(Base):
+    """
+    Represents a compressed chunk of old messages moved out of the messages table by compaction.
+
+    Attributes:
+        conversation_id (int): The conversation the messages belong to.
+        first_seq (int): The seq of the first message in the chunk.
+        last_seq (int): The seq of the last message in the chunk.
+        message_count (int): The number of messages in the chunk.
+        codec (str): The compression of the payload ("zstd" or "zlib").
+        payload (bytes): The compressed JSON list of [seq, role, content, created_at] entries.
+        created_at (datetime): When the chunk was archived.
+    """
+    __tablename__ = "message_archives"
+
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    first_seq = Column(Integer, primary_key=True)
+    last_seq = Column(Integer, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    codec = Column(String(16), nullable=False)
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class IdempotencyKey(Base):
+    """
+    Represents the result of a chat request sent with an Idempotency-Key header, so that
+    retries of the request are answered with the original reply instead of a new turn.
 
+    Attributes:
+        user_id (int): The user who sent the request.
+        key (str): The Idempotency-Key chosen by the client.
+        request_hash (str): SHA-256 of the request message, to detect a key reused for another request.
+        status (str): "in_progress" while the original request runs, then "done".
+        reply (str): The LLM reply, once done.
+        created_at (datetime): When the original request started.
+        expires_at (datetime): When the key may be forgotten.
+    """
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(16), nullable=False, default="in_progress")
+    reply = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class ChatJob(Base):
+    """
+    Represents a chat turn submitted for asynchronous processing by a worker.
+
+    Jobs move from "queued" to "running" when a worker claims them, then to "done" (with the
+    reply, written in the same transaction as the turn) or "failed". A running job whose
+    lease expires (e.g. its worker died) can be claimed again.
+
+    Attributes:
+        id (int): The unique identifier for the job.
+        user_id (int): The user who submitted the job.
+        message (str): The user message.
+        priority (int): Jobs with a higher priority are claimed first.
+        status (str): "queued", "running", "done" or "failed".
+        attempts (int): The number of times the job has been claimed.
+        worker_id (str): The worker that claimed the job last.
+        lease_expires_at (datetime): When a running job may be claimed by another worker.
+        available_at (datetime): When a queued job may be claimed (later after a retryable failure).
+        reply (str): The LLM reply, once done.
+        reply_seq (int): The seq of the reply in the conversation, once done.
+        error (str): Why the job failed.
+        created_at (datetime): When the job was submitted.
+        started_at (datetime): When the job was last claimed.
+        finished_at (datetime): When the job finished.
+    """
+    __tablename__ = "chat_jobs"
+    __table_args__ = (Index("ix_chat_jobs_claim", "status", "priority", "id"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    message = Column(Text, nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    worker_id = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    reply = Column(Text, nullable=True)
+    reply_seq = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class LLMUsage(Base):
+    """
+    Represents the LLM tokens used by one chat turn, written together with the turn.
+
+    Attributes:
+        id (int): The unique identifier for the record.
+        user_id (int): The user the turn belongs to.
+        prompt_tokens (int): The tokens of the prompt sent to the LLM (system prompt, summary,
+            history and message).
+        completion_tokens (int): The tokens of the reply.
+        created_at (datetime): When the turn was stored.
+    """
+    __tablename__ = "llm_usage"
+    __table_args__ = (Index("ix_llm_usage_user_created", "user_id", "created_at"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    prompt_tokens = Column(Integer, nullable=False)
+    completion_tokens = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
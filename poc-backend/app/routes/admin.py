@@ -0,0 +1,90 @@
+import zlib
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import get_db
+from app.dependencies import get_current_admin
+from app.services.export_service import ExportFormatError, export_ndjson, import_ndjson
+
+# FastAPI router
+router = APIRouter()
+
+@router.get("/export")
+async def export_conversations(db: AsyncSession = Depends(get_db), current_user=Depends(get_current_admin)):
+    """
+    Export every user and conversation as NDJSON (see export_service.export_ndjson).
+
+    The export is streamed as it is read; send "Accept-Encoding: gzip" to have it gzipped.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated administrator.
+
+    Returns:
+        StreamingResponse: An application/x-ndjson response.
+    """
+    async def ndjson_stream():
+        try:
+            async for chunk in export_ndjson(db):
+                yield chunk
+        finally:
+            await db.close()
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'},
+    )
+
+async def _request_lines(request: Request):
+    """
+    Read the request body line by line, decompressing it if it is gzipped.
+
+    Parameters:
+        request (Request): The request.
+
+    Yields:
+        bytes: The next line.
+    """
+    gzipped = request.headers.get("content-encoding", "").lower() == "gzip"
+    decompressor = zlib.decompressobj(wbits=31) if gzipped else None
+    pending = b""
+    async for chunk in request.stream():
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            yield line
+    if decompressor is not None:
+        pending += decompressor.flush()
+    if pending:
+        yield pending
+
+@router.post("/import")
+async def import_conversations(request: Request, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_admin)):
+    """
+    Import users and conversations from an NDJSON export (see export_service.import_ndjson).
+
+    The body is read as it arrives and may be gzipped ("Content-Encoding: gzip"). Importing
+    the same export again only adds what is missing.
+
+    Parameters:
+        request (Request): The request, whose body is the export.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated administrator.
+
+    Returns:
+        dict: The numbers of users, conversations and messages imported and skipped.
+
+    Raises:
+        HTTPException:
+            400: If the body is not a supported export.
+            500: If there is an error importing it.
+    """
+    try:
+        return await import_ndjson(db, _request_lines(request))
+    except (ExportFormatError, zlib.error) as formatError:
+        raise HTTPException(status_code=400, detail=str(formatError))
+    except Exception as importError:
+        print(f"Error importing conversations: {importError}")
+        raise HTTPException(status_code=500, detail="Internal server error")
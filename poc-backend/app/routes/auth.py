@@ -3,7 +3,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.db import get_db
 from app.models import User
-from app.dependencies import hash_password, verify_password, create_access_token, get_current_user
+from app.dependencies import hash_password_async, verify_password_async, create_access_token, get_current_principal
 from pydantic import BaseModel
 
 # FastAPI router for authentication
@@ -60,6 +60,7 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     Raises:
         HTTPException:
             400: If the username is already taken
+            503: If the server is too busy to hash the password
             500: If there is an error during registration.
     """
     try:
@@ -71,11 +72,13 @@ async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Username already taken")
 
         # Hash password and create a new user
-        new_user = User(username=user_data.emailId, password_hash=hash_password(user_data.password))
+        new_user = User(username=user_data.emailId, password_hash=await hash_password_async(user_data.password))
         db.add(new_user)
         await db.commit()
 
         return {"message": "User registered successfully"}
+    except HTTPException:
+        raise
     except Exception as registrationError:
         print(f"Error registering user: {registrationError}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -95,6 +98,7 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     Raises:
         HTTPException:
             401: If the credentials are invalid
+            503: If the server is too busy to check the password
             500: If there is an error during authentication.
     """
     try:
@@ -102,19 +106,32 @@ async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
         result = await db.execute(select(User).where(User.username == user_data.emailId))
         user = result.scalars().first()
 
-        if not user or not verify_password(user_data.password, user.password_hash):
+        if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
+        password_valid, new_hash = await verify_password_async(user_data.password, user.password_hash)
+        if not password_valid:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+
+        user_id, tier = user.id, user.tier
+
+        # Transparently upgrade hashes made with an outdated bcrypt cost
+        if new_hash:
+            user.password_hash = new_hash
+            await db.commit()
+
         # Generate access token
-        access_token = create_access_token(data={"sub": str(user.id)})
+        access_token = create_access_token(data={"sub": str(user_id), "username": user_data.emailId, "tier": tier})
 
-        return {"access_token": access_token, "user_id": user.id}
+        return {"access_token": access_token, "user_id": user_id}
+    except HTTPException:
+        raise
     except Exception as loginError:
         print(f"Error during login: {loginError}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.get("/me")
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: User = Depends(get_current_principal)):
     """
     Get details of the currently authenticated user.
 
@@ -1,24 +1,267 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import JSONResponse
-from app.services.call_service import generate_jitsi_link
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.config import Config
+from app.dependencies import get_current_admin, get_current_principal, get_current_user
+from app.serialization import sse_event
+from app.services.dispatch_service import ACTIVE_STATUSES, DispatchError, is_technician, technician_dispatcher
 
 # FastAPI router
 router = APIRouter()
 
+# Headers of the event stream responses
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
 @router.get("/call-technician")
-async def call_technician():
+async def call_technician(current_user=Depends(get_current_user)):
     """
-    Returns a Jitsi Meet link for initiating a VoIP call.
+    Request a call with a technician.
+
+    The caller is queued until a technician is free (callers in priority tiers go ahead of
+    recent callers). The Jitsi Meet room is created at once, and the technician the call is
+    assigned to is sent the same room. Calling again while a call is active returns that call.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
 
     Returns:
-        JSONResponse: A JSON response containing the Jitsi Meet link.
+        JSONResponse: The call: its ID, status, Jitsi Meet link ("jitsi_url"), queue position,
+            estimated wait in seconds and technician.
 
     Raises:
-        HTTPException: If there is an error generating the Jitsi Meet link.
+        HTTPException: If there is an error queueing the call.
     """
     try:
-        jitsi_url = generate_jitsi_link()
-        return JSONResponse(content={"jitsi_url": jitsi_url}, status_code=200)
+        call = technician_dispatcher.request_call(current_user)
+        return JSONResponse(content=technician_dispatcher.call_payload(call), status_code=200)
     except Exception as callError:
-        print(f"Error generating Jitsi Meet link: {callError}")
-        raise HTTPException(status_code=500, detail="Internal server error")
\ No newline at end of file
+        print(f"Error requesting a technician call: {callError}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+def _caller_call(call_id: int, current_user):
+    call = technician_dispatcher.get_call(call_id, current_user.id)
+    if call is None:
+        raise HTTPException(status_code=404, detail="Call not found")
+    return call
+
+@router.get("/calls/{call_id}")
+async def get_call(call_id: int, current_user=Depends(get_current_principal)):
+    """
+    Get the status, queue position and estimated wait of a call.
+
+    Parameters:
+        call_id (int): The ID of the call.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The call.
+
+    Raises:
+        HTTPException:
+            404: If the call does not exist, has ended or belongs to another user.
+    """
+    return technician_dispatcher.call_payload(_caller_call(call_id, current_user))
+
+@router.delete("/calls/{call_id}")
+async def cancel_call(call_id: int, current_user=Depends(get_current_user)):
+    """
+    Cancel a call, waiting or in progress.
+
+    Parameters:
+        call_id (int): The ID of the call.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The cancelled call.
+
+    Raises:
+        HTTPException:
+            404: If the call does not exist, has ended or belongs to another user.
+    """
+    call = _caller_call(call_id, current_user)
+    technician_dispatcher.cancel_call(call)
+    return technician_dispatcher.call_payload(call)
+
+@router.get("/calls/{call_id}/events")
+async def call_events(call_id: int, request: Request, current_user=Depends(get_current_principal)):
+    """
+    Follow a call as server-sent events.
+
+    Emits a "status" event whenever the position or estimated wait of the waiting call
+    changes, an "assigned" event with the technician once one takes the call (again if the
+    call is handed to another technician), and a final "completed" or "cancelled" event. A
+    comment is sent every DISPATCH_KEEPALIVE_SECONDS.
+
+    Parameters:
+        call_id (int): The ID of the call.
+        request (Request): The request, used to stop when the client disconnects.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        StreamingResponse: A text/event-stream response.
+
+    Raises:
+        HTTPException:
+            404: If the call does not exist, has ended or belongs to another user.
+    """
+    call = _caller_call(call_id, current_user)
+
+    async def event_stream():
+        last_payload = None
+        while True:
+            payload = technician_dispatcher.call_payload(call)
+            if payload != last_payload:
+                last_payload = payload
+                yield sse_event("status" if call.status == "waiting" else call.status, payload)
+            else:
+                yield ": keepalive\n\n"
+            if call.status not in ACTIVE_STATUSES:
+                return
+            await technician_dispatcher.wait_for_change(Config.DISPATCH_KEEPALIVE_SECONDS)
+            if await request.is_disconnected():
+                return
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+def _dispatch_error(error: DispatchError) -> HTTPException:
+    return HTTPException(status_code=error.status_code, detail=error.detail)
+
+@router.post("/technicians")
+async def register_technician(current_user=Depends(get_current_user)):
+    """
+    Go on duty as a technician, and start taking calls.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The technician's status and current call.
+
+    Raises:
+        HTTPException:
+            403: If the user's tier is not one of DISPATCH_TECHNICIAN_TIERS.
+    """
+    if not is_technician(current_user):
+        raise HTTPException(status_code=403, detail="Only technicians can take calls")
+    technician = technician_dispatcher.register_technician(current_user)
+    return technician_dispatcher.technician_payload(technician)
+
+@router.post("/technicians/heartbeat")
+async def technician_heartbeat(current_user=Depends(get_current_principal)):
+    """
+    Stay on duty. Technicians not heard from for DISPATCH_HEARTBEAT_TIMEOUT_SECONDS are taken
+    off duty; an open event stream counts as a heartbeat.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The technician's status and current call.
+
+    Raises:
+        HTTPException:
+            404: If the technician is not on duty.
+    """
+    try:
+        technician = technician_dispatcher.heartbeat(current_user.id)
+    except DispatchError as dispatchError:
+        raise _dispatch_error(dispatchError)
+    return technician_dispatcher.technician_payload(technician)
+
+@router.delete("/technicians")
+async def unregister_technician(current_user=Depends(get_current_principal)):
+    """
+    Go off duty. A call in progress goes back to the front of the queue.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: An empty object.
+    """
+    technician_dispatcher.unregister_technician(current_user.id)
+    return {}
+
+@router.post("/technicians/calls/{call_id}/complete")
+async def complete_call(call_id: int, current_user=Depends(get_current_principal)):
+    """
+    Finish the current call; the next waiting caller is assigned at once.
+
+    Parameters:
+        call_id (int): The ID of the call.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The technician's status and next call.
+
+    Raises:
+        HTTPException:
+            404: If the technician is not on duty.
+            409: If the call is not assigned to the technician.
+    """
+    try:
+        technician = technician_dispatcher.complete_call(current_user.id, call_id)
+    except DispatchError as dispatchError:
+        raise _dispatch_error(dispatchError)
+    return technician_dispatcher.technician_payload(technician)
+
+@router.get("/technicians/events")
+async def technician_events(request: Request, current_user=Depends(get_current_principal)):
+    """
+    Receive call assignments as server-sent events.
+
+    Emits an "assignment" event with the call and its Jitsi Meet link whenever a call is
+    assigned to the technician (including the current call on connecting), and a "released"
+    event when the current call is cancelled or taken back. A comment is sent every
+    DISPATCH_KEEPALIVE_SECONDS; while the stream is open the technician stays on duty. The
+    stream ends when the technician goes off duty.
+
+    Parameters:
+        request (Request): The request, used to stop when the client disconnects.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        StreamingResponse: A text/event-stream response.
+
+    Raises:
+        HTTPException:
+            404: If the technician is not on duty.
+    """
+    try:
+        technician = technician_dispatcher.heartbeat(current_user.id)
+    except DispatchError as dispatchError:
+        raise _dispatch_error(dispatchError)
+
+    async def event_stream():
+        current_call = None
+        while technician_dispatcher.technicians.get(technician.user_id) is technician:
+            call = technician.call
+            if call is not current_call:
+                if call is not None:
+                    yield sse_event("assignment", technician_dispatcher.technician_payload(technician))
+                elif current_call.status != "completed":
+                    yield sse_event("released", {"call_id": current_call.id, "status": current_call.status})
+                current_call = call
+            else:
+                yield ": keepalive\n\n"
+            await technician_dispatcher.wait_for_change(Config.DISPATCH_KEEPALIVE_SECONDS)
+            if await request.is_disconnected():
+                return
+            try:
+                technician_dispatcher.heartbeat(technician.user_id)
+            except DispatchError:
+                return
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/dispatch/stats")
+async def dispatch_stats(current_user=Depends(get_current_admin)):
+    """
+    Get the technician dispatch counters of this worker.
+
+    Parameters:
+        current_user (User): The currently authenticated administrator.
+
+    Returns:
+        dict: Waiting callers, free and busy technicians, and call counters.
+    """
+    return technician_dispatcher.stats()
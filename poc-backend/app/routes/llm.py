@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.future import select
+from app.config import Config
 from app.db import get_db
-from app.models import Conversation
-from app.dependencies import get_current_user
-from app.services.llm_service import query_llm
+from app.serialization import json_dumps, sse_event
+from app.dependencies import get_current_user, get_current_principal, authenticate_token
+from app.services.admission import AdmissionRejected, is_priority_user, llm_admission
+from app.services.chat_service import run_chat_turn, stream_chat_turn
+from app.services.idempotency import MAX_KEY_LENGTH, IdempotencyConflict, IdempotentRequest, begin_idempotent_request
+from app.services.job_service import enqueue_job, get_job, job_queue_stats
+from app.services.conversation_service import get_conversation_id, get_last_seq, load_history_page
+from app.services.llm_cache import cache_stats
+from app.services.quota import QuotaExceeded, check_quota, get_usage_totals, quota_stats, remaining_quota
+from app.services.resilience import llm_resilience
+from app.services.search_service import SearchUnavailable, search_messages
+from app.services.singleflight import turn_coordinator
+from app.services.turn_writer import turn_writer
 from pydantic import BaseModel
-from typing import List, Dict
+from datetime import datetime, timedelta
+from typing import List
+import asyncio
 
 # FastAPI router
 router = APIRouter()
@@ -30,37 +43,361 @@ class ChatResponse(BaseModel):
     """
     reply: str
 
-@router.get("/history")
-async def getHistory(db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+class HistoryMessage(BaseModel):
     """
-    Retrieve the conversation history for the current user.
+    Pydantic model for one message of the conversation history.
+
+    Attributes:
+        seq (int): The position of the message in the conversation.
+        role (str): Who sent the message ("user" or "llm").
+        content (str): The message text.
+    """
+    seq: int
+    role: str
+    content: str
+
+class HistoryResponse(BaseModel):
+    """
+    Pydantic model for one page of the conversation history.
+
+    Attributes:
+        history (List[HistoryMessage]): The messages of the page in chronological order.
+        next_before (int | None): The cursor for the next older page, None when there is none.
+        last_seq (int): The seq of the newest message in the conversation.
+    """
+    history: List[HistoryMessage]
+    next_before: int | None
+    last_seq: int
+
+class SearchResult(BaseModel):
+    """
+    Pydantic model for one conversation search result.
+
+    Attributes:
+        seq (int): The position of the message in the conversation.
+        role (str): Who sent the message ("user" or "llm").
+        snippet (str): HTML-escaped excerpt with matches wrapped in <mark> tags.
+        score (float): The relevance of the message (higher is better).
+    """
+    seq: int
+    role: str
+    snippet: str
+    score: float
+
+class SearchResponse(BaseModel):
+    """
+    Pydantic model for one page of conversation search results.
+
+    Attributes:
+        results (List[SearchResult]): The results, best first.
+        next_offset (int | None): The offset of the next page, None when there is none.
+    """
+    results: List[SearchResult]
+    next_offset: int | None
+
+class ChatJobResponse(BaseModel):
+    """
+    Pydantic model for an asynchronous chat job.
+
+    Attributes:
+        id (int): The ID of the job.
+        status (str): "queued", "running", "done" or "failed".
+        reply (str | None): The LLM reply, once done.
+        reply_seq (int | None): The seq of the reply in the conversation, once done.
+        error (str | None): Why the job failed.
+        created_at (datetime | None): When the job was submitted.
+        finished_at (datetime | None): When the job finished.
+    """
+    id: int
+    status: str
+    reply: str | None = None
+    reply_seq: int | None = None
+    error: str | None = None
+    created_at: datetime | None = None
+    finished_at: datetime | None = None
+
+@router.get("/history", response_model=HistoryResponse)
+async def getHistory(
+    response: Response,
+    before: int | None = Query(None, ge=1, description="Return messages older than this seq"),
+    since: int | None = Query(None, ge=0, description="Return only messages newer than this seq"),
+    limit: int = Query(Config.HISTORY_PAGE_SIZE, ge=1, le=Config.HISTORY_MAX_PAGE_SIZE),
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_principal),
+):
+    """
+    Retrieve one page of the conversation history for the current user.
+
+    Pages are newest-first: follow "next_before" to load older messages. Alternatively pass
+    "since" (the "last_seq" of a previous response) to fetch only newer messages. Responses
+    carry an ETag; a matching If-None-Match header gets a 304 with no body.
 
     Parameters:
+        response (Response): The response, used to set caching headers.
+        before (int | None): Cursor for older messages (the "next_before" of the previous page).
+        since (int | None): Only return messages newer than this seq.
+        limit (int): The maximum number of messages to return.
+        if_none_match (str | None): The ETag of a previously fetched response.
         db (AsyncSession): The database session.
         current_user (User): The currently authenticated user.
 
     Returns:
-        dict: The conversation history.
+        HistoryResponse: The messages of the page in chronological order, the cursor for the
+            next older page ("next_before", None when there is none) and the seq of the newest
+            message.
 
     Raises:
-        HTTPException: If there is an error retrieving the conversation history.
+        HTTPException:
+            400: If both "before" and "since" are given.
+            500: If there is an error retrieving the conversation history.
     """
+    if before is not None and since is not None:
+        raise HTTPException(status_code=400, detail="Use either 'before' or 'since', not both")
+
     try:
-        result = await db.execute(select(Conversation).where(Conversation.user_id == current_user.id))
-        conversation = result.scalars().first()
-        conversation_history: List[Dict[str, str]] = conversation.messages if conversation else []
-        return {"history": conversation_history}
+        # Make the user's queued turns visible first
+        await turn_writer.drain(current_user.id)
+        conversation_id = await get_conversation_id(db, current_user.id)
+        last_seq = await get_last_seq(db, conversation_id) if conversation_id is not None else 0
+
+        # History is append-only, so the newest seq and the page parameters identify the page
+        etag = f'W/"{conversation_id or 0}-{last_seq}-{before or 0}-{since if since is not None else -1}-{limit}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+        conversation_history, has_more = [], False
+        if conversation_id is not None:
+            conversation_history, has_more = await load_history_page(db, conversation_id, limit, before, since)
+
+        next_before = conversation_history[0]["seq"] if has_more and since is None and conversation_history else None
+        return {"history": conversation_history, "next_before": next_before, "last_seq": last_seq}
     except Exception as historyRetrievalError:
         print(f"Error retrieving conversation history: {historyRetrievalError}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.get("/search", response_model=SearchResponse)
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search for"),
+    limit: int = Query(Config.SEARCH_PAGE_SIZE, ge=1, le=Config.SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_principal),
+):
+    """
+    Search the conversation history of the current user, including archived messages.
+
+    Every word must match (the last one also as a prefix), and results are ranked by
+    relevance. Snippets are HTML-escaped with matches wrapped in <mark> tags. Follow
+    "next_offset" to load the next page.
+
+    Parameters:
+        q (str): The words to search for.
+        limit (int): The maximum number of results to return.
+        offset (int): The number of results to skip.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        SearchResponse: The results (seq, role, snippet and score, best first) and the offset of the
+            next page ("next_offset", None when there is none).
+
+    Raises:
+        HTTPException:
+            503: If the database has no full-text index.
+            500: If there is an error during the search.
+    """
+    try:
+        # Make the user's queued turns searchable first
+        await turn_writer.drain(current_user.id)
+        conversation_id = await get_conversation_id(db, current_user.id)
+        results = []
+        if conversation_id is not None:
+            # Fetch one extra result to know whether there is a next page
+            results = await search_messages(db, conversation_id, q, limit + 1, offset)
+        next_offset = offset + limit if len(results) > limit else None
+        return {"results": results[:limit], "next_offset": next_offset}
+    except SearchUnavailable:
+        raise HTTPException(status_code=503, detail="Search is not available")
+    except Exception as searchError:
+        print(f"Error searching conversation history: {searchError}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user=Depends(get_current_principal)):
+    """
+    Retrieve the LLM response cache counters.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: Whether the cache is enabled, the hit/miss counters and the hit ratio.
+    """
+    return {"enabled": Config.LLM_CACHE_ENABLED, **cache_stats.as_dict()}
+
+@router.get("/turns/stats")
+async def get_turn_stats(current_user=Depends(get_current_principal)):
+    """
+    Retrieve the chat turn contention counters for this worker.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: Coalesced requests, turns that had to queue, and turns currently waiting or in flight.
+    """
+    return turn_coordinator.stats()
+
+@router.get("/writes/stats")
+async def get_write_stats(current_user=Depends(get_current_principal)):
+    """
+    Retrieve the write-behind chat turn writer counters for this worker.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: Queue depth, batches and turns written, synchronous fallbacks and failed transactions.
+    """
+    return turn_writer.stats()
+
+@router.get("/admission/stats")
+async def get_admission_stats(current_user=Depends(get_current_principal)):
+    """
+    Retrieve the LLM admission control counters for this worker.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: Active and queued calls, the configured limits and the admitted/rejected counters.
+    """
+    return llm_admission.stats()
+
+@router.get("/resilience/stats")
+async def get_resilience_stats(current_user=Depends(get_current_principal)):
+    """
+    Retrieve the LLM provider resilience counters for this worker.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: Circuit breaker state, attempts, retries, timeouts, hedged requests and fast failures.
+    """
+    return llm_resilience.stats()
+
+@router.get("/quota/stats")
+async def get_quota_stats(current_user=Depends(get_current_principal)):
+    """
+    Get the per-user quota counters of this worker.
+
+    Parameters:
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: Requests allowed, requests refused per exhausted bucket and LLM tokens charged.
+    """
+    return quota_stats.as_dict()
+
+@router.get("/usage")
+async def get_usage(
+    days: int = Query(30, ge=1, le=366),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_principal),
+):
+    """
+    Get the current user's LLM token usage and what is left of their quota.
+
+    Parameters:
+        days (int): The number of days of usage to add up.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The turns and prompt and completion tokens of the period, and the quota.
+
+    Raises:
+        HTTPException:
+            500: If the usage cannot be read.
+    """
+    try:
+        usage = await get_usage_totals(db, current_user.id, datetime.utcnow() - timedelta(days=days))
+        return {"days": days, **usage, "quota": await remaining_quota(current_user.id)}
+    except Exception as usageError:
+        print(f"Error reading LLM usage: {usageError}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+def _idempotency_error(error: IdempotencyConflict) -> HTTPException:
+    """
+    Build the HTTP error returned when a request cannot be answered for its Idempotency-Key.
+
+    Parameters:
+        error (IdempotencyConflict): The conflict.
+
+    Returns:
+        HTTPException: The error, with Retry-After when the original request is still running.
+    """
+    headers = {"Retry-After": str(error.retry_after)} if error.retry_after else None
+    return HTTPException(status_code=error.status_code, detail=error.detail, headers=headers)
+
+def _quota_error(error: QuotaExceeded) -> HTTPException:
+    """
+    Convert a quota rejection into an HTTP error.
+
+    Parameters:
+        error (QuotaExceeded): The rejection.
+
+    Returns:
+        HTTPException: A 429, with Retry-After.
+    """
+    return HTTPException(status_code=error.status_code, detail=error.detail, headers={"Retry-After": str(error.retry_after)})
+
+async def _check_chat_quota(db: AsyncSession, user_id: int, idempotent: IdempotentRequest | None):
+    """
+    Charge a chat request to the user's quota, unless it replays a stored reply.
+
+    A key claimed by a request the quota refuses is released, so a retry runs the request.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        idempotent (IdempotentRequest | None): The request's Idempotency-Key, if it has one.
+
+    Raises:
+        QuotaExceeded: If the user's quota is used up.
+    """
+    if idempotent is not None and idempotent.replayed:
+        return
+    try:
+        await check_quota(user_id)
+    except QuotaExceeded:
+        if idempotent is not None:
+            await idempotent.release(db)
+        raise
+
 @router.post("/", response_model=ChatResponse)
-async def llm_chat(request: ChatRequest, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_user)):
+async def llm_chat(
+    request: ChatRequest,
+    response: Response,
+    idempotency_key: str | None = Header(None, max_length=MAX_KEY_LENGTH),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
     """
     Handle chat requests to the LLM AI model.
 
+    With an Idempotency-Key header, a retry of a completed request replays its reply (with
+    an "Idempotent-Replayed: true" header) and a retry of a request still in progress waits
+    for it, instead of running the turn again.
+
     Parameters:
         request (ChatRequest): The chat request data.
+        response (Response): The response, used to flag replayed replies.
+        idempotency_key (str | None): A unique key chosen by the client for this request.
         db (AsyncSession): The database session.
         current_user (User): The currently authenticated user.
 
@@ -70,35 +407,346 @@ async def llm_chat(request: ChatRequest, db: AsyncSession = Depends(get_db), cur
     Raises:
         HTTPException:
             400: If the message is empty.
+            409: If the request with this Idempotency-Key is still in progress on another worker.
+            422: If the Idempotency-Key was used for a different request.
+            429: If the user's quota is used up, or too many requests are already waiting for the LLM.
+            502: If the LLM provider kept failing.
+            503: If the LLM did not become available in time or the provider is down.
+            504: If the LLM provider did not answer in time.
             500: If there is an error during the chat request.
     """
     if not request.message:
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
+    user_id = current_user.id
+    priority = is_priority_user(current_user)
     try:
-        # Retrieve conversation history
-        result = await db.execute(select(Conversation).where(Conversation.user_id == current_user.id))
-        conversation = result.scalars().first()
-        conversation_history: List[Dict[str, str]] = conversation.messages if conversation else []
+        if idempotency_key:
+            idempotent = await begin_idempotent_request(db, user_id, idempotency_key, request.message)
+            await _check_chat_quota(db, user_id, idempotent)
+            if idempotent.replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+            reply = await idempotent.run(db, lambda: run_chat_turn(db, user_id, request.message, priority))
+        else:
+            await _check_chat_quota(db, user_id, None)
+            reply = await run_chat_turn(db, user_id, request.message, priority)
+        return {"reply": reply}
+    except IdempotencyConflict as conflictError:
+        raise _idempotency_error(conflictError)
+    except AdmissionRejected as admissionError:
+        raise HTTPException(
+            status_code=admissionError.status_code,
+            detail=admissionError.detail,
+            headers={"Retry-After": str(admissionError.retry_after)} if admissionError.retry_after is not None else None,
+        )
+    except Exception as chatRequestError:
+        print(f"Error during chat request: {chatRequestError}")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-        # Append user message to history
-        conversation_history.append({"role": "user", "content": request.message})
+def _admission_error(error: AdmissionRejected) -> dict:
+    """
+    Build the error payload sent to streaming clients when admission control rejects a turn.
 
-        # Query LLM via Hugging Face
-        reply = await query_llm(conversation_history)
+    Parameters:
+        error (AdmissionRejected): The rejection.
 
-        # Append AI response to history
-        conversation_history.append({"role": "llm", "content": reply})
+    Returns:
+        dict: The detail, status code and suggested retry delay in seconds.
+    """
+    return {"detail": error.detail, "status": error.status_code, "retry_after": error.retry_after}
 
-        # Update or create conversation in the database
-        if conversation:
-            conversation.messages = conversation_history
-        else:
-            new_conversation = Conversation(user_id=current_user.id, messages=conversation_history)
-            db.add(new_conversation)
-        await db.commit()
+@router.post("/stream")
+async def llm_chat_stream(
+    request: ChatRequest,
+    idempotency_key: str | None = Header(None, max_length=MAX_KEY_LENGTH),
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Handle chat requests to the LLM AI model, streaming the reply as server-sent events.
 
-        return {"reply": reply}
-    except Exception as chatRequestError:
-        print(f"Error during chat request: {chatRequestError}")
+    Emits a "token" event for every chunk of the reply, followed by a single "done" event
+    carrying the full reply once it has been saved, or an "error" event if the request fails.
+    An "error" event caused by admission control or an unavailable provider also carries
+    "status" (429, 502, 503 or 504) and "retry_after". The database connection is released
+    while tokens stream. With an Idempotency-Key header, a retry of a completed or in-progress
+    request gets the original reply as a single "token" event (and an "Idempotent-Replayed:
+    true" header) instead of running the turn again.
+
+    Parameters:
+        request (ChatRequest): The chat request data.
+        idempotency_key (str | None): A unique key chosen by the client for this request.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        StreamingResponse: A text/event-stream response.
+
+    Raises:
+        HTTPException:
+            400: If the message is empty.
+            409: If the request with this Idempotency-Key is still in progress on another worker.
+            422: If the Idempotency-Key was used for a different request.
+            429: If the user's quota is used up.
+            500: If the quota or the Idempotency-Key cannot be checked.
+    """
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    user_id = current_user.id
+    priority = is_priority_user(current_user)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    idempotent = None
+    try:
+        if idempotency_key:
+            idempotent = await begin_idempotent_request(db, user_id, idempotency_key, request.message)
+        await _check_chat_quota(db, user_id, idempotent)
+    except QuotaExceeded as quotaError:
+        raise _quota_error(quotaError)
+    except IdempotencyConflict as conflictError:
+        raise _idempotency_error(conflictError)
+    except Exception as checkError:
+        print(f"Error checking chat request: {checkError}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    if idempotent is not None and idempotent.replayed:
+        headers["Idempotent-Replayed"] = "true"
+    # Give the connection back to the pool while the turn waits and streams
+    await db.close()
+
+    def make_stream():
+        return stream_chat_turn(db, user_id, request.message, priority)
+
+    async def event_stream():
+        chunks = []
+        try:
+            tokens = idempotent.stream(db, make_stream) if idempotent is not None else make_stream()
+            async for token in tokens:
+                chunks.append(token)
+                yield sse_event("token", {"content": token})
+            yield sse_event("done", {"reply": "".join(chunks)})
+        except AdmissionRejected as admissionError:
+            yield sse_event("error", _admission_error(admissionError))
+        except Exception as chatStreamError:
+            print(f"Error during chat stream: {chatStreamError}")
+            yield sse_event("error", {"detail": "Internal server error"})
+        finally:
+            await db.close()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=headers)
+
+def _job_payload(job) -> dict:
+    """
+    Build the public representation of a chat job.
+
+    Parameters:
+        job (ChatJob): The job.
+
+    Returns:
+        dict: The job ID, status, reply (once done) or error (once failed), and timestamps.
+    """
+    return {
+        "id": job.id,
+        "status": job.status,
+        "reply": job.reply,
+        "reply_seq": job.reply_seq,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+@router.post("/jobs", status_code=202, response_model=ChatJobResponse)
+async def create_chat_job(
+    request: ChatRequest,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_user),
+):
+    """
+    Submit a chat turn for asynchronous processing by a job worker.
+
+    The reply is written into the conversation even if the client disconnects. Poll the
+    job, or follow its events, to get the reply.
+
+    Parameters:
+        request (ChatRequest): The chat request data.
+        response (Response): The response, used to set the Location header.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        ChatJobResponse: The queued job.
+
+    Raises:
+        HTTPException:
+            400: If the message is empty.
+            429: If the user's quota is used up.
+            500: If the job cannot be queued.
+    """
+    if not request.message:
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+
+    try:
+        await check_quota(current_user.id)
+        job = await enqueue_job(db, current_user.id, request.message, 1 if is_priority_user(current_user) else 0)
+        response.headers["Location"] = f"/api/llm/jobs/{job.id}"
+        return _job_payload(job)
+    except QuotaExceeded as quotaError:
+        raise _quota_error(quotaError)
+    except Exception as jobSubmitError:
+        print(f"Error queueing chat job: {jobSubmitError}")
         raise HTTPException(status_code=500, detail="Internal server error")
+
+@router.get("/jobs/stats")
+async def get_job_stats(db: AsyncSession = Depends(get_db), current_user=Depends(get_current_principal)):
+    """
+    Retrieve the chat job queue counters (shared by every worker).
+
+    Parameters:
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        dict: The number of jobs per status and the age of the oldest queued job.
+    """
+    return await job_queue_stats(db)
+
+@router.get("/jobs/{job_id}", response_model=ChatJobResponse)
+async def get_chat_job(job_id: int, db: AsyncSession = Depends(get_db), current_user=Depends(get_current_principal)):
+    """
+    Retrieve a chat job of the current user.
+
+    Parameters:
+        job_id (int): The ID of the job.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        ChatJobResponse: The job, with its reply once done.
+
+    Raises:
+        HTTPException:
+            404: If the job does not exist.
+    """
+    job = await get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_payload(job)
+
+@router.get("/jobs/{job_id}/events")
+async def chat_job_events(
+    job_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user=Depends(get_current_principal),
+):
+    """
+    Follow a chat job as server-sent events.
+
+    Emits a "status" event whenever the job status changes, then a final "done" event with
+    the job (including the reply) or an "error" event if the job failed. Workers may run in
+    other processes, so the job is polled every JOB_POLL_INTERVAL_MS; the database connection
+    is released between polls.
+
+    Parameters:
+        job_id (int): The ID of the job.
+        request (Request): The request, used to stop when the client disconnects.
+        db (AsyncSession): The database session.
+        current_user (User): The currently authenticated user.
+
+    Returns:
+        StreamingResponse: A text/event-stream response.
+
+    Raises:
+        HTTPException:
+            404: If the job does not exist.
+    """
+    user_id = current_user.id
+    job = await get_job(db, job_id, user_id)
+    await db.close()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        current = job
+        last_status = None
+        try:
+            while current is not None:
+                if current.status != last_status:
+                    last_status = current.status
+                    if current.status == "done":
+                        yield sse_event("done", _job_payload(current))
+                        return
+                    if current.status == "failed":
+                        yield sse_event("error", _job_payload(current))
+                        return
+                    yield sse_event("status", {"id": current.id, "status": current.status})
+                await asyncio.sleep(Config.JOB_POLL_INTERVAL_MS / 1000)
+                if await request.is_disconnected():
+                    return
+                current = await get_job(db, job_id, user_id)
+                await db.close()
+        except Exception as jobEventsError:
+            print(f"Error following chat job: {jobEventsError}")
+            yield sse_event("error", {"detail": "Internal server error"})
+        finally:
+            await db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.websocket("/ws")
+async def llm_chat_ws(websocket: WebSocket, token: str = Query(...), db: AsyncSession = Depends(get_db)):
+    """
+    Handle chat requests to the LLM AI model over a WebSocket.
+
+    The client authenticates with its access token as the "token" query parameter and sends
+    {"message": "..."} frames. For each message the server sends {"type": "token", "content": ...}
+    frames as the reply streams, then {"type": "done", "reply": ...} once the turn is saved,
+    or {"type": "error", "detail": ...} if the turn fails (with "status" and "retry_after"
+    added when the user's quota or admission control rejects it or the provider is unavailable).
+
+    Parameters:
+        websocket (WebSocket): The WebSocket connection.
+        token (str): The JWT access token.
+        db (AsyncSession): The database session.
+    """
+    try:
+        user = await authenticate_token(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    finally:
+        await db.close()
+
+    user_id = user.id
+    priority = is_priority_user(user)
+    await websocket.accept()
+    try:
+        while True:
+            data = await websocket.receive_json()
+            message = data.get("message") if isinstance(data, dict) else None
+            if not message:
+                await websocket.send_text(json_dumps({"type": "error", "detail": "Message cannot be empty"}))
+                continue
+
+            try:
+                await check_quota(user_id)
+                chunks = []
+                async for chunk in stream_chat_turn(db, user_id, message, priority):
+                    chunks.append(chunk)
+                    await websocket.send_text(json_dumps({"type": "token", "content": chunk}))
+                await websocket.send_text(json_dumps({"type": "done", "reply": "".join(chunks)}))
+            except WebSocketDisconnect:
+                raise
+            except AdmissionRejected as admissionError:
+                await websocket.send_text(json_dumps({"type": "error", **_admission_error(admissionError)}))
+            except Exception as chatStreamError:
+                print(f"Error during chat stream: {chatStreamError}")
+                await websocket.send_text(json_dumps({"type": "error", "detail": "Internal server error"}))
+            finally:
+                await db.close()
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,49 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_dumps(value) -> str:
+    """
+    Serialize a value to compact JSON, with orjson when it is installed.
+
+    Both paths produce the same text: no whitespace and non-ASCII characters kept as-is.
+
+    Parameters:
+        value: The value (dicts, lists, strings, numbers, booleans and None).
+
+    Returns:
+        str: The JSON text.
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def json_loads(data):
+    """
+    Parse JSON, with orjson when it is installed.
+
+    Parameters:
+        data (str | bytes): The JSON text.
+
+    Returns:
+        The parsed value.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def sse_event(event: str, data: dict) -> str:
+    """
+    Format a server-sent event.
+
+    Parameters:
+        event (str): The event name.
+        data (dict): The event payload, sent as JSON.
+
+    Returns:
+        str: The encoded event.
+    """
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
@@ -0,0 +1,171 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from app.config import Config
+from app.metrics import registry
+
+# Whether LLM calls made by the current request go through the priority lane
+llm_priority: ContextVar[bool] = ContextVar("llm_priority", default=False)
+
+def is_priority_user(user) -> bool:
+    """
+    Check whether a user's chat turns use the priority lane.
+
+    Parameters:
+        user (User): The user.
+
+    Returns:
+        bool: True if the user's tier is one of LLM_PRIORITY_TIERS.
+    """
+    return getattr(user, "tier", None) in Config.LLM_PRIORITY_TIERS
+
+class AdmissionRejected(Exception):
+    """
+    Raised when an LLM call is turned away by the admission controller.
+
+    Attributes:
+        status_code (int): 429 if the wait queue was full, 503 if the wait deadline passed.
+        retry_after (int | None): Suggested number of seconds before retrying, or None if
+            retrying cannot help.
+        detail (str): Human-readable reason.
+    """
+
+    def __init__(self, status_code: int, retry_after: int | None, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+class AdmissionController:
+    """
+    Limits the number of concurrent LLM provider calls on this worker.
+
+    Calls beyond max_concurrent wait in a bounded FIFO queue, with a separate priority lane
+    that is always served first. A call that finds the queue full is rejected at once (429);
+    a call that is not admitted within queue_timeout seconds is rejected (503). Both carry a
+    Retry-After estimate based on recent call durations.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._normal = deque()
+        self._priority = deque()
+        self._average_duration = 1.0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._normal) + len(self._priority)
+
+    def retry_after(self) -> int:
+        """
+        Estimate how long until a new call would likely be admitted.
+
+        Returns:
+            int: Seconds, at least 1.
+        """
+        return max(1, math.ceil(self._average_duration * (self.queued + 1) / self.max_concurrent))
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, priority lane first
+        for lane in (self._priority, self._normal):
+            while lane:
+                waiter = lane.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self.active -= 1
+
+    async def _acquire(self, priority: bool):
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            return
+        if self.queued >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, self.retry_after(), "Too many requests are waiting for the LLM")
+
+        waiter = asyncio.get_running_loop().create_future()
+        lane = self._priority if priority else self._normal
+        lane.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except BaseException:
+            if waiter.done():
+                self._release()
+            else:
+                waiter.cancel()
+                lane.remove(waiter)
+            raise
+
+        if not waiter.done():
+            waiter.cancel()
+            lane.remove(waiter)
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, self.retry_after(), "The LLM is busy, please try again")
+
+    @asynccontextmanager
+    async def admit(self, priority: bool | None = None):
+        """
+        Hold an LLM call slot for the duration of the block.
+
+        Parameters:
+            priority (bool | None): Use the priority lane. Defaults to the llm_priority context variable.
+
+        Raises:
+            AdmissionRejected: If the call cannot be admitted.
+        """
+        await self._acquire(llm_priority.get() if priority is None else priority)
+        self.admitted += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._average_duration = 0.8 * self._average_duration + 0.2 * (time.monotonic() - started)
+            self._release()
+
+    def stats(self) -> dict:
+        """
+        Return the admission counters.
+
+        Returns:
+            dict: The counters and current occupancy.
+        """
+        return {
+            "active": self.active,
+            "queued": len(self._normal),
+            "priority_queued": len(self._priority),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+llm_admission = AdmissionController(
+    Config.LLM_MAX_CONCURRENT_CALLS, Config.LLM_MAX_QUEUED_CALLS, Config.LLM_QUEUE_TIMEOUT_SECONDS
+)
+
+registry.gauge(
+    "llm_admission_calls", "LLM calls holding or waiting for an admission slot.", ("state",),
+    lambda: {
+        ("active",): llm_admission.active,
+        ("queued",): len(llm_admission._normal),
+        ("priority_queued",): len(llm_admission._priority),
+    },
+)
+registry.counter(
+    "llm_admission_decisions_total", "LLM calls admitted or rejected by admission control.", ("outcome",),
+    lambda: {
+        ("admitted",): llm_admission.admitted,
+        ("rejected_queue_full",): llm_admission.rejected_queue_full,
+        ("rejected_timeout",): llm_admission.rejected_timeout,
+    },
+)
@@ -0,0 +1,243 @@
+import asyncio
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.models import Conversation, Message, MessageArchive
+from app.serialization import json_dumps, json_loads
+from typing import List, Dict
+
+# Conversations examined per compaction query
+COMPACTION_SCAN_BATCH = 500
+
+def _zstd():
+    """
+    Import the optional 'zstandard' package.
+
+    Returns:
+        module | None: The zstandard module, or None if it is not installed.
+    """
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+def compress_messages(messages: List[Dict], codec: str | None = None) -> tuple:
+    """
+    Serialize and compress a chunk of messages.
+
+    Parameters:
+        messages (List[Dict]): The messages, with "seq", "role", "content" and "created_at".
+        codec (str | None): "zstd" or "zlib". Defaults to COMPACTION_CODEC; zstd falls back
+            to zlib when the 'zstandard' package is not installed.
+
+    Returns:
+        tuple: The codec actually used and the compressed payload.
+    """
+    payload = json_dumps([
+        [message["seq"], message["role"], message["content"],
+         message["created_at"].isoformat() if message.get("created_at") else None]
+        for message in messages
+    ]).encode("utf-8")
+
+    codec = codec or Config.COMPACTION_CODEC
+    zstandard = _zstd() if codec == "zstd" else None
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=9).compress(payload)
+    return "zlib", zlib.compress(payload, 9)
+
+def decompress_messages(codec: str, payload: bytes, include_created_at: bool = False) -> List[Dict]:
+    """
+    Decompress a chunk of archived messages.
+
+    Parameters:
+        codec (str): The codec the chunk was written with.
+        payload (bytes): The compressed payload.
+        include_created_at (bool): Also return "created_at" (an ISO 8601 string, or None).
+
+    Returns:
+        List[Dict]: The messages, with "seq", "role" and "content", in seq order.
+
+    Raises:
+        RuntimeError: If the chunk uses zstd and the 'zstandard' package is not installed.
+    """
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("Archived messages are zstd-compressed but the 'zstandard' package is not installed")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raw = zlib.decompress(payload)
+    if include_created_at:
+        return [
+            {"seq": seq, "role": role, "content": content, "created_at": created_at}
+            for seq, role, content, created_at in json_loads(raw)
+        ]
+    return [{"seq": seq, "role": role, "content": content} for seq, role, content, _ in json_loads(raw)]
+
+async def load_archived_messages(
+    db: AsyncSession, conversation_id: int, limit: int, before: int | None = None, since: int | None = None
+) -> List[Dict]:
+    """
+    Load archived messages of a conversation, decompressing only the chunks that are needed.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        conversation_id (int): The ID of the conversation.
+        limit (int): The maximum number of messages to return.
+        before (int | None): Newest-first: the newest "limit" archived messages with a lower seq.
+        since (int | None): Oldest-first: the oldest "limit" archived messages with a higher seq.
+
+    Returns:
+        List[Dict]: The messages (with "seq", "role" and "content"), newest-first without
+            "since" and oldest-first with it.
+    """
+    query = select(MessageArchive.codec, MessageArchive.payload).where(MessageArchive.conversation_id == conversation_id)
+    if since is not None:
+        query = query.where(MessageArchive.last_seq > since).order_by(MessageArchive.first_seq)
+    else:
+        if before is not None:
+            query = query.where(MessageArchive.first_seq < before)
+        query = query.order_by(MessageArchive.first_seq.desc())
+
+    messages = []
+    result = await db.stream(query)
+    try:
+        async for codec, payload in result:
+            chunk = decompress_messages(codec, payload)
+            if since is not None:
+                messages.extend(message for message in chunk if message["seq"] > since)
+            else:
+                messages.extend(message for message in reversed(chunk) if before is None or message["seq"] < before)
+            if len(messages) >= limit:
+                break
+    finally:
+        await result.close()
+    return messages[:limit]
+
+async def compact_conversation(
+    db: AsyncSession, conversation_id: int, keep_messages: int, older_than: datetime, chunk_messages: int
+) -> int:
+    """
+    Move the old messages of one conversation into compressed archive chunks, then commit.
+
+    Only messages already folded into the conversation summary are archived, so the LLM
+    context (summary plus the messages after it) never needs the archive. The newest
+    keep_messages messages always stay in the messages table.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        conversation_id (int): The ID of the conversation.
+        keep_messages (int): The number of newest messages to keep (at least 1).
+        older_than (datetime): Only archive messages stored before this time.
+        chunk_messages (int): The number of messages per archive chunk.
+
+    Returns:
+        int: The number of messages archived.
+    """
+    result = await db.execute(
+        select(Conversation.summary_seq, func.max(Message.seq))
+        .join(Message, Message.conversation_id == Conversation.id)
+        .where(Conversation.id == conversation_id)
+        .group_by(Conversation.id)
+    )
+    row = result.first()
+    if row is None:
+        return 0
+    summary_seq, last_seq = row
+    cutoff_seq = min(summary_seq, last_seq - max(1, keep_messages))
+
+    result = await db.execute(
+        select(Message.seq, Message.role, Message.content, Message.created_at)
+        .where(Message.conversation_id == conversation_id, Message.seq <= cutoff_seq)
+        .order_by(Message.seq)
+    )
+    messages = [row._asdict() for row in result.all()]
+    # Archive a contiguous run of old messages, so chunks never interleave with hot rows
+    archivable = []
+    for message in messages:
+        if message["created_at"] is not None and message["created_at"] >= older_than:
+            break
+        archivable.append(message)
+    if not archivable:
+        return 0
+
+    chunks = []
+    for start in range(0, len(archivable), max(1, chunk_messages)):
+        chunk = archivable[start:start + max(1, chunk_messages)]
+        codec, payload = compress_messages(chunk)
+        chunks.append({
+            "conversation_id": conversation_id,
+            "first_seq": chunk[0]["seq"],
+            "last_seq": chunk[-1]["seq"],
+            "message_count": len(chunk),
+            "codec": codec,
+            "payload": payload,
+        })
+    await db.execute(insert(MessageArchive), chunks)
+    await db.execute(
+        delete(Message).where(Message.conversation_id == conversation_id, Message.seq <= archivable[-1]["seq"])
+    )
+    await db.commit()
+    return len(archivable)
+
+async def compact_all(session_factory, config=Config) -> dict:
+    """
+    Run one compaction pass over every conversation, one transaction per conversation.
+
+    Parameters:
+        session_factory (sessionmaker): Factory of the sessions used for compaction.
+        config (Config): The application configuration (COMPACTION_* settings).
+
+    Returns:
+        dict: The number of conversations compacted and messages archived.
+    """
+    older_than = datetime.utcnow() - timedelta(hours=config.COMPACTION_MIN_AGE_HOURS)
+    keep_messages = max(1, config.COMPACTION_KEEP_MESSAGES)
+    conversations_compacted = 0
+    messages_archived = 0
+    last_id = 0
+    while True:
+        async with session_factory() as db:
+            # Only conversations with more messages than the hot tail can have anything to archive
+            result = await db.execute(
+                select(Message.conversation_id)
+                .where(Message.conversation_id > last_id)
+                .group_by(Message.conversation_id)
+                .having(func.count() > keep_messages)
+                .order_by(Message.conversation_id)
+                .limit(COMPACTION_SCAN_BATCH)
+            )
+            conversation_ids = result.scalars().all()
+            if not conversation_ids:
+                break
+            for conversation_id in conversation_ids:
+                archived = await compact_conversation(
+                    db, conversation_id, keep_messages, older_than, config.COMPACTION_CHUNK_MESSAGES
+                )
+                if archived:
+                    conversations_compacted += 1
+                    messages_archived += archived
+            last_id = conversation_ids[-1]
+    return {"conversations": conversations_compacted, "messages": messages_archived}
+
+async def run_compaction_periodically(session_factory, interval: float, config=Config):
+    """
+    Run compaction every interval seconds until cancelled. Started from the application lifespan.
+
+    Parameters:
+        session_factory (sessionmaker): Factory of the sessions used for compaction.
+        interval (float): Seconds between passes.
+        config (Config): The application configuration.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = await compact_all(session_factory, config)
+            if result["messages"]:
+                print(f"Compaction archived {result['messages']} messages from {result['conversations']} conversations")
+        except Exception as compactionError:
+            print(f"Error during conversation compaction: {compactionError}")
@@ -0,0 +1,131 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.services import llm_service
+from app.services.admission import llm_priority
+from app.services.context_service import build_context, turn_usage
+from app.services.conversation_service import save_turn
+from app.services.llm_cache import cached_query_llm, get_cached_reply, store_reply
+from app.services.quota import charge_tokens
+from app.services.singleflight import turn_coordinator
+from app.services.turn_writer import turn_writer
+
+async def persist_turn(db: AsyncSession, user_id: int, message: str, reply: str, usage: tuple | None = None):
+    """
+    Persist a completed chat turn: queue it for the write-behind writer when it is running
+    and has room, otherwise write it synchronously.
+
+    Parameters:
+        db (AsyncSession): The database session (used for synchronous writes).
+        user_id (int): The ID of the user.
+        message (str): The user message.
+        reply (str): The LLM reply.
+        usage (tuple | None): The prompt and completion tokens of the turn.
+    """
+    if turn_writer.submit(user_id, message, reply, usage):
+        return
+    # Keep the user's turns in order behind any that are still queued
+    await turn_writer.drain(user_id)
+    await save_turn(db, user_id, message, reply, usage)
+
+async def finish_turn(db: AsyncSession, user_id: int, message: str, conversation_history: list, reply: str):
+    """
+    Account for a completed chat turn's LLM tokens in the user's quota, and persist the turn
+    with its usage.
+
+    Parameters:
+        db (AsyncSession): The database session (used for synchronous writes).
+        user_id (int): The ID of the user.
+        message (str): The user message.
+        conversation_history (list): The prompt messages.
+        reply (str): The LLM reply.
+    """
+    usage = turn_usage(conversation_history, reply)
+    await charge_tokens(user_id, *usage)
+    await persist_turn(db, user_id, message, reply, usage)
+
+async def run_chat_turn(db: AsyncSession, user_id: int, message: str, priority: bool = False) -> str:
+    """
+    Run one chat turn: build the prompt, get the reply and save the turn.
+
+    Turns of the same user run in order, and an identical turn already in flight is shared
+    instead of being sent to the LLM again.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        message (str): The user message.
+        priority (bool): Send the turn's LLM calls through the admission priority lane.
+
+    Returns:
+        str: The LLM reply.
+
+    Raises:
+        AdmissionRejected: If the LLM call is turned away by admission control.
+    """
+    async def execute_turn():
+        # Make the user's queued turns visible before reading the history
+        await turn_writer.drain(user_id)
+
+        # Assemble the prompt from the recent conversation history within the token budget
+        conversation_history = await build_context(db, user_id, message)
+
+        # Answer from the response cache, or query LLM via Hugging Face
+        reply = await cached_query_llm(conversation_history)
+
+        # Persist the completed turn and its token usage
+        await finish_turn(db, user_id, message, conversation_history, reply)
+        return reply
+
+    priority_token = llm_priority.set(priority)
+    try:
+        return await turn_coordinator.run(user_id, message, execute_turn)
+    finally:
+        llm_priority.reset(priority_token)
+
+async def stream_chat_turn(db: AsyncSession, user_id: int, message: str, priority: bool = False):
+    """
+    Run one chat turn, yielding the reply in chunks as the LLM produces them.
+
+    The database connection is released while the reply streams, and the turn is saved once
+    the stream completes. Ordering and coalescing work as in run_chat_turn; a coalesced or
+    cached reply is yielded as a single chunk.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        message (str): The user message.
+        priority (bool): Send the turn's LLM calls through the admission priority lane.
+
+    Yields:
+        str: The next chunk of the reply.
+
+    Raises:
+        AdmissionRejected: If the LLM call is turned away by admission control.
+    """
+    priority_token = llm_priority.set(priority)
+    try:
+        flight = turn_coordinator.find(user_id, message)
+        if flight is not None:
+            yield await turn_coordinator.wait_for(flight)
+            return
+
+        async with turn_coordinator.turn(user_id, message) as turn:
+            await turn_writer.drain(user_id)
+            conversation_history = await build_context(db, user_id, message)
+            # Give the connection back to the pool before the (long) stream starts
+            await db.close()
+
+            reply = await get_cached_reply(conversation_history)
+            if reply is not None:
+                yield reply
+            else:
+                chunks = []
+                async for chunk in llm_service.stream_llm(conversation_history):
+                    chunks.append(chunk)
+                    yield chunk
+                reply = "".join(chunks)
+                await store_reply(conversation_history, reply)
+
+            await finish_turn(db, user_id, message, conversation_history, reply)
+            turn.set_result(reply)
+    finally:
+        llm_priority.reset(priority_token)
@@ -0,0 +1,240 @@
+import os
+from functools import lru_cache
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.models import Conversation, Message
+from app.services import llm_service
+from typing import List, Dict, Tuple
+
+# Approximate per-message overhead of the chat template (role markers, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+# When the history overflows, fold enough old messages that the kept tail uses at most this
+# share of the available budget, so the summary is rewritten every few turns rather than every turn
+FOLD_TARGET_RATIO = 0.5
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a customer service conversation. "
+    "Merge the new messages into the current summary. Keep facts, decisions, error messages "
+    "and unresolved questions; drop pleasantries. Reply with the updated summary only, "
+    "in at most {max_tokens} tokens."
+)
+
+@lru_cache(maxsize=1)
+def get_tokenizer():
+    """
+    Load the tokenizer configured with LLM_TOKENIZER, if any, to count prompt tokens. It is
+    loaded once per process; remote tokenizers are downloaded into the local Hugging Face
+    cache on first use.
+
+    Returns:
+        tokenizers.Tokenizer | None: The tokenizer, or None to fall back to an estimate (when
+            LLM_TOKENIZER is unset or the tokenizer cannot be loaded).
+    """
+    if not Config.LLM_TOKENIZER:
+        return None
+    try:
+        from tokenizers import Tokenizer
+
+        if os.path.isfile(Config.LLM_TOKENIZER):
+            return Tokenizer.from_file(Config.LLM_TOKENIZER)
+        return Tokenizer.from_pretrained(Config.LLM_TOKENIZER, token=Config.HUGGINGFACE_API_KEY)
+    except Exception as tokenizerError:
+        print(f"Tokenizer unavailable, estimating token counts instead: {tokenizerError}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens in a piece of text.
+
+    Parameters:
+        text (str): The text to count.
+
+    Returns:
+        int: The number of tokens (estimated at ~4 characters per token without a tokenizer).
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+def message_tokens(message: Dict[str, str]) -> int:
+    """
+    Count the tokens a chat message occupies in the prompt.
+
+    Parameters:
+        message (Dict[str, str]): The message with "role" and "content" keys.
+
+    Returns:
+        int: The number of tokens.
+    """
+    return count_tokens(message["content"]) + MESSAGE_TOKEN_OVERHEAD
+
+def turn_usage(conversation_history: List[Dict[str, str]], reply: str) -> Tuple[int, int]:
+    """
+    Count the LLM tokens of a chat turn.
+
+    Parameters:
+        conversation_history (List[Dict[str, str]]): The prompt messages.
+        reply (str): The LLM reply.
+
+    Returns:
+        Tuple[int, int]: The prompt tokens and the completion tokens.
+    """
+    return sum(message_tokens(message) for message in conversation_history), count_tokens(reply)
+
+def to_provider_message(role: str, content: str) -> Dict[str, str]:
+    """
+    Convert a stored message into the chat format expected by the provider.
+
+    Parameters:
+        role (str): The stored role ("user" or "llm").
+        content (str): The message text.
+
+    Returns:
+        Dict[str, str]: The provider message.
+    """
+    return {"role": "assistant" if role == "llm" else role, "content": content}
+
+def split_history(history: List[Dict[str, str]], available_tokens: int) -> Tuple[int, bool]:
+    """
+    Work out how much of a history fits into a token budget, keeping the most recent messages.
+
+    Parameters:
+        history (List[Dict[str, str]]): The messages, oldest first.
+        available_tokens (int): The tokens available for them.
+
+    Returns:
+        Tuple[int, bool]: The index of the first message to fold into the summary (messages
+            before it are folded) and whether the history overflowed the budget.
+    """
+    used = 0
+    for index in range(len(history) - 1, -1, -1):
+        used += message_tokens(history[index])
+        if used > available_tokens:
+            break
+    else:
+        return 0, False
+
+    # Fold down to the target share so the summary is not rewritten on every turn
+    target = int(available_tokens * FOLD_TARGET_RATIO)
+    used = 0
+    cut = len(history)
+    while cut > 0 and used + message_tokens(history[cut - 1]) <= target:
+        cut -= 1
+        used += message_tokens(history[cut])
+
+    # Never start the kept tail with a reply whose question has been folded away
+    while cut < len(history) and history[cut]["role"] != "user":
+        cut += 1
+    return cut, True
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Trim text so it fits in a number of tokens.
+
+    Parameters:
+        text (str): The text to trim.
+        max_tokens (int): The maximum number of tokens.
+
+    Returns:
+        str: The text, cut at a word boundary if it was too long.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    while words and count_tokens(" ".join(words)) > max_tokens:
+        words = words[: int(len(words) * 0.9)]
+    return " ".join(words)
+
+async def summarize(summary: str | None, messages: List[Dict[str, str]]) -> str:
+    """
+    Fold messages into a rolling summary using the LLM.
+
+    The messages are folded in chunks that each fit in the context budget, so even a very
+    long backlog (e.g. a migrated history) never produces an oversized prompt.
+
+    Parameters:
+        summary (str | None): The current summary, if any.
+        messages (List[Dict[str, str]]): The messages to fold in, oldest first.
+
+    Returns:
+        str: The updated summary.
+    """
+    instructions = {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(max_tokens=Config.LLM_SUMMARY_TOKEN_BUDGET)}
+    chunk_budget = Config.LLM_CONTEXT_TOKEN_BUDGET - Config.LLM_SUMMARY_TOKEN_BUDGET - message_tokens(instructions)
+
+    start = 0
+    while start < len(messages):
+        end, used = start, 0
+        while end < len(messages) and (end == start or used + message_tokens(messages[end]) <= chunk_budget):
+            used += message_tokens(messages[end])
+            end += 1
+
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in messages[start:end])
+        prompt = f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{_truncate_to_tokens(transcript, chunk_budget)}"
+        summary = await llm_service.query_llm([instructions, {"role": "user", "content": prompt}])
+        summary = _truncate_to_tokens(summary.strip(), Config.LLM_SUMMARY_TOKEN_BUDGET)
+        start = end
+    return summary
+
+async def build_context(db: AsyncSession, user_id: int, message: str) -> List[Dict[str, str]]:
+    """
+    Assemble the prompt for a new chat turn within the configured token budget.
+
+    The prompt is the pinned system prompt, the rolling summary of older turns, the most
+    recent turns that fit, and the new user message. Only messages not yet folded into the
+    summary are read. When they no longer fit, the oldest are folded into the summary, which
+    is stored so it is extended incrementally rather than recomputed.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        message (str): The new user message.
+
+    Returns:
+        List[Dict[str, str]]: The messages to send to the LLM.
+    """
+    system_message = {"role": "system", "content": Config.LLM_SYSTEM_PROMPT}
+    user_message = {"role": "user", "content": message}
+
+    result = await db.execute(
+        select(Conversation.id, Conversation.summary, Conversation.summary_seq).where(Conversation.user_id == user_id)
+    )
+    conversation = result.first()
+    if conversation is None:
+        return [system_message, user_message]
+
+    result = await db.execute(
+        select(Message.seq, Message.role, Message.content)
+        .where(Message.conversation_id == conversation.id, Message.seq > conversation.summary_seq)
+        .order_by(Message.seq)
+    )
+    rows = result.all()
+    history = [to_provider_message(row.role, row.content) for row in rows]
+    summary = conversation.summary
+
+    fixed_tokens = message_tokens(system_message) + message_tokens(user_message)
+    summary_tokens = Config.LLM_SUMMARY_TOKEN_BUDGET + MESSAGE_TOKEN_OVERHEAD
+    cut, overflowed = split_history(history, Config.LLM_CONTEXT_TOKEN_BUDGET - fixed_tokens - summary_tokens)
+    if overflowed:
+        try:
+            summary = await summarize(summary, history[:cut])
+            await db.execute(
+                update(Conversation)
+                .where(Conversation.id == conversation.id)
+                .values(summary=summary, summary_seq=rows[cut - 1].seq if cut else conversation.summary_seq)
+            )
+            await db.commit()
+        except Exception as summaryError:
+            await db.rollback()
+            # Keep the prompt bounded anyway; folding is retried on the next turn
+            print(f"Error updating conversation summary: {summaryError}")
+        history = history[cut:]
+
+    context = [system_message]
+    if summary:
+        context.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    return context + history + [user_message]
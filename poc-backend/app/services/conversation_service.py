@@ -0,0 +1,184 @@
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.models import Conversation, LLMUsage, Message
+from app.services.archive_service import load_archived_messages
+from typing import List, Dict, Tuple
+
+async def get_conversation_id(db: AsyncSession, user_id: int) -> int | None:
+    """
+    Look up the ID of a user's conversation.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+
+    Returns:
+        int | None: The conversation ID, or None if the user has not chatted yet.
+    """
+    result = await db.execute(select(Conversation.id).where(Conversation.user_id == user_id))
+    return result.scalars().first()
+
+async def lock_conversations(db: AsyncSession, user_ids: List[int]) -> Dict[int, int]:
+    """
+    Get the conversations of some users, creating the missing ones, and lock them until the
+    end of the transaction.
+
+    Messages get their seq from the newest message of the conversation, so every writer
+    (web workers, the write-behind writer and job workers) locks the conversation row first;
+    two writers of the same conversation then take turns instead of picking the same seq.
+    Conversations are created with an insert that ignores users who already have one, so
+    concurrent first turns share a single conversation. On SQLite, where FOR UPDATE is not
+    supported, the database lock serializes writers instead.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_ids (List[int]): The IDs of the users.
+
+    Returns:
+        Dict[int, int]: The conversation ID of each user.
+    """
+    user_ids = sorted(set(user_ids))
+    query = (
+        select(Conversation.user_id, Conversation.id)
+        .where(Conversation.user_id.in_(user_ids))
+        .order_by(Conversation.user_id)
+        .with_for_update()
+    )
+    conversations = dict((await db.execute(query)).all())
+    missing = [user_id for user_id in user_ids if user_id not in conversations]
+    if not missing:
+        return conversations
+
+    rows = [{"user_id": user_id} for user_id in missing]
+    dialect = db.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        await db.execute(dialect_insert(Conversation).on_conflict_do_nothing(index_elements=["user_id"]), rows)
+    else:
+        for row in rows:
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(Conversation), [row])
+            except IntegrityError:
+                # Created by a concurrent writer
+                pass
+    return dict((await db.execute(query)).all())
+
+async def append_turn(db: AsyncSession, user_id: int, message: str, reply: str, usage: Tuple[int, int] | None = None) -> int:
+    """
+    Add one completed chat turn (the user message and the LLM reply) to the session without
+    committing, so it can be written in the same transaction as other changes.
+
+    The turn is appended as two new message rows; existing history is never rewritten. The
+    conversation stays locked until the transaction ends (see lock_conversations).
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        message (str): The message sent by the user.
+        reply (str): The reply returned by the LLM.
+        usage (Tuple[int, int] | None): The prompt and completion tokens of the turn, recorded
+            in the usage table.
+
+    Returns:
+        int: The seq of the reply.
+    """
+    conversation_id = (await lock_conversations(db, [user_id]))[user_id]
+    last_seq = await get_last_seq(db, conversation_id)
+
+    await db.execute(
+        insert(Message),
+        [
+            {"conversation_id": conversation_id, "seq": last_seq + 1, "role": "user", "content": message},
+            {"conversation_id": conversation_id, "seq": last_seq + 2, "role": "llm", "content": reply},
+        ],
+    )
+    if usage is not None:
+        db.add(LLMUsage(user_id=user_id, prompt_tokens=usage[0], completion_tokens=usage[1]))
+    return last_seq + 2
+
+async def save_turn(db: AsyncSession, user_id: int, message: str, reply: str, usage: Tuple[int, int] | None = None):
+    """
+    Persist one completed chat turn (the user message and the LLM reply) and commit.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        message (str): The message sent by the user.
+        reply (str): The reply returned by the LLM.
+        usage (Tuple[int, int] | None): The prompt and completion tokens of the turn.
+    """
+    await append_turn(db, user_id, message, reply, usage)
+    await db.commit()
+
+async def get_last_seq(db: AsyncSession, conversation_id: int) -> int:
+    """
+    Get the seq of the newest message in a conversation.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        conversation_id (int): The ID of the conversation.
+
+    Returns:
+        int: The seq of the newest message (0 if the conversation is empty).
+    """
+    result = await db.execute(
+        select(func.coalesce(func.max(Message.seq), 0)).where(Message.conversation_id == conversation_id)
+    )
+    return result.scalar()
+
+async def load_history_page(
+    db: AsyncSession, conversation_id: int, limit: int, before: int | None = None, since: int | None = None
+) -> Tuple[List[Dict], bool]:
+    """
+    Load one page of a conversation's history.
+
+    Without "since", pages run newest-first: the page holds the newest "limit" messages older
+    than "before" (or the newest overall). With "since", the page holds the oldest "limit"
+    messages newer than "since", so a client can fetch only the turns it has not seen.
+    Messages within a page are always in chronological order. Messages moved to the
+    compressed archive by compaction are read from it when a page reaches that far back.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        conversation_id (int): The ID of the conversation.
+        limit (int): The maximum number of messages to return.
+        before (int | None): Only return messages with a lower seq.
+        since (int | None): Only return messages with a higher seq.
+
+    Returns:
+        Tuple[List[Dict], bool]: The messages (with "seq", "role" and "content") and whether
+            more messages exist beyond this page.
+    """
+    query = select(Message.seq, Message.role, Message.content).where(Message.conversation_id == conversation_id)
+    if since is not None:
+        query = query.where(Message.seq > since).order_by(Message.seq)
+    else:
+        if before is not None:
+            query = query.where(Message.seq < before)
+        query = query.order_by(Message.seq.desc())
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = [{"seq": row.seq, "role": row.role, "content": row.content} for row in result.all()]
+
+    # Archived messages are all older than the messages table, so they come before its rows
+    # in an oldest-first page and after them in a newest-first one
+    if since is not None:
+        first_hot_seq = rows[0]["seq"] if rows else None
+        if first_hot_seq is None or first_hot_seq > since + 1:
+            archived = await load_archived_messages(db, conversation_id, limit + 1, since=since)
+            rows = (archived + rows)[:limit + 1]
+    elif len(rows) <= limit:
+        oldest_hot_seq = rows[-1]["seq"] if rows else before
+        if oldest_hot_seq is None or oldest_hot_seq > 1:
+            archived = await load_archived_messages(db, conversation_id, limit + 1 - len(rows), before=oldest_hot_seq)
+            rows += archived
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if since is None:
+        rows.reverse()
+    return rows, has_more
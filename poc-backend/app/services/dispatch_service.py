@@ -0,0 +1,502 @@
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from collections import deque
+from app.config import Config
+from app.metrics import registry
+from app.services.call_service import generate_jitsi_link
+
+# Buckets (seconds) of the caller wait time histogram
+WAIT_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0)
+# Calls that are still waiting or talking to a technician
+ACTIVE_STATUSES = ("waiting", "assigned")
+
+def is_technician(user) -> bool:
+    """
+    Check whether a user may register as a technician.
+
+    Parameters:
+        user (User): The user.
+
+    Returns:
+        bool: True if the user's tier is one of DISPATCH_TECHNICIAN_TIERS.
+    """
+    return getattr(user, "tier", None) in Config.DISPATCH_TECHNICIAN_TIERS
+
+class DispatchError(Exception):
+    """
+    Raised when a dispatch operation is not allowed.
+
+    Attributes:
+        status_code (int): 404 if the technician or call is unknown, 409 if the call is not
+            assigned to the technician.
+        detail (str): Human-readable reason.
+    """
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class SupportCall:
+    """
+    A user's request to talk to a technician.
+
+    The Jitsi room is created with the call, so the caller can join it at once; the
+    technician the call is assigned to is sent the same room.
+
+    Attributes:
+        id (int): The ID of the call.
+        user_id (int): The caller.
+        tier (str): The support tier of the caller.
+        jitsi_url (str): The Jitsi Meet room of the call.
+        rank (float): Queue order; lower is served first.
+        sequence (int): Breaks ties between equal ranks, in call order.
+        status (str): "waiting", "assigned", "completed" or "cancelled".
+        technician (Technician | None): The technician handling the call.
+        created_at (float): When the call was requested (monotonic time).
+        assigned_at (float | None): When the call was last assigned (monotonic time).
+    """
+
+    def __init__(self, call_id: int, user_id: int, tier: str, jitsi_url: str, rank: float, sequence: int, created_at: float):
+        self.id = call_id
+        self.user_id = user_id
+        self.tier = tier
+        self.jitsi_url = jitsi_url
+        self.rank = rank
+        self.sequence = sequence
+        self.status = "waiting"
+        self.technician = None
+        self.created_at = created_at
+        self.assigned_at = None
+
+class Technician:
+    """
+    A technician on duty.
+
+    Attributes:
+        user_id (int): The technician's user ID.
+        username (str): The technician's username, shown to callers.
+        last_seen (float): When the technician was last heard from (monotonic time).
+        call (SupportCall | None): The call the technician is handling.
+        free (bool): Whether the technician is waiting in the free list.
+    """
+
+    def __init__(self, user_id: int, username: str, last_seen: float):
+        self.user_id = user_id
+        self.username = username
+        self.last_seen = last_seen
+        self.call = None
+        self.free = False
+
+class TechnicianDispatcher:
+    """
+    Matches callers with technicians on this worker.
+
+    Waiting callers are kept in a binary heap ordered by the time they called, moved earlier
+    by priority_boost seconds for priority tiers, so a priority caller goes ahead of recent
+    callers but never starves one who has waited long enough. Free technicians are kept
+    longest-idle first. Every operation runs without awaiting, so taking a caller and a
+    technician and assigning one to the other is atomic; requesting a call or freeing a
+    technician costs O(log n) in the number of waiting callers.
+
+    Cancelled calls are left in the heap and skipped when they reach the top; once they make
+    up more than half of it, the heap is rebuilt without them, so its size stays proportional
+    to the number of waiting callers. Technicians not heard from for heartbeat_timeout
+    seconds are taken off duty and their call goes back to the front of the queue. Callers and technicians follow changes through wait_for_change().
+    The state lives in this process, so callers and technicians must reach the same worker.
+    """
+
+    def __init__(self, priority_tiers: list, priority_boost: float, heartbeat_timeout: float, default_call_seconds: float):
+        self.priority_tiers = priority_tiers
+        self.priority_boost = priority_boost
+        self.heartbeat_timeout = heartbeat_timeout
+        self.technicians = {}
+        self.calls = {}
+        self._user_calls = {}
+        self._waiting = []
+        self._waiting_count = 0
+        self._free = deque()
+        self._call_ids = itertools.count(1)
+        self._watchers = set()
+        self._positions = None
+        self._last_sweep = 0.0
+        self._average_call_seconds = default_call_seconds
+        self.assigned = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.requeued = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting_count
+
+    def request_call(self, user) -> SupportCall:
+        """
+        Queue a call from a user, or return the call the user already has.
+
+        Parameters:
+            user (User): The caller.
+
+        Returns:
+            SupportCall: The call, already assigned if a technician was free.
+        """
+        user_id = int(user.id)
+        call = self._user_calls.get(user_id)
+        if call is not None:
+            return call
+        now = time.monotonic()
+        tier = getattr(user, "tier", None) or "standard"
+        rank = now - (self.priority_boost if tier in self.priority_tiers else 0.0)
+        call_id = next(self._call_ids)
+        call = SupportCall(call_id, user_id, tier, generate_jitsi_link(), rank, call_id, now)
+        self.calls[call.id] = call
+        self._user_calls[user_id] = call
+        self._push(call)
+        self._dispatch(now)
+        self._changed()
+        return call
+
+    def get_call(self, call_id: int, user_id: int) -> SupportCall | None:
+        """
+        Look up an active call of a user.
+
+        Parameters:
+            call_id (int): The ID of the call.
+            user_id (int): The ID of the caller.
+
+        Returns:
+            SupportCall | None: The call, or None if it is not active or belongs to another user.
+        """
+        call = self.calls.get(call_id)
+        if call is None or call.user_id != int(user_id):
+            return None
+        return call
+
+    def cancel_call(self, call: SupportCall):
+        """
+        Cancel a call. A technician handling it becomes free again.
+
+        Parameters:
+            call (SupportCall): The call.
+        """
+        if call.status not in ACTIVE_STATUSES:
+            return
+        was_waiting = call.status == "waiting"
+        technician = call.technician
+        call.status = "cancelled"
+        if was_waiting:
+            self._waiting_count -= 1
+            self._drop_cancelled()
+        self._forget(call)
+        self.cancelled += 1
+        if technician is not None:
+            technician.call = None
+            self._make_free(technician)
+        self._dispatch(time.monotonic())
+        self._changed()
+
+    def register_technician(self, user) -> Technician:
+        """
+        Put a technician on duty, or refresh their heartbeat if they already are.
+
+        Parameters:
+            user (User): The technician.
+
+        Returns:
+            Technician: The technician.
+        """
+        user_id = int(user.id)
+        now = time.monotonic()
+        technician = self.technicians.get(user_id)
+        if technician is not None:
+            technician.last_seen = now
+            return technician
+        technician = self.technicians[user_id] = Technician(user_id, user.username, now)
+        self._make_free(technician)
+        self._dispatch(now)
+        self._changed()
+        return technician
+
+    def heartbeat(self, user_id: int) -> Technician:
+        """
+        Record that a technician is still on duty.
+
+        Parameters:
+            user_id (int): The technician's user ID.
+
+        Returns:
+            Technician: The technician.
+
+        Raises:
+            DispatchError: 404 if the technician is not on duty.
+        """
+        technician = self._technician(user_id)
+        now = time.monotonic()
+        technician.last_seen = now
+        self._dispatch(now)
+        return technician
+
+    def unregister_technician(self, user_id: int):
+        """
+        Take a technician off duty. A call they were handling goes back to the queue.
+
+        Parameters:
+            user_id (int): The technician's user ID.
+        """
+        technician = self.technicians.get(int(user_id))
+        if technician is None:
+            return
+        self._remove_technician(technician)
+        self._dispatch(time.monotonic())
+        self._changed()
+
+    def complete_call(self, user_id: int, call_id: int) -> Technician:
+        """
+        Finish the call a technician is handling; the technician is assigned the next caller.
+
+        Parameters:
+            user_id (int): The technician's user ID.
+            call_id (int): The ID of the call.
+
+        Returns:
+            Technician: The technician.
+
+        Raises:
+            DispatchError: 404 if the technician is not on duty, 409 if the call is not theirs.
+        """
+        technician = self._technician(user_id)
+        call = technician.call
+        if call is None or call.id != call_id:
+            raise DispatchError(409, "This call is not assigned to you")
+        now = time.monotonic()
+        self._average_call_seconds = 0.8 * self._average_call_seconds + 0.2 * (now - call.assigned_at)
+        call.status = "completed"
+        self._forget(call)
+        self.completed += 1
+        technician.call = None
+        technician.last_seen = now
+        self._make_free(technician)
+        self._dispatch(now)
+        self._changed()
+        return technician
+
+    def position(self, call: SupportCall) -> int | None:
+        """
+        Get the place of a waiting call in the queue.
+
+        Parameters:
+            call (SupportCall): The call.
+
+        Returns:
+            int | None: The 1-based position, or None if the call is not waiting.
+        """
+        if call.status != "waiting":
+            return None
+        if self._positions is None:
+            # Computed once per change of the queue, however many callers ask
+            waiting = sorted(entry for entry in self._waiting if entry[2].status == "waiting")
+            self._positions = {entry[2].id: index for index, entry in enumerate(waiting, 1)}
+        return self._positions.get(call.id)
+
+    def eta_seconds(self, position: int | None) -> int | None:
+        """
+        Estimate how long until a waiting call is answered.
+
+        Parameters:
+            position (int | None): The position of the call.
+
+        Returns:
+            int | None: Seconds (0 if the call is not waiting), or None if no technician is on duty.
+        """
+        if position is None:
+            return 0
+        if not self.technicians:
+            return None
+        return math.ceil(math.ceil(position / len(self.technicians)) * self._average_call_seconds)
+
+    def call_payload(self, call: SupportCall) -> dict:
+        """
+        Build the public representation of a call.
+
+        Parameters:
+            call (SupportCall): The call.
+
+        Returns:
+            dict: The call ID, status, room link, queue position, ETA and technician.
+        """
+        position = self.position(call)
+        return {
+            "call_id": call.id,
+            "status": call.status,
+            "jitsi_url": call.jitsi_url,
+            "position": position,
+            "eta_seconds": self.eta_seconds(position) if call.status == "waiting" else None,
+            "technician": call.technician.username if call.technician is not None else None,
+        }
+
+    def technician_payload(self, technician: Technician) -> dict:
+        """
+        Build the public representation of a technician on duty.
+
+        Parameters:
+            technician (Technician): The technician.
+
+        Returns:
+            dict: Whether the technician is free or on a call, the call, and the number of
+                waiting callers.
+        """
+        call = technician.call
+        return {
+            "status": "on_call" if call is not None else "free",
+            "call": {"call_id": call.id, "jitsi_url": call.jitsi_url, "tier": call.tier} if call is not None else None,
+            "waiting": self._waiting_count,
+        }
+
+    async def wait_for_change(self, timeout: float):
+        """
+        Wait until calls or technicians change, or the timeout passes.
+
+        Parameters:
+            timeout (float): The longest wait, in seconds.
+        """
+        waiter = asyncio.get_running_loop().create_future()
+        self._watchers.add(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=timeout)
+        finally:
+            self._watchers.discard(waiter)
+
+    def stats(self) -> dict:
+        """
+        Return the dispatch counters.
+
+        Returns:
+            dict: The counters and current occupancy.
+        """
+        busy = sum(1 for technician in self.technicians.values() if technician.call is not None)
+        return {
+            "waiting": self._waiting_count,
+            "technicians_free": len(self.technicians) - busy,
+            "technicians_busy": busy,
+            "assigned": self.assigned,
+            "completed": self.completed,
+            "cancelled": self.cancelled,
+            "requeued": self.requeued,
+            "average_call_seconds": round(self._average_call_seconds, 3),
+        }
+
+    def _technician(self, user_id: int) -> Technician:
+        technician = self.technicians.get(int(user_id))
+        if technician is None:
+            raise DispatchError(404, "You are not on duty")
+        return technician
+
+    def _push(self, call: SupportCall):
+        heapq.heappush(self._waiting, (call.rank, call.sequence, call))
+        self._waiting_count += 1
+
+    def _pop(self) -> SupportCall | None:
+        while self._waiting:
+            call = heapq.heappop(self._waiting)[2]
+            if call.status == "waiting":
+                self._waiting_count -= 1
+                return call
+        return None
+
+    def _drop_cancelled(self):
+        if len(self._waiting) > 2 * self._waiting_count:
+            self._waiting = [entry for entry in self._waiting if entry[2].status == "waiting"]
+            heapq.heapify(self._waiting)
+
+    def _make_free(self, technician: Technician):
+        if not technician.free:
+            technician.free = True
+            self._free.append(technician)
+
+    def _next_free(self) -> Technician | None:
+        while self._free:
+            technician = self._free.popleft()
+            technician.free = False
+            if self.technicians.get(technician.user_id) is technician and technician.call is None:
+                return technician
+        return None
+
+    def _forget(self, call: SupportCall):
+        self.calls.pop(call.id, None)
+        if self._user_calls.get(call.user_id) is call:
+            del self._user_calls[call.user_id]
+
+    def _remove_technician(self, technician: Technician):
+        del self.technicians[technician.user_id]
+        technician.free = False
+        call = technician.call
+        technician.call = None
+        if call is not None and call.status == "assigned":
+            # Back to the queue at its original place
+            call.status = "waiting"
+            call.technician = None
+            self._push(call)
+            self.requeued += 1
+
+    def _dispatch(self, now: float):
+        if now - self._last_sweep >= 1.0:
+            self._last_sweep = now
+            expired = [t for t in self.technicians.values() if now - t.last_seen > self.heartbeat_timeout]
+            for technician in expired:
+                self._remove_technician(technician)
+            if expired:
+                self._changed()
+
+        while self._waiting_count and self._free:
+            technician = self._next_free()
+            if technician is None:
+                break
+            call = self._pop()
+            if call is None:
+                self._make_free(technician)
+                break
+            call.status = "assigned"
+            call.technician = technician
+            call.assigned_at = now
+            technician.call = call
+            self.assigned += 1
+            call_wait_seconds.observe(now - call.created_at)
+            self._changed()
+
+    def _changed(self):
+        self._positions = None
+        for waiter in self._watchers:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._watchers.clear()
+
+technician_dispatcher = TechnicianDispatcher(
+    Config.DISPATCH_PRIORITY_TIERS,
+    Config.DISPATCH_PRIORITY_BOOST_SECONDS,
+    Config.DISPATCH_HEARTBEAT_TIMEOUT_SECONDS,
+    Config.DISPATCH_DEFAULT_CALL_SECONDS,
+)
+
+call_wait_seconds = registry.histogram(
+    "technician_call_wait_seconds", "Time callers waited until a technician was assigned.", buckets=WAIT_BUCKETS
+)
+registry.gauge(
+    "technician_dispatch_state", "Waiting callers and technicians on duty.", ("state",),
+    lambda: {
+        ("waiting",): technician_dispatcher.waiting,
+        ("technicians_busy",): sum(1 for t in technician_dispatcher.technicians.values() if t.call is not None),
+        ("technicians_free",): sum(1 for t in technician_dispatcher.technicians.values() if t.call is None),
+    },
+)
+registry.counter(
+    "technician_calls_total", "Technician calls by outcome.", ("outcome",),
+    lambda: {
+        ("assigned",): technician_dispatcher.assigned,
+        ("completed",): technician_dispatcher.completed,
+        ("cancelled",): technician_dispatcher.cancelled,
+        ("requeued",): technician_dispatcher.requeued,
+    },
+)
@@ -0,0 +1,265 @@
+from datetime import datetime
+from sqlalchemy import func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.models import Conversation, Message, MessageArchive, User
+from app.serialization import json_dumps, json_loads
+from app.services.archive_service import decompress_messages
+
+# Version of the NDJSON export format
+FORMAT_VERSION = 1
+# Archived chunks fetched per round trip (each holds up to COMPACTION_CHUNK_MESSAGES messages)
+ARCHIVE_BATCH_ROWS = 20
+
+class ExportFormatError(ValueError):
+    """
+    Raised when an import file is not a conversation export this version can read.
+    """
+
+class _Cursor:
+    """
+    An ordered row stream with one row of look-ahead, to merge several streams by conversation.
+    """
+
+    def __init__(self, result):
+        self._rows = result.__aiter__()
+        self.row = None
+
+    async def advance(self):
+        self.row = await anext(self._rows, None)
+
+    async def rows_of(self, conversation_id: int):
+        """
+        Yield the rows of a conversation. Rows of conversations not asked for are skipped.
+
+        Parameters:
+            conversation_id (int): The ID of the conversation (rows are ordered by it).
+
+        Yields:
+            Row: The next row of the conversation.
+        """
+        while self.row is not None and self.row.conversation_id < conversation_id:
+            await self.advance()
+        while self.row is not None and self.row.conversation_id == conversation_id:
+            yield self.row
+            await self.advance()
+
+def _line(record: dict) -> str:
+    return json_dumps(record) + "\n"
+
+async def export_ndjson(db: AsyncSession, batch_rows: int = Config.EXPORT_BATCH_ROWS):
+    """
+    Export every user and conversation as NDJSON.
+
+    The first line is {"type": "export", ...}, followed by one {"type": "user", ...} line
+    per user, then each conversation as a {"type": "conversation", ...} line followed by its
+    messages ({"type": "message", ...}), archived ones included, in seq order. Users carry
+    their password hash, so the export can restore accounts; keep it private.
+
+    Rows are read through server-side cursors in batches of batch_rows, and conversations,
+    archived chunks and messages are merged as three ordered streams, so memory use does
+    not depend on the size of the database.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        batch_rows (int): Rows fetched per round trip, and lines per yielded chunk.
+
+    Yields:
+        str: The next chunk of lines.
+    """
+    lines = [_line({"type": "export", "version": FORMAT_VERSION, "exported_at": datetime.utcnow().isoformat()})]
+
+    users = await db.stream(
+        select(User.username, User.tier, User.password_hash).order_by(User.id).execution_options(yield_per=batch_rows)
+    )
+    async for user in users:
+        lines.append(_line({"type": "user", "username": user.username, "tier": user.tier, "password_hash": user.password_hash}))
+        if len(lines) >= batch_rows:
+            yield "".join(lines)
+            lines = []
+
+    conversations = await db.stream(
+        select(Conversation.id, User.username, Conversation.summary, Conversation.summary_seq)
+        .outerjoin(User, User.id == Conversation.user_id)
+        .order_by(Conversation.id)
+        .execution_options(yield_per=batch_rows)
+    )
+    archives = _Cursor(await db.stream(
+        select(MessageArchive.conversation_id, MessageArchive.codec, MessageArchive.payload)
+        .order_by(MessageArchive.conversation_id, MessageArchive.first_seq)
+        .execution_options(yield_per=ARCHIVE_BATCH_ROWS)
+    ))
+    messages = _Cursor(await db.stream(
+        select(Message.conversation_id, Message.seq, Message.role, Message.content, Message.created_at)
+        .order_by(Message.conversation_id, Message.seq)
+        .execution_options(yield_per=batch_rows)
+    ))
+    await archives.advance()
+    await messages.advance()
+
+    async for conversation in conversations:
+        lines.append(_line({
+            "type": "conversation", "username": conversation.username,
+            "summary": conversation.summary, "summary_seq": conversation.summary_seq,
+        }))
+        async for chunk in archives.rows_of(conversation.id):
+            for message in decompress_messages(chunk.codec, chunk.payload, include_created_at=True):
+                lines.append(_line({"type": "message", **message}))
+        async for message in messages.rows_of(conversation.id):
+            lines.append(_line({
+                "type": "message", "seq": message.seq, "role": message.role, "content": message.content,
+                "created_at": message.created_at.isoformat() if message.created_at else None,
+            }))
+            if len(lines) >= batch_rows:
+                yield "".join(lines)
+                lines = []
+        if len(lines) >= batch_rows:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+class _Importer:
+    """
+    State of one import: pending rows and the conversation being imported.
+    """
+
+    def __init__(self, db: AsyncSession, batch_rows: int):
+        self.db = db
+        self.batch_rows = batch_rows
+        self.users = []
+        self.messages = []
+        self.conversation_id = None
+        self.last_seq = 0
+        self.counts = {"users": 0, "conversations": 0, "messages": 0, "skipped_conversations": 0, "skipped_messages": 0}
+
+    async def add_user(self, record: dict):
+        self.users.append(record)
+        if len(self.users) >= self.batch_rows:
+            await self.flush_users()
+
+    async def flush_users(self):
+        if not self.users:
+            return
+        # Existing accounts are left untouched
+        usernames = [record["username"] for record in self.users]
+        result = await self.db.execute(select(User.username).where(User.username.in_(usernames)))
+        existing = set(result.scalars())
+        rows = {
+            record["username"]: {
+                "username": record["username"],
+                "password_hash": record["password_hash"],
+                "tier": record.get("tier") or "standard",
+            }
+            for record in self.users if record["username"] not in existing
+        }
+        if rows:
+            await self.db.execute(insert(User), list(rows.values()))
+            self.counts["users"] += len(rows)
+        self.users = []
+        await self.db.commit()
+
+    async def start_conversation(self, record: dict):
+        await self.flush_users()
+        await self.flush_messages()
+        self.conversation_id = None
+        result = await self.db.execute(select(User.id).where(User.username == record.get("username")))
+        user_id = result.scalar()
+        if user_id is None:
+            self.counts["skipped_conversations"] += 1
+            return
+
+        result = await self.db.execute(select(Conversation.id).where(Conversation.user_id == user_id))
+        conversation_id = result.scalar()
+        if conversation_id is None:
+            conversation = Conversation(
+                user_id=user_id, summary=record.get("summary"), summary_seq=record.get("summary_seq") or 0
+            )
+            self.db.add(conversation)
+            await self.db.flush()
+            self.conversation_id, self.last_seq = conversation.id, 0
+            self.counts["conversations"] += 1
+            return
+
+        # The user already has a conversation (e.g. an interrupted import): add only the
+        # messages after its newest one
+        result = await self.db.execute(
+            select(func.coalesce(func.max(Message.seq), 0)).where(Message.conversation_id == conversation_id)
+        )
+        last_seq = result.scalar()
+        result = await self.db.execute(
+            select(func.coalesce(func.max(MessageArchive.last_seq), 0)).where(MessageArchive.conversation_id == conversation_id)
+        )
+        self.conversation_id, self.last_seq = conversation_id, max(last_seq, result.scalar())
+
+    async def add_message(self, record: dict):
+        if self.conversation_id is None or record["seq"] <= self.last_seq:
+            self.counts["skipped_messages"] += 1
+            return
+        created_at = record.get("created_at")
+        self.messages.append({
+            "conversation_id": self.conversation_id,
+            "seq": record["seq"],
+            "role": record["role"],
+            "content": record["content"],
+            "created_at": datetime.fromisoformat(created_at) if created_at else datetime.utcnow(),
+        })
+        if len(self.messages) >= self.batch_rows:
+            await self.flush_messages()
+
+    async def flush_messages(self):
+        if self.messages:
+            await self.db.execute(insert(Message), self.messages)
+            self.counts["messages"] += len(self.messages)
+            self.messages = []
+        await self.db.commit()
+
+async def import_ndjson(db: AsyncSession, lines, batch_rows: int = Config.EXPORT_BATCH_ROWS) -> dict:
+    """
+    Import users and conversations from an NDJSON export.
+
+    Users whose username already exists are kept as they are. A conversation is imported
+    for the user with the same username; if that user already has a conversation, only the
+    messages newer than its newest one are added, so an interrupted import can simply be run
+    again. Rows are written with multi-row INSERTs of batch_rows rows, committed batch by
+    batch, so memory use does not depend on the size of the export.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        lines (AsyncIterable[str | bytes]): The lines of the export.
+        batch_rows (int): Rows written per INSERT.
+
+    Returns:
+        dict: The numbers of users, conversations and messages imported and skipped.
+
+    Raises:
+        ExportFormatError: If the input is not an export of a supported version.
+    """
+    importer = _Importer(db, batch_rows)
+    first = True
+    try:
+        async for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = json_loads(line)
+                kind = record["type"]
+            except (ValueError, TypeError, KeyError):
+                raise ExportFormatError("Not an NDJSON conversation export")
+            if first:
+                if kind != "export" or record.get("version") != FORMAT_VERSION:
+                    raise ExportFormatError(f"Unsupported export (expected version {FORMAT_VERSION})")
+                first = False
+            elif kind == "user":
+                await importer.add_user(record)
+            elif kind == "conversation":
+                await importer.start_conversation(record)
+            elif kind == "message":
+                await importer.add_message(record)
+        await importer.flush_users()
+        await importer.flush_messages()
+    except BaseException:
+        await db.rollback()
+        raise
+    return importer.counts
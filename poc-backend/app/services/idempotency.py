@@ -0,0 +1,285 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.metrics import registry
+from app.models import IdempotencyKey
+
+# Longest Idempotency-Key accepted
+MAX_KEY_LENGTH = 255
+# How often a retry checks whether the original request, running on another worker, finished
+POLL_INTERVAL_SECONDS = 0.25
+
+class IdempotencyConflict(Exception):
+    """
+    Raised when a request cannot be answered for its Idempotency-Key.
+
+    Attributes:
+        status_code (int): 422 if the key was used for a different request, 409 if the
+            original request is still running.
+        retry_after (int): Suggested number of seconds before retrying.
+        detail (str): Human-readable reason.
+    """
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+class IdempotencyStats:
+    """
+    Counters of requests sent with an Idempotency-Key on this worker.
+    """
+
+    def __init__(self):
+        self.executed = 0
+        self.replayed = 0
+        self.attached = 0
+        self.conflicts = 0
+
+    def as_dict(self) -> dict:
+        return {"executed": self.executed, "replayed": self.replayed, "attached": self.attached, "conflicts": self.conflicts}
+
+idempotency_stats = IdempotencyStats()
+
+# Requests with a key running on this worker: (user_id, key) -> (request hash, future of the reply)
+_in_flight = {}
+
+def request_hash(message: str) -> str:
+    """
+    Fingerprint a chat request, to detect an Idempotency-Key reused for another request.
+
+    Parameters:
+        message (str): The user message.
+
+    Returns:
+        str: The hex SHA-256 of the message.
+    """
+    return hashlib.sha256(message.encode("utf-8")).hexdigest()
+
+def _conflict(status_code: int, retry_after: int, detail: str) -> IdempotencyConflict:
+    idempotency_stats.conflicts += 1
+    return IdempotencyConflict(status_code, retry_after, detail)
+
+class IdempotentRequest:
+    """
+    A chat request sent with an Idempotency-Key.
+
+    Either the key was already used, and "reply" holds the original reply to replay, or this
+    request now owns the key and must produce the reply with run() or stream(), which store
+    it for later retries. If producing the reply fails, the key is released so a retry can
+    try again.
+    """
+
+    def __init__(self, user_id: int, key: str, digest: str, reply: str | None = None, config=Config):
+        self.user_id = user_id
+        self.key = key
+        self.digest = digest
+        self.reply = reply
+        self.config = config
+
+    @property
+    def replayed(self) -> bool:
+        return self.reply is not None
+
+    async def run(self, db: AsyncSession, execute) -> str:
+        """
+        Produce the reply, or replay the original one.
+
+        Parameters:
+            db (AsyncSession): The database session.
+            execute (Callable): Coroutine function producing the reply.
+
+        Returns:
+            str: The reply.
+        """
+        if self.replayed:
+            return self.reply
+        future = self._start()
+        try:
+            reply = await execute()
+        except BaseException as error:
+            await self._abandon(db, future, error)
+            raise
+        await self._finish(db, future, reply)
+        return reply
+
+    async def stream(self, db: AsyncSession, make_stream):
+        """
+        Produce the reply in chunks, or replay the original reply as a single chunk.
+
+        Parameters:
+            db (AsyncSession): The database session.
+            make_stream (Callable): Returns the async iterator of reply chunks.
+
+        Yields:
+            str: The next chunk of the reply.
+        """
+        if self.replayed:
+            yield self.reply
+            return
+        future = self._start()
+        chunks = []
+        try:
+            async for chunk in make_stream():
+                chunks.append(chunk)
+                yield chunk
+        except BaseException as error:
+            await self._abandon(db, future, error)
+            raise
+        await self._finish(db, future, "".join(chunks))
+
+    def _start(self) -> asyncio.Future:
+        idempotency_stats.executed += 1
+        future = asyncio.get_running_loop().create_future()
+        _in_flight[(self.user_id, self.key)] = (self.digest, future)
+        return future
+
+    async def _finish(self, db: AsyncSession, future: asyncio.Future, reply: str):
+        _in_flight.pop((self.user_id, self.key), None)
+        future.set_result(reply)
+        try:
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+                .values(status="done", reply=reply)
+            )
+            await db.commit()
+        except Exception as idempotencyError:
+            # The reply was delivered; a retry will find the key abandoned and run again
+            print(f"Error storing the reply for an idempotency key: {idempotencyError}")
+            await db.rollback()
+
+    async def _abandon(self, db: AsyncSession, future: asyncio.Future, error: BaseException):
+        _in_flight.pop((self.user_id, self.key), None)
+        if isinstance(error, Exception):
+            future.set_exception(error)
+            # Mark the exception as retrieved in case no retry attached to this request
+            future.exception()
+        else:
+            future.cancel()
+        await self.release(db)
+
+    async def release(self, db: AsyncSession):
+        """
+        Give the key up without producing a reply (e.g. when the request is refused), so a
+        retry runs the request.
+
+        Parameters:
+            db (AsyncSession): The database session.
+        """
+        try:
+            await db.rollback()
+            await db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.user_id == self.user_id, IdempotencyKey.key == self.key)
+            )
+            await db.commit()
+        except Exception as idempotencyError:
+            print(f"Error releasing an idempotency key: {idempotencyError}")
+
+async def begin_idempotent_request(db: AsyncSession, user_id: int, key: str, message: str, config=Config) -> IdempotentRequest:
+    """
+    Look up an Idempotency-Key, claiming it if it is new.
+
+    A key whose original request completed replays its reply. A key whose original request
+    is still running attaches to it for up to IDEMPOTENCY_WAIT_SECONDS: on this worker by
+    awaiting it directly, on another worker by polling for its result. Keys are remembered for
+    IDEMPOTENCY_TTL_SECONDS.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        key (str): The Idempotency-Key header.
+        message (str): The user message.
+        config (Config): The application configuration (IDEMPOTENCY_* settings).
+
+    Returns:
+        IdempotentRequest: The request, with the reply to replay if the key was already used.
+
+    Raises:
+        IdempotencyConflict: If the key was used for another request (422), or the original
+            request is still running when the wait ends (409).
+    """
+    digest = request_hash(message)
+    loop = asyncio.get_running_loop()
+    wait_until = loop.time() + config.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        flight = _in_flight.get((user_id, key))
+        if flight is not None:
+            if flight[0] != digest:
+                raise _conflict(422, 0, "This Idempotency-Key was already used for a different request")
+            # Do not hold a database connection while waiting
+            await db.close()
+            original = flight[1]
+            try:
+                reply = await asyncio.wait_for(asyncio.shield(original), max(wait_until - loop.time(), 0))
+            except (Exception, asyncio.CancelledError) as waitError:
+                if original.done() and (original.cancelled() or original.exception() is not None):
+                    # The original request failed and released the key: try again
+                    continue
+                if isinstance(waitError, asyncio.TimeoutError):
+                    raise _conflict(409, 1, "A request with this Idempotency-Key is still in progress")
+                # This request was cancelled (e.g. the client went away)
+                raise
+            idempotency_stats.attached += 1
+            return IdempotentRequest(user_id, key, digest, reply, config)
+
+        now = datetime.utcnow()
+        result = await db.execute(
+            select(IdempotencyKey)
+            .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+            .execution_options(populate_existing=True)
+        )
+        record = result.scalar_one_or_none()
+        if record is not None and record.expires_at > now:
+            if record.request_hash != digest:
+                raise _conflict(422, 0, "This Idempotency-Key was already used for a different request")
+            if record.status == "done":
+                idempotency_stats.replayed += 1
+                return IdempotentRequest(user_id, key, digest, record.reply, config)
+            if record.created_at + timedelta(seconds=config.IDEMPOTENCY_LOCK_SECONDS) > now:
+                # Running on another worker
+                if loop.time() >= wait_until:
+                    raise _conflict(409, 1, "A request with this Idempotency-Key is still in progress")
+                await db.close()
+                await asyncio.sleep(POLL_INTERVAL_SECONDS)
+                continue
+            # The original request was abandoned: take the key over
+            result = await db.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.user_id == user_id, IdempotencyKey.key == key,
+                    IdempotencyKey.created_at == record.created_at,
+                )
+                .values(created_at=now, expires_at=now + timedelta(seconds=config.IDEMPOTENCY_TTL_SECONDS))
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                await db.rollback()
+                continue
+            await db.commit()
+            return IdempotentRequest(user_id, key, digest, config=config)
+
+        # New (or expired) key; forget expired keys on the way
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= now))
+        db.add(IdempotencyKey(
+            user_id=user_id, key=key, request_hash=digest, status="in_progress",
+            created_at=now, expires_at=now + timedelta(seconds=config.IDEMPOTENCY_TTL_SECONDS),
+        ))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another request claimed the key first
+            await db.rollback()
+            continue
+        return IdempotentRequest(user_id, key, digest, config=config)
+
+registry.counter(
+    "idempotent_requests_total", "Chat requests sent with an Idempotency-Key, by outcome.", ("outcome",),
+    lambda: {(outcome,): count for outcome, count in idempotency_stats.as_dict().items()},
+)
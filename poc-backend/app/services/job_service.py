@@ -0,0 +1,298 @@
+import asyncio
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+from app.config import Config
+from app.metrics import registry
+from app.models import ChatJob
+from app.services.admission import AdmissionRejected, llm_priority
+from app.services.context_service import build_context, turn_usage
+from app.services.conversation_service import append_turn
+from app.services.llm_cache import cached_query_llm
+from app.services.quota import charge_tokens
+from app.services.turn_writer import turn_writer
+
+# Statuses of jobs that have not finished yet
+PENDING_STATUSES = ("queued", "running")
+
+async def enqueue_job(db: AsyncSession, user_id: int, message: str, priority: int = 0) -> ChatJob:
+    """
+    Submit a chat turn for asynchronous processing, and commit.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        message (str): The user message.
+        priority (int): Jobs with a higher priority are claimed first.
+
+    Returns:
+        ChatJob: The queued job.
+    """
+    job = ChatJob(user_id=user_id, message=message, priority=priority)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+async def get_job(db: AsyncSession, job_id: int, user_id: int) -> ChatJob | None:
+    """
+    Look up a job of a user.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        job_id (int): The ID of the job.
+        user_id (int): The ID of the user.
+
+    Returns:
+        ChatJob | None: The job, or None if it does not exist or belongs to another user.
+    """
+    result = await db.execute(select(ChatJob).where(ChatJob.id == job_id, ChatJob.user_id == user_id))
+    return result.scalar_one_or_none()
+
+async def claim_job(db: AsyncSession, worker_id: str, lease_seconds: float, max_attempts: int):
+    """
+    Claim the next job for a worker, and commit.
+
+    Queued jobs are claimed by priority, then in submission order, and so are running jobs
+    whose lease has expired. A job is only claimed once every earlier job of the same user
+    has finished, so each user's turns run one at a time and in order. The claim is a single
+    UPDATE, so concurrent workers (in any process) never claim the same job.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        worker_id (str): The ID of the claiming worker.
+        lease_seconds (float): How long the job stays claimed by this worker.
+        max_attempts (int): Jobs whose lease expired this many times are failed instead.
+
+    Returns:
+        Row | None: The claimed job (id, user_id, message, priority, attempts, worker_id), or
+            None if no job is ready.
+    """
+    now = datetime.utcnow()
+    await db.execute(
+        update(ChatJob)
+        .where(ChatJob.status == "running", ChatJob.lease_expires_at < now, ChatJob.attempts >= max_attempts)
+        .values(status="failed", error="The job was interrupted too many times", finished_at=now, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+    earlier = aliased(ChatJob)
+    candidate = (
+        select(ChatJob.id)
+        .where(or_(
+            and_(ChatJob.status == "queued", ChatJob.available_at <= now),
+            and_(ChatJob.status == "running", ChatJob.lease_expires_at < now),
+        ))
+        .where(~select(earlier.id).where(
+            earlier.user_id == ChatJob.user_id, earlier.id < ChatJob.id, earlier.status.in_(PENDING_STATUSES)
+        ).exists())
+        .order_by(ChatJob.priority.desc(), ChatJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        update(ChatJob)
+        .where(ChatJob.id == candidate)
+        .values(
+            status="running",
+            worker_id=worker_id,
+            attempts=ChatJob.attempts + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+        )
+        .returning(ChatJob.id, ChatJob.user_id, ChatJob.message, ChatJob.priority, ChatJob.attempts, ChatJob.worker_id)
+        .execution_options(synchronize_session=False)
+    )
+    job = result.first()
+    await db.commit()
+    return job
+
+def _claimed_by(job):
+    # Guard against finishing a job whose lease expired and was claimed again
+    return and_(
+        ChatJob.id == job.id, ChatJob.status == "running",
+        ChatJob.worker_id == job.worker_id, ChatJob.attempts == job.attempts,
+    )
+
+async def complete_job(db: AsyncSession, job, reply: str, usage: tuple | None = None) -> bool:
+    """
+    Write a job's chat turn and mark it done, in one transaction.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        job (Row): The claimed job.
+        reply (str): The LLM reply.
+        usage (tuple | None): The prompt and completion tokens of the turn.
+
+    Returns:
+        bool: False if the job is no longer claimed by this worker (nothing is written).
+    """
+    reply_seq = await append_turn(db, job.user_id, job.message, reply, usage)
+    result = await db.execute(
+        update(ChatJob)
+        .where(_claimed_by(job))
+        .values(status="done", reply=reply, reply_seq=reply_seq, finished_at=datetime.utcnow(), lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        await db.rollback()
+        return False
+    await db.commit()
+    return True
+
+async def release_job(db: AsyncSession, job, error: str, retry_after: float | None, max_attempts: int) -> str:
+    """
+    Hand back a job that could not be completed: queue it again after retry_after seconds,
+    or fail it if it is not retryable or has used all its attempts.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        job (Row): The claimed job.
+        error (str): Why the attempt failed (shown to the user if the job fails).
+        retry_after (float | None): Seconds before the next attempt, or None if not retryable.
+        max_attempts (int): The number of attempts a job gets.
+
+    Returns:
+        str: The new status of the job ("queued" or "failed").
+    """
+    now = datetime.utcnow()
+    if retry_after is not None and job.attempts < max_attempts:
+        values = {"status": "queued", "available_at": now + timedelta(seconds=retry_after), "lease_expires_at": None}
+    else:
+        values = {"status": "failed", "error": error, "finished_at": now, "lease_expires_at": None}
+    await db.execute(update(ChatJob).where(_claimed_by(job)).values(**values).execution_options(synchronize_session=False))
+    await db.commit()
+    return values["status"]
+
+async def job_queue_stats(db: AsyncSession) -> dict:
+    """
+    Count the jobs by status.
+
+    Parameters:
+        db (AsyncSession): The database session.
+
+    Returns:
+        dict: The number of jobs per status and the age in seconds of the oldest queued job.
+    """
+    result = await db.execute(select(ChatJob.status, func.count()).group_by(ChatJob.status))
+    counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+    counts.update(dict(result.all()))
+    result = await db.execute(select(func.min(ChatJob.created_at)).where(ChatJob.status == "queued"))
+    oldest = result.scalar()
+    oldest_age = (datetime.utcnow() - oldest).total_seconds() if oldest is not None else 0.0
+    return {**counts, "oldest_queued_seconds": round(oldest_age, 3)}
+
+def default_worker_id() -> str:
+    """
+    Build an ID identifying this worker process.
+
+    Returns:
+        str: "<host>:<pid>".
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"[:64]
+
+class JobWorker:
+    """
+    Runs chat jobs from the job queue, concurrency jobs at a time.
+
+    Each job builds the prompt, gets the reply (through the response cache and the LLM
+    admission and resilience layers) and writes the turn together with the job result. Jobs
+    that fail because the LLM is unavailable are queued again after the suggested delay.
+    Run it in its own process with "python -m app.worker", so inference capacity scales
+    separately from the web workers, or inside the web process with JOB_WORKER_IN_PROCESS.
+    """
+
+    def __init__(self, session_factory, worker_id: str | None = None, config=Config):
+        self.session_factory = session_factory
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = max(1, config.JOB_WORKER_CONCURRENCY)
+        self.poll_interval = config.JOB_POLL_INTERVAL_MS / 1000
+        self.lease_seconds = config.JOB_LEASE_SECONDS
+        self.max_attempts = max(1, config.JOB_MAX_ATTEMPTS)
+        self._stopping = asyncio.Event()
+        self._tasks = []
+
+    def start(self):
+        """
+        Start the worker loops.
+        """
+        self._stopping = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._loop()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        """
+        Stop claiming jobs and wait for the running ones to finish.
+        """
+        self._stopping.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                processed = await self.process_next()
+            except Exception as workerError:
+                print(f"Error claiming a chat job: {workerError}")
+                processed = False
+            if not processed:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_next(self) -> bool:
+        """
+        Claim and run one job.
+
+        Returns:
+            bool: True if a job was claimed.
+        """
+        async with self.session_factory() as db:
+            job = await claim_job(db, self.worker_id, self.lease_seconds, self.max_attempts)
+        if job is None:
+            return False
+        jobs_processed_total.inc(outcome="claimed")
+        await self.run_job(job)
+        return True
+
+    async def run_job(self, job):
+        """
+        Run a claimed job and record its outcome.
+
+        Parameters:
+            job (Row): The claimed job.
+        """
+        priority_token = llm_priority.set(job.priority > 0)
+        try:
+            async with self.session_factory() as db:
+                try:
+                    await turn_writer.drain(job.user_id)
+                    conversation_history = await build_context(db, job.user_id, job.message)
+                    # Give the connection back to the pool while waiting for the LLM
+                    await db.close()
+                    reply = await cached_query_llm(conversation_history)
+                    usage = turn_usage(conversation_history, reply)
+                    await charge_tokens(job.user_id, *usage)
+                    await turn_writer.drain(job.user_id)
+                    completed = await complete_job(db, job, reply, usage)
+                    jobs_processed_total.inc(outcome="done" if completed else "lost_lease")
+                except AdmissionRejected as unavailableError:
+                    await db.rollback()
+                    status = await release_job(db, job, unavailableError.detail, unavailableError.retry_after, self.max_attempts)
+                    jobs_processed_total.inc(outcome="retried" if status == "queued" else "failed")
+                except Exception as jobError:
+                    print(f"Error running chat job {job.id}: {jobError}")
+                    await db.rollback()
+                    await release_job(db, job, "Internal server error", None, self.max_attempts)
+                    jobs_processed_total.inc(outcome="failed")
+        finally:
+            llm_priority.reset(priority_token)
+
+jobs_processed_total = registry.counter(
+    "chat_jobs_processed_total", "Chat jobs claimed and finished by the job workers of this process.", ("outcome",)
+)
@@ -0,0 +1,336 @@
+import asyncio
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import math
+import random
+import httpx
+from app.config import Config
+from app.metrics import llm_tokens_total
+from app.serialization import json_loads
+
+# Reply returned when the provider answered without a completion
+NO_RESPONSE_REPLY = "No response from LLM"
+
+class LLMBackend(ABC):
+    """
+    Interface of an LLM provider used for chat completions.
+
+    Messages are OpenAI-style dictionaries with "role" and "content" keys. Backends raise
+    httpx.HTTPStatusError for provider errors so callers handle every backend the same way.
+    A backend must implement complete() and stream() (as an async generator).
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, messages: list) -> str:
+        """
+        Request a full completion.
+
+        Parameters:
+            messages (list): The conversation to complete.
+
+        Returns:
+            str: The reply.
+        """
+
+    @abstractmethod
+    def stream(self, messages: list):
+        """
+        Request a completion and yield it in chunks as it is produced.
+
+        Parameters:
+            messages (list): The conversation to complete.
+
+        Yields:
+            str: The next chunk of the reply.
+        """
+
+    async def aclose(self):
+        """
+        Release any resources held by the backend.
+        """
+
+    def record_usage(self, usage: dict | None):
+        """
+        Count the tokens reported for a call.
+
+        Parameters:
+            usage (dict | None): OpenAI-style usage with "prompt_tokens" and "completion_tokens".
+        """
+        if not usage:
+            return
+        for token_type in ("prompt", "completion"):
+            tokens = usage.get(f"{token_type}_tokens")
+            if tokens:
+                llm_tokens_total.inc(tokens, backend=self.name, type=token_type)
+
+def _http2_available() -> bool:
+    """
+    Check whether HTTP/2 can be negotiated (requires the optional 'h2' package).
+
+    Returns:
+        bool: True if HTTP/2 should be enabled on the client.
+    """
+    if not Config.LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def create_http_client(api_key: str | None = None) -> httpx.AsyncClient:
+    """
+    Build the pooled asynchronous HTTP client used to talk to an LLM provider.
+
+    Parameters:
+        api_key (str | None): Bearer token sent with every request.
+
+    Returns:
+        httpx.AsyncClient: A client with keep-alive, pool limits and timeouts taken from Config.
+    """
+    headers = {}
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+
+    return httpx.AsyncClient(
+        headers=headers,
+        http2=_http2_available(),
+        timeout=httpx.Timeout(
+            Config.LLM_READ_TIMEOUT_SECONDS,
+            connect=Config.LLM_CONNECT_TIMEOUT_SECONDS,
+            pool=Config.LLM_POOL_TIMEOUT_SECONDS,
+        ),
+        limits=httpx.Limits(
+            max_connections=Config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Backend for any server exposing the OpenAI chat completions API (vLLM, TGI, llama.cpp,
+    OpenAI itself, ...). Keeps one long-lived pooled HTTP client.
+    """
+
+    name = "openai"
+
+    def __init__(self, url: str, model: str, api_key: str | None = None, client: httpx.AsyncClient | None = None):
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self._client = client
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        The shared HTTP client, created on first use.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = create_http_client(self.api_key)
+        return self._client
+
+    async def complete(self, messages: list) -> str:
+        response = await self.client.post(self.url, json={"model": self.model, "messages": messages})
+        response.raise_for_status()
+        body = response.json()
+        self.record_usage(body.get("usage"))
+        choices = body.get("choices") or []
+        data = choices[0].get("message") if choices else None
+        return (data or {}).get("content") or NO_RESPONSE_REPLY
+
+    async def stream(self, messages: list):
+        async with self.client.stream(
+            "POST", self.url, json={"model": self.model, "messages": messages, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events: only "data:" lines carry completion chunks
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json_loads(data)
+                # Some servers report usage on the final chunk
+                self.record_usage(chunk.get("usage"))
+                choices = chunk.get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class HuggingFaceBackend(OpenAICompatibleBackend):
+    """
+    Backend for the Hugging Face inference router, which speaks the OpenAI chat completions API.
+    The provider is selected by the ":provider" suffix of HUGGINGFACE_CHAT_MODEL.
+    """
+
+    name = "huggingface"
+
+    def __init__(self, client: httpx.AsyncClient | None = None):
+        super().__init__(
+            Config.HUGGINGFACE_CHAT_URL, Config.HUGGINGFACE_CHAT_MODEL, Config.HUGGINGFACE_API_KEY, client
+        )
+
+STUB_WORDS = (
+    "thanks for reaching out our team can help with that please check the device settings "
+    "restart the unit and confirm the indicator light if the issue persists a technician "
+    "will contact you shortly"
+).split()
+
+class StubBackend(LLMBackend):
+    """
+    Local stand-in for an LLM provider, for load tests and offline benchmarks.
+
+    Each call waits for a time-to-first-token drawn from the configured latency distribution,
+    then produces reply_tokens tokens at tokens_per_second. A failure_rate fraction of calls
+    fails with an HTTP error of failure_status after the first-token delay. The reply text
+    depends only on the conversation, and timings and failures come from a seeded generator,
+    so runs are reproducible.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency_ms: float = 200,
+        latency_distribution: str = "lognormal",
+        latency_sigma: float = 0.5,
+        tokens_per_second: float = 50,
+        reply_tokens: int = 60,
+        failure_rate: float = 0.0,
+        failure_status: int = 503,
+        seed: int | None = 0,
+    ):
+        if latency_distribution not in ("constant", "uniform", "exponential", "lognormal"):
+            raise ValueError(f"Unknown stub latency distribution: {latency_distribution}")
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self._random = random.Random(seed)
+
+    @classmethod
+    def from_config(cls) -> "StubBackend":
+        """
+        Build a stub backend from the LLM_STUB_* settings.
+
+        Returns:
+            StubBackend: The backend.
+        """
+        return cls(
+            latency_ms=Config.LLM_STUB_LATENCY_MS,
+            latency_distribution=Config.LLM_STUB_LATENCY_DISTRIBUTION,
+            latency_sigma=Config.LLM_STUB_LATENCY_SIGMA,
+            tokens_per_second=Config.LLM_STUB_TOKENS_PER_SECOND,
+            reply_tokens=Config.LLM_STUB_REPLY_TOKENS,
+            failure_rate=Config.LLM_STUB_FAILURE_RATE,
+            failure_status=Config.LLM_STUB_FAILURE_STATUS,
+            seed=Config.LLM_STUB_SEED,
+        )
+
+    def first_token_delay(self) -> float:
+        """
+        Draw a time-to-first-token from the latency distribution.
+
+        Returns:
+            float: The delay in seconds; its mean is latency_ms.
+        """
+        mean = self.latency_ms / 1000
+        if self.latency_distribution == "constant":
+            return mean
+        if self.latency_distribution == "uniform":
+            # Spread of +/- sigma around the mean
+            return max(0.0, self._random.uniform(mean * (1 - self.latency_sigma), mean * (1 + self.latency_sigma)))
+        if self.latency_distribution == "exponential":
+            return self._random.expovariate(1 / mean) if mean > 0 else 0.0
+        # Log-normal with the given shape, scaled so its mean is latency_ms (long right tail)
+        if mean <= 0:
+            return 0.0
+        mu = math.log(mean) - self.latency_sigma ** 2 / 2
+        return self._random.lognormvariate(mu, self.latency_sigma)
+
+    def reply_for(self, messages: list) -> list:
+        """
+        Build the deterministic reply tokens for a conversation.
+
+        Parameters:
+            messages (list): The conversation to complete.
+
+        Returns:
+            list: The reply split into tokens (each with its leading space).
+        """
+        digest = hashlib.blake2b(json.dumps(messages, sort_keys=True).encode("utf-8"), digest_size=8).digest()
+        offset = int.from_bytes(digest, "big")
+        words = [STUB_WORDS[(offset + index) % len(STUB_WORDS)] for index in range(max(1, self.reply_tokens))]
+        words[0] = words[0].capitalize()
+        return [words[0]] + [f" {word}" for word in words[1:]]
+
+    def _fail(self):
+        request = httpx.Request("POST", "http://llm-stub/v1/chat/completions")
+        response = httpx.Response(self.failure_status, request=request, text="Injected stub failure")
+        raise httpx.HTTPStatusError(
+            f"Stub backend returned {self.failure_status}", request=request, response=response
+        )
+
+    def _usage(self, messages: list, tokens: list) -> dict:
+        prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)}
+
+    async def _start(self):
+        failed = self._random.random() < self.failure_rate
+        await asyncio.sleep(self.first_token_delay())
+        if failed:
+            self._fail()
+
+    async def complete(self, messages: list) -> str:
+        await self._start()
+        tokens = self.reply_for(messages)
+        if self.tokens_per_second > 0:
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        self.record_usage(self._usage(messages, tokens))
+        return "".join(tokens)
+
+    async def stream(self, messages: list):
+        await self._start()
+        tokens = self.reply_for(messages)
+        for index, token in enumerate(tokens):
+            if index and self.tokens_per_second > 0:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield token
+        self.record_usage(self._usage(messages, tokens))
+
+def create_llm_backend(name: str | None = None) -> LLMBackend:
+    """
+    Build the LLM backend selected in Config.
+
+    Parameters:
+        name (str | None): "huggingface", "openai" or "stub". Defaults to Config.LLM_BACKEND.
+
+    Returns:
+        LLMBackend: The backend.
+
+    Raises:
+        ValueError: If the backend name is unknown.
+    """
+    name = (name or Config.LLM_BACKEND).lower()
+    if name == "huggingface":
+        return HuggingFaceBackend()
+    if name == "openai":
+        return OpenAICompatibleBackend(
+            Config.OPENAI_BASE_URL.rstrip("/") + "/chat/completions", Config.OPENAI_MODEL, Config.OPENAI_API_KEY
+        )
+    if name == "stub":
+        return StubBackend.from_config()
+    raise ValueError(f"Unknown LLM backend: {name}")
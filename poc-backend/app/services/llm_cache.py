@@ -0,0 +1,440 @@
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.config import Config
+from app.metrics import registry
+from app.services import llm_service
+from app.services.llm_backends import NO_RESPONSE_REPLY
+from typing import List, Dict, Tuple
+
+# SimHash fingerprints are split into this many bands; two fingerprints within
+# SIMHASH_BANDS - 1 bits of each other are guaranteed to share at least one band
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 8
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+
+class CacheStats:
+    """
+    Hit/miss counters for the LLM response cache.
+
+    Attributes:
+        hits (int): Lookups answered by an exact key match.
+        near_hits (int): Lookups answered by a near-duplicate match.
+        misses (int): Lookups that had to go to the LLM.
+        stores (int): Replies written to the cache.
+        evictions (int): Entries removed to respect the size limits or TTL.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def as_dict(self) -> dict:
+        """
+        Return the counters as a dictionary.
+
+        Returns:
+            dict: The counters and the overall hit ratio.
+        """
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so trivially different phrasings map to the same cache key.
+
+    Parameters:
+        text (str): The text to normalize.
+
+    Returns:
+        str: Lowercased text with collapsed whitespace and no trailing punctuation.
+    """
+    return re.sub(r"\s+", " ", text.lower()).strip().rstrip("?!. ")
+
+def cache_key(conversation_history: List[Dict[str, str]]) -> Tuple[str, str, str]:
+    """
+    Derive the cache key for a prompt.
+
+    The key covers the system messages (the system prompt and the conversation's rolling
+    summary), the last LLM_CACHE_HISTORY_MESSAGES messages before the latest one and the latest
+    user message. The cache is shared by all users, so everything the reply may depend on
+    must be part of the key.
+
+    Parameters:
+        conversation_history (List[Dict[str, str]]): The prompt messages, ending with the user message.
+
+    Returns:
+        Tuple[str, str, str]: The exact-match key, the context bucket (key without the latest
+            message, used to scope near-duplicate matches) and the normalized latest message.
+    """
+    system_messages = [message["content"] for message in conversation_history if message["role"] == "system"]
+    dialogue = [message for message in conversation_history if message["role"] != "system"]
+    latest = normalize_text(dialogue[-1]["content"]) if dialogue else ""
+    suffix = dialogue[:-1][-Config.LLM_CACHE_HISTORY_MESSAGES:] if Config.LLM_CACHE_HISTORY_MESSAGES else []
+
+    context = json.dumps([system_messages] + [[message["role"], normalize_text(message["content"])] for message in suffix])
+    bucket = hashlib.sha256(context.encode()).hexdigest()
+    key = hashlib.sha256(f"{bucket}\n{latest}".encode()).hexdigest()
+    return key, bucket, latest
+
+def simhash(text: str) -> int:
+    """
+    Compute a 64-bit SimHash fingerprint of a text over its words and word bigrams.
+
+    Parameters:
+        text (str): The (normalized) text.
+
+    Returns:
+        int: The fingerprint.
+    """
+    words = re.findall(r"\w+", text)
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if digest >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+def simhash_bands(fingerprint: int) -> List[int]:
+    """
+    Split a fingerprint into its bands.
+
+    Parameters:
+        fingerprint (int): The SimHash fingerprint.
+
+    Returns:
+        List[int]: The band values, lowest bits first.
+    """
+    mask = (1 << BAND_BITS) - 1
+    return [fingerprint >> (band * BAND_BITS) & mask for band in range(SIMHASH_BANDS)]
+
+def hamming_distance(first: int, second: int) -> int:
+    """
+    Count the differing bits between two fingerprints.
+
+    Parameters:
+        first (int): The first fingerprint.
+        second (int): The second fingerprint.
+
+    Returns:
+        int: The number of differing bits.
+    """
+    return bin(first ^ second).count("1")
+
+class MemoryCacheStore:
+    """
+    In-process LRU cache bounded by entry count, total reply size and TTL.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float, stats: CacheStats):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = stats
+        self._entries = OrderedDict()  # key -> (reply, expires_at, size, bucket, fingerprint)
+        self._bands = {}  # (bucket, band, value) -> set of keys
+        self._size = 0
+
+    def _remove(self, key: str):
+        reply, expires_at, size, bucket, fingerprint = self._entries.pop(key)
+        self._size -= size
+        for band, value in enumerate(simhash_bands(fingerprint)):
+            keys = self._bands.get((bucket, band, value))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[(bucket, band, value)]
+
+    async def get(self, key: str) -> str | None:
+        """
+        Look up a reply by exact key, refreshing its LRU position.
+
+        Parameters:
+            key (str): The cache key.
+
+        Returns:
+            str | None: The cached reply, or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            self.stats.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    async def find_near(self, bucket: str, fingerprint: int, max_distance: int) -> str | None:
+        """
+        Look up a reply whose message fingerprint is within max_distance bits in the same bucket.
+
+        Parameters:
+            bucket (str): The context bucket.
+            fingerprint (int): The SimHash of the latest message.
+            max_distance (int): The maximum Hamming distance.
+
+        Returns:
+            str | None: The closest cached reply, or None.
+        """
+        candidates = set()
+        for band, value in enumerate(simhash_bands(fingerprint)):
+            candidates |= self._bands.get((bucket, band, value), set())
+
+        best = None
+        for key in candidates:
+            distance = hamming_distance(fingerprint, self._entries[key][4])
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+        return await self.get(best[1]) if best else None
+
+    async def set(self, key: str, reply: str, bucket: str, fingerprint: int):
+        """
+        Store a reply, evicting least recently used entries to stay within the limits.
+
+        Parameters:
+            key (str): The cache key.
+            reply (str): The LLM reply.
+            bucket (str): The context bucket.
+            fingerprint (int): The SimHash of the latest message.
+        """
+        if key in self._entries:
+            self._remove(key)
+        size = len(reply.encode())
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (reply, time.monotonic() + self.ttl_seconds, size, bucket, fingerprint)
+        self._size += size
+        for band, value in enumerate(simhash_bands(fingerprint)):
+            self._bands.setdefault((bucket, band, value), set()).add(key)
+
+        while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.stats.evictions += 1
+
+    async def clear(self):
+        """
+        Remove every entry.
+        """
+        self._entries.clear()
+        self._bands.clear()
+        self._size = 0
+
+class SQLiteCacheStore:
+    """
+    Cache stored in a SQLite file so several worker processes share it. Bounded by entry
+    count, total reply size and TTL, evicting least recently used entries first.
+    """
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int, ttl_seconds: float, stats: CacheStats):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, reply TEXT NOT NULL, bucket TEXT NOT NULL, fingerprint INTEGER NOT NULL, "
+            + "".join(f"band{band} INTEGER, " for band in range(SIMHASH_BANDS))
+            + "size INTEGER NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        for band in range(SIMHASH_BANDS):
+            self._connection.execute(f"CREATE INDEX IF NOT EXISTS ix_llm_cache_band{band} ON llm_cache (bucket, band{band})")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_last_access ON llm_cache (last_access)")
+
+    def _run(self, function, *args):
+        with self._lock:
+            return function(*args)
+
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+        row = self._connection.execute("SELECT reply, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self.stats.evictions += 1
+            return None
+        self._connection.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def _find_near(self, bucket: str, fingerprint: int, max_distance: int) -> str | None:
+        bands = simhash_bands(fingerprint)
+        condition = " OR ".join(f"band{band} = ?" for band in range(SIMHASH_BANDS))
+        rows = self._connection.execute(
+            f"SELECT key, fingerprint FROM llm_cache WHERE bucket = ? AND ({condition}) AND expires_at > ?",
+            (bucket, *bands, time.time()),
+        ).fetchall()
+
+        best = None
+        for key, stored in rows:
+            distance = hamming_distance(fingerprint, stored % (1 << SIMHASH_BITS))
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+        return self._get(best[1]) if best else None
+
+    def _set(self, key: str, reply: str, bucket: str, fingerprint: int):
+        now = time.time()
+        size = len(reply.encode())
+        if size > self.max_bytes:
+            return
+        # SQLite integers are signed 64-bit
+        stored = fingerprint - (1 << SIMHASH_BITS) if fingerprint >= 1 << (SIMHASH_BITS - 1) else fingerprint
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO llm_cache VALUES ({', '.join('?' * (7 + SIMHASH_BANDS))})",
+                (key, reply, bucket, stored, *simhash_bands(fingerprint), size, now + self.ttl_seconds, now),
+            )
+            evicted = self._connection.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,)).rowcount
+            count, total = self._connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            for old_key, old_size in self._connection.execute(
+                "SELECT key, size FROM llm_cache ORDER BY last_access"
+            ).fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                self._connection.execute("DELETE FROM llm_cache WHERE key = ?", (old_key,))
+                count, total, evicted = count - 1, total - old_size, evicted + 1
+            self._connection.execute("COMMIT")
+        except Exception:
+            self._connection.execute("ROLLBACK")
+            raise
+        self.stats.evictions += evicted
+
+    async def get(self, key: str) -> str | None:
+        """
+        Look up a reply by exact key. See MemoryCacheStore.get.
+        """
+        return await asyncio.to_thread(self._run, self._get, key)
+
+    async def find_near(self, bucket: str, fingerprint: int, max_distance: int) -> str | None:
+        """
+        Look up a near-duplicate reply. See MemoryCacheStore.find_near.
+        """
+        return await asyncio.to_thread(self._run, self._find_near, bucket, fingerprint, max_distance)
+
+    async def set(self, key: str, reply: str, bucket: str, fingerprint: int):
+        """
+        Store a reply. See MemoryCacheStore.set.
+        """
+        await asyncio.to_thread(self._run, self._set, key, reply, bucket, fingerprint)
+
+    async def clear(self):
+        """
+        Remove every entry.
+        """
+        await asyncio.to_thread(self._run, self._connection.execute, "DELETE FROM llm_cache")
+
+cache_stats = CacheStats()
+_cache_store = None
+
+registry.counter(
+    "llm_cache_events_total", "LLM response cache lookups, stores and evictions.", ("event",),
+    lambda: {
+        ("hit",): cache_stats.hits,
+        ("near_hit",): cache_stats.near_hits,
+        ("miss",): cache_stats.misses,
+        ("store",): cache_stats.stores,
+        ("eviction",): cache_stats.evictions,
+    },
+)
+
+def get_cache_store():
+    """
+    Return the configured cache store, creating it on first use.
+
+    Returns:
+        MemoryCacheStore | SQLiteCacheStore: The cache store.
+    """
+    global _cache_store
+    if _cache_store is None:
+        if Config.LLM_CACHE_BACKEND == "sqlite":
+            _cache_store = SQLiteCacheStore(
+                Config.LLM_CACHE_SQLITE_PATH, Config.LLM_CACHE_MAX_ENTRIES,
+                Config.LLM_CACHE_MAX_BYTES, Config.LLM_CACHE_TTL_SECONDS, cache_stats,
+            )
+        else:
+            _cache_store = MemoryCacheStore(
+                Config.LLM_CACHE_MAX_ENTRIES, Config.LLM_CACHE_MAX_BYTES, Config.LLM_CACHE_TTL_SECONDS, cache_stats,
+            )
+    return _cache_store
+
+async def get_cached_reply(conversation_history: List[Dict[str, str]]) -> str | None:
+    """
+    Look up a cached reply for a prompt, by exact key and then (if enabled) by near-duplicate.
+
+    Parameters:
+        conversation_history (List[Dict[str, str]]): The prompt messages.
+
+    Returns:
+        str | None: The cached reply, or None on a miss or when caching is disabled.
+    """
+    if not Config.LLM_CACHE_ENABLED:
+        return None
+    store = get_cache_store()
+    key, bucket, latest = cache_key(conversation_history)
+
+    reply = await store.get(key)
+    if reply is not None:
+        cache_stats.hits += 1
+        return reply
+
+    if Config.LLM_CACHE_NEAR_DUPLICATES:
+        reply = await store.find_near(bucket, simhash(latest), Config.LLM_CACHE_SIMHASH_DISTANCE)
+        if reply is not None:
+            cache_stats.near_hits += 1
+            return reply
+
+    cache_stats.misses += 1
+    return None
+
+async def store_reply(conversation_history: List[Dict[str, str]], reply: str):
+    """
+    Cache the reply to a prompt. Empty replies and the placeholder used when the provider
+    returned no reply are not cached.
+
+    Parameters:
+        conversation_history (List[Dict[str, str]]): The prompt messages.
+        reply (str): The LLM reply.
+    """
+    if not Config.LLM_CACHE_ENABLED or not reply.strip() or reply == NO_RESPONSE_REPLY:
+        return
+    key, bucket, latest = cache_key(conversation_history)
+    await get_cache_store().set(key, reply, bucket, simhash(latest))
+    cache_stats.stores += 1
+
+async def cached_query_llm(conversation_history: List[Dict[str, str]]) -> str:
+    """
+    Answer a prompt from the cache, or query the LLM and cache its reply.
+
+    Parameters:
+        conversation_history (List[Dict[str, str]]): The prompt messages.
+
+    Returns:
+        str: The reply.
+    """
+    reply = await get_cached_reply(conversation_history)
+    if reply is None:
+        reply = await llm_service.query_llm(conversation_history)
+        await store_reply(conversation_history, reply)
+    return reply
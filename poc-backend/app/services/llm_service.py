@@ -1,15 +1,68 @@
-import httpx
-import os
+import time
+from app.metrics import llm_request_duration_seconds, llm_requests_total, llm_stream_chunks_total, llm_time_to_first_token_seconds
+from app.services.admission import AdmissionRejected, llm_admission
 from app.config import Config
-from huggingface_hub import InferenceClient
+from app.services.llm_backends import LLMBackend, create_llm_backend
+from app.services.resilience import LLMUnavailable, llm_resilience
 from httpx import HTTPStatusError
 
-HUGGINGFACE_API_URL = Config.HUGGINGFACE_MODEL_URL
-HUGGINGFACE_API_KEY = Config.HUGGINGFACE_API_KEY
+# Long-lived LLM backend shared by every chat request on this worker
+_backend: LLMBackend | None = None
+# Secondary backend for hedged requests (None when hedging is disabled)
+_hedge_backend: LLMBackend | None = None
+
+async def init_llm_backend():
+    """
+    Create the LLM backends selected in Config. Called once from the application lifespan.
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_llm_backend()
+    get_hedge_backend()
+
+async def close_llm_backend():
+    """
+    Close the LLM backends and release their pooled connections. Called at shutdown.
+    """
+    global _backend, _hedge_backend
+    if _backend is not None:
+        await _backend.aclose()
+        _backend = None
+    if _hedge_backend is not None:
+        await _hedge_backend.aclose()
+        _hedge_backend = None
+
+def get_llm_backend() -> LLMBackend:
+    """
+    Return the shared LLM backend, creating it on first use if the lifespan has not run
+    (e.g. when the app is driven directly through ASGITransport in tests).
+
+    Returns:
+        LLMBackend: The shared backend.
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_llm_backend()
+    return _backend
+
+def get_hedge_backend() -> LLMBackend | None:
+    """
+    Return the backend used for hedged requests, creating it on first use.
+
+    Returns:
+        LLMBackend | None: The hedge backend, or None if LLM_HEDGE_BACKEND is not set.
+    """
+    global _hedge_backend
+    if _hedge_backend is None and Config.LLM_HEDGE_BACKEND:
+        _hedge_backend = create_llm_backend(Config.LLM_HEDGE_BACKEND)
+        if Config.LLM_HEDGE_MODEL and hasattr(_hedge_backend, "model"):
+            _hedge_backend.model = Config.LLM_HEDGE_MODEL
+    return _hedge_backend
 
 async def query_llm(conversation_history):
     """
-    Send a conversation history to Hugging Face API and retrieve a response.
+    Send a conversation history to the configured LLM backend and retrieve a response,
+    with the deadlines, retries, hedging and circuit breaking of llm_resilience.
 
     Parameters:
         conversation_history (list): A list of dictionaries representing the conversation history.
@@ -18,25 +71,83 @@ async def query_llm(conversation_history):
         str: The response from the LLM.
 
     Raises:
+        AdmissionRejected: If the call is turned away because too many LLM calls are running.
+        LLMUnavailable: If the provider is down, too slow or keeps failing.
         HTTPStatusError: If there is an error with the HTTP request.
         Exception: If there is any other error.
     """
-    huggingfaceClient = InferenceClient(
-        provider="fireworks-ai",
-        api_key=HUGGINGFACE_API_KEY
-    )
+    backend = get_llm_backend()
+    outcome = "error"
+    try:
+        async with llm_admission.admit():
+            started = time.perf_counter()
+            try:
+                reply = await llm_resilience.complete(backend, conversation_history, get_hedge_backend())
+            finally:
+                llm_request_duration_seconds.observe(time.perf_counter() - started, backend=backend.name, operation="complete")
+        outcome = "ok"
+        return reply
+    except LLMUnavailable as unavailable_error:
+        outcome = "unavailable"
+        print(f"LLM provider unavailable: {unavailable_error}")
+        raise
+    except AdmissionRejected:
+        outcome = "rejected"
+        raise
+    except HTTPStatusError as http_error:
+        print(f"HTTP error occurred: {http_error}")
+        raise
+    except Exception as error:
+        print(f"An error occurred: {error}")
+        raise
+    finally:
+        llm_requests_total.inc(backend=backend.name, operation="complete", outcome=outcome)
+
+async def stream_llm(conversation_history):
+    """
+    Send a conversation history to the configured LLM backend and yield the response tokens as they arrive.
+    Failed attempts are retried until the first token arrives.
+
+    Parameters:
+        conversation_history (list): A list of dictionaries representing the conversation history.
+
+    Yields:
+        str: The next chunk of the LLM response.
 
+    Raises:
+        AdmissionRejected: If the call is turned away because too many LLM calls are running.
+        LLMUnavailable: If the provider is down, too slow or keeps failing.
+        HTTPStatusError: If there is an error with the HTTP request.
+        Exception: If there is any other error.
+    """
+    backend = get_llm_backend()
+    outcome = "error"
     try:
-        async with httpx.AsyncClient() as client:
-            completion = huggingfaceClient.chat.completions.create(
-                model="meta-llama/Llama-3.3-70B-Instruct",
-                messages=conversation_history,
-            )
-            data = completion.choices[0].message
-            return data.content if data else "No response from LLM"
+        async with llm_admission.admit():
+            started = time.perf_counter()
+            first_chunk = True
+            try:
+                async for chunk in llm_resilience.stream(backend, conversation_history):
+                    if first_chunk:
+                        llm_time_to_first_token_seconds.observe(time.perf_counter() - started, backend=backend.name)
+                        first_chunk = False
+                    llm_stream_chunks_total.inc(backend=backend.name)
+                    yield chunk
+            finally:
+                llm_request_duration_seconds.observe(time.perf_counter() - started, backend=backend.name, operation="stream")
+        outcome = "ok"
+    except LLMUnavailable as unavailable_error:
+        outcome = "unavailable"
+        print(f"LLM provider unavailable: {unavailable_error}")
+        raise
+    except AdmissionRejected:
+        outcome = "rejected"
+        raise
     except HTTPStatusError as http_error:
         print(f"HTTP error occurred: {http_error}")
         raise
     except Exception as error:
         print(f"An error occurred: {error}")
         raise
+    finally:
+        llm_requests_total.inc(backend=backend.name, operation="stream", outcome=outcome)
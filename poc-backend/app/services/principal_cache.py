@@ -0,0 +1,99 @@
+import time
+from collections import OrderedDict
+from sqlalchemy import event, inspect
+from app.config import Config
+from app.metrics import registry
+from app.models import User
+
+class PrincipalCache:
+    """
+    Bounded in-process cache of authenticated users, keyed by user ID, so authenticated
+    requests do not need a database round trip to confirm the user still exists.
+
+    Entries expire after PRINCIPAL_CACHE_TTL_SECONDS, or earlier if the token they were loaded
+    for expires first. Entries are dropped when the user's password changes or the user is
+    deleted through the ORM (see the event listeners below); other workers notice within the TTL.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user_id -> (username, tier, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> User | None:
+        """
+        Look up a cached user.
+
+        Parameters:
+            user_id (int): The ID of the user.
+
+        Returns:
+            User | None: A detached copy of the user (ID, username and tier only), or None.
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or entry[2] <= time.time():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return User(id=user_id, username=entry[0], tier=entry[1])
+
+    def put(self, user: User, token_expires_at: float | None = None):
+        """
+        Cache a user loaded from the database.
+
+        Parameters:
+            user (User): The user.
+            token_expires_at (float | None): Expiry (UNIX time) of the token the user was loaded for.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        self._entries[user.id] = (user.username, user.tier, expires_at)
+        self._entries.move_to_end(user.id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        """
+        Drop a user from the cache.
+
+        Parameters:
+            user_id (int): The ID of the user.
+        """
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        """
+        Drop every cached user.
+        """
+        self._entries.clear()
+
+principal_cache = PrincipalCache(Config.PRINCIPAL_CACHE_MAX_ENTRIES, Config.PRINCIPAL_CACHE_TTL_SECONDS)
+
+registry.counter(
+    "principal_cache_lookups_total", "Principal cache lookups, by result.", ("result",),
+    lambda: {("hit",): principal_cache.hits, ("miss",): principal_cache.misses},
+)
+
+@event.listens_for(User, "after_update")
+def _invalidate_on_change(mapper, connection, target: User):
+    """
+    Drop a user from the principal cache when their password hash or tier changes.
+    """
+    attributes = inspect(target).attrs
+    if attributes.password_hash.history.has_changes() or attributes.tier.history.has_changes():
+        principal_cache.invalidate(target.id)
+
+@event.listens_for(User, "after_delete")
+def _invalidate_on_delete(mapper, connection, target: User):
+    """
+    Drop a user from the principal cache when they are deleted.
+    """
+    principal_cache.invalidate(target.id)
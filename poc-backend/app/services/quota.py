@@ -0,0 +1,366 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.config import Config
+from app.metrics import registry
+from app.models import LLMUsage
+from app.services.admission import AdmissionRejected
+
+class QuotaExceeded(AdmissionRejected):
+    """
+    Raised when a user has used up their request or LLM token quota (always a 429).
+    """
+
+    def __init__(self, retry_after: int, detail: str):
+        super().__init__(429, retry_after, detail)
+
+class QuotaStats:
+    """
+    Counters of the quota decisions on this worker.
+    """
+
+    def __init__(self):
+        self.allowed = 0
+        self.rejected_requests = 0
+        self.rejected_tokens = 0
+        self.tokens_charged = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "rejected_requests": self.rejected_requests,
+            "rejected_tokens": self.rejected_tokens,
+            "tokens_charged": self.tokens_charged,
+        }
+
+class TokenBuckets:
+    """
+    The arithmetic of a user's two token buckets: one of requests, one of LLM tokens.
+
+    Each bucket holds up to its limit and refills continuously at limit per window, so a
+    user can burst up to the limit and then sustain limit per window. The LLM token bucket
+    is charged after the turn, when its prompt and completion tokens are known, so it may go
+    below zero; requests are refused until it is positive again. A limit of 0 disables the
+    bucket. A bucket state is (requests, tokens, updated) with updated in UNIX time.
+    """
+
+    def __init__(self, requests_per_window: int, tokens_per_window: int, window_seconds: float):
+        self.requests_per_window = requests_per_window
+        self.tokens_per_window = tokens_per_window
+        self.window_seconds = window_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_window > 0 or self.tokens_per_window > 0
+
+    def full(self, now: float) -> tuple:
+        return (float(self.requests_per_window), float(self.tokens_per_window), now)
+
+    def refill(self, state: tuple | None, now: float) -> tuple:
+        """
+        Bring a bucket state up to date.
+
+        Parameters:
+            state (tuple | None): The stored state, or None for a new user.
+            now (float): The current UNIX time.
+
+        Returns:
+            tuple: The refilled state.
+        """
+        if state is None:
+            return self.full(now)
+        requests, tokens, updated = state
+        elapsed = max(0.0, now - updated) / self.window_seconds
+        requests = min(self.requests_per_window, requests + elapsed * self.requests_per_window)
+        tokens = min(self.tokens_per_window, tokens + elapsed * self.tokens_per_window)
+        return (requests, tokens, now)
+
+    def take(self, state: tuple | None, now: float) -> tuple:
+        """
+        Take one request, if both buckets allow it.
+
+        Parameters:
+            state (tuple | None): The stored state.
+            now (float): The current UNIX time.
+
+        Returns:
+            tuple: The new state, and None if the request is allowed or else the name of
+                the exhausted bucket ("requests" or "tokens") and the seconds until it allows
+                a request.
+        """
+        requests, tokens, now = self.refill(state, now)
+        window = self.window_seconds
+        if self.requests_per_window > 0 and requests < 1:
+            return (requests, tokens, now), ("requests", (1 - requests) * window / self.requests_per_window)
+        if self.tokens_per_window > 0 and tokens <= 0:
+            return (requests, tokens, now), ("tokens", (1 - tokens) * window / self.tokens_per_window)
+        if self.requests_per_window > 0:
+            requests -= 1
+        return (requests, tokens, now), None
+
+    def charge(self, state: tuple | None, tokens_used: int, now: float) -> tuple:
+        """
+        Charge LLM tokens to the token bucket.
+
+        Parameters:
+            state (tuple | None): The stored state.
+            tokens_used (int): The prompt and completion tokens of a turn.
+            now (float): The current UNIX time.
+
+        Returns:
+            tuple: The new state.
+        """
+        requests, tokens, now = self.refill(state, now)
+        if self.tokens_per_window > 0:
+            tokens -= tokens_used
+        return (requests, tokens, now)
+
+    def idle(self, state: tuple, now: float) -> bool:
+        # A bucket left alone for a whole window without debt is full again, like a new user's
+        return now - state[2] >= self.window_seconds and state[0] >= 0 and state[1] >= 0
+
+class MemoryQuotaStore:
+    """
+    Bucket states kept in this worker's memory. Each worker process enforces the limits
+    separately.
+    """
+
+    def __init__(self, buckets: TokenBuckets):
+        self.buckets = buckets
+        self._states = {}
+        self._last_cleanup = time.time()
+
+    async def take(self, user_id: int) -> tuple | None:
+        """
+        Take one request from a user's buckets.
+
+        Parameters:
+            user_id (int): The ID of the user.
+
+        Returns:
+            tuple | None: None if allowed, else the exhausted bucket and seconds to wait.
+        """
+        now = time.time()
+        if now - self._last_cleanup >= self.buckets.window_seconds:
+            self._last_cleanup = now
+            for idle_user in [key for key, state in self._states.items() if self.buckets.idle(state, now)]:
+                del self._states[idle_user]
+        self._states[user_id], refused = self.buckets.take(self._states.get(user_id), now)
+        return refused
+
+    async def charge(self, user_id: int, tokens: int):
+        """
+        Charge LLM tokens to a user's token bucket.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            tokens (int): The tokens used.
+        """
+        self._states[user_id] = self.buckets.charge(self._states.get(user_id), tokens, time.time())
+
+    async def remaining(self, user_id: int) -> tuple:
+        """
+        Return a user's current bucket levels.
+
+        Parameters:
+            user_id (int): The ID of the user.
+
+        Returns:
+            tuple: The requests and tokens left.
+        """
+        return self.buckets.refill(self._states.get(user_id), time.time())[:2]
+
+class SQLiteQuotaStore:
+    """
+    Bucket states stored in a SQLite file, so every worker process on the host enforces the
+    same limits. Each update reads and writes the user's row in one immediate transaction.
+    """
+
+    def __init__(self, path: str, buckets: TokenBuckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._last_cleanup = time.time()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS quota_buckets ("
+            "user_id INTEGER PRIMARY KEY, requests REAL NOT NULL, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _update(self, user_id: int, change):
+        with self._lock:
+            now = time.time()
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute(
+                    "SELECT requests, tokens, updated FROM quota_buckets WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                state, result = change(row, now)
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO quota_buckets VALUES (?, ?, ?, ?)", (user_id, *state)
+                )
+                if now - self._last_cleanup >= self.buckets.window_seconds:
+                    self._last_cleanup = now
+                    self._connection.execute(
+                        "DELETE FROM quota_buckets WHERE updated <= ? AND requests >= 0 AND tokens >= 0",
+                        (now - self.buckets.window_seconds,),
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            return result
+
+    def _read(self, user_id: int) -> tuple:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT requests, tokens, updated FROM quota_buckets WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return self.buckets.refill(row, time.time())[:2]
+
+    async def take(self, user_id: int) -> tuple | None:
+        """
+        Take one request from a user's buckets. See MemoryQuotaStore.take.
+        """
+        return await asyncio.to_thread(self._update, user_id, self.buckets.take)
+
+    async def charge(self, user_id: int, tokens: int):
+        """
+        Charge LLM tokens to a user's token bucket. See MemoryQuotaStore.charge.
+        """
+        await asyncio.to_thread(
+            self._update, user_id, lambda state, now: (self.buckets.charge(state, tokens, now), None)
+        )
+
+    async def remaining(self, user_id: int) -> tuple:
+        """
+        Return a user's current bucket levels. See MemoryQuotaStore.remaining.
+        """
+        return await asyncio.to_thread(self._read, user_id)
+
+quota_stats = QuotaStats()
+_quota_store = None
+
+def get_quota_store():
+    """
+    Return the configured quota store, creating it on first use.
+
+    Returns:
+        MemoryQuotaStore | SQLiteQuotaStore: The quota store.
+    """
+    global _quota_store
+    if _quota_store is None:
+        buckets = TokenBuckets(Config.QUOTA_REQUESTS_PER_WINDOW, Config.QUOTA_TOKENS_PER_WINDOW, Config.QUOTA_WINDOW_SECONDS)
+        if Config.QUOTA_BACKEND == "sqlite":
+            _quota_store = SQLiteQuotaStore(Config.QUOTA_SQLITE_PATH, buckets)
+        else:
+            _quota_store = MemoryQuotaStore(buckets)
+    return _quota_store
+
+async def check_quota(user_id: int):
+    """
+    Count a chat request against the user's quota.
+
+    Parameters:
+        user_id (int): The ID of the user.
+
+    Raises:
+        QuotaExceeded: If the user has no requests left, or used up their LLM tokens, in the
+            current window.
+    """
+    store = get_quota_store()
+    if not store.buckets.enabled:
+        return
+    refused = await store.take(int(user_id))
+    if refused is None:
+        quota_stats.allowed += 1
+        return
+    bucket, wait_seconds = refused
+    retry_after = max(1, math.ceil(wait_seconds))
+    if bucket == "requests":
+        quota_stats.rejected_requests += 1
+        raise QuotaExceeded(retry_after, "Too many requests, please slow down")
+    quota_stats.rejected_tokens += 1
+    raise QuotaExceeded(retry_after, "LLM token quota exceeded, please try again later")
+
+async def charge_tokens(user_id: int, prompt_tokens: int, completion_tokens: int):
+    """
+    Charge the LLM tokens of a turn to the user's quota.
+
+    Parameters:
+        user_id (int): The ID of the user.
+        prompt_tokens (int): The tokens of the prompt.
+        completion_tokens (int): The tokens of the reply.
+    """
+    store = get_quota_store()
+    if store.buckets.tokens_per_window <= 0:
+        return
+    try:
+        await store.charge(int(user_id), prompt_tokens + completion_tokens)
+        quota_stats.tokens_charged += prompt_tokens + completion_tokens
+    except Exception as quotaError:
+        # The turn already happened; failing it now would only lose the reply
+        print(f"Error charging LLM tokens to the quota: {quotaError}")
+
+async def remaining_quota(user_id: int) -> dict:
+    """
+    Describe a user's quota and what is left of it.
+
+    Parameters:
+        user_id (int): The ID of the user.
+
+    Returns:
+        dict: The window, the limits and the requests and tokens left (None when unlimited).
+    """
+    store = get_quota_store()
+    buckets = store.buckets
+    requests, tokens = await store.remaining(int(user_id))
+    return {
+        "window_seconds": buckets.window_seconds,
+        "requests_per_window": buckets.requests_per_window or None,
+        "tokens_per_window": buckets.tokens_per_window or None,
+        "requests_remaining": math.floor(requests) if buckets.requests_per_window > 0 else None,
+        "tokens_remaining": math.floor(tokens) if buckets.tokens_per_window > 0 else None,
+    }
+
+async def get_usage_totals(db: AsyncSession, user_id: int, since: datetime) -> dict:
+    """
+    Add up the LLM tokens used by a user's chat turns.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        user_id (int): The ID of the user.
+        since (datetime): The start of the period.
+
+    Returns:
+        dict: The number of turns and their prompt and completion tokens.
+    """
+    result = await db.execute(
+        select(
+            func.count(),
+            func.coalesce(func.sum(LLMUsage.prompt_tokens), 0),
+            func.coalesce(func.sum(LLMUsage.completion_tokens), 0),
+        ).where(LLMUsage.user_id == int(user_id), LLMUsage.created_at >= since)
+    )
+    turns, prompt_tokens, completion_tokens = result.one()
+    return {"turns": turns, "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+
+registry.counter(
+    "llm_quota_decisions_total", "Chat requests allowed or refused by the per-user quotas.", ("outcome",),
+    lambda: {
+        ("allowed",): quota_stats.allowed,
+        ("rejected_requests",): quota_stats.rejected_requests,
+        ("rejected_tokens",): quota_stats.rejected_tokens,
+    },
+)
+registry.counter(
+    "llm_quota_tokens_charged_total", "LLM tokens charged to the per-user quotas.",
+    callback=lambda: {(): quota_stats.tokens_charged},
+)
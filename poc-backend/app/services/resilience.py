@@ -0,0 +1,382 @@
+import asyncio
+import random
+import time
+from collections import deque
+import httpx
+from app.config import Config
+from app.metrics import registry
+from app.services.admission import AdmissionRejected
+
+# Provider status codes worth retrying: timeouts, rate limits and server-side failures
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+# Provider latencies needed before the hedge delay follows the observed percentile
+HEDGE_MIN_SAMPLES = 20
+
+class LLMUnavailable(AdmissionRejected):
+    """
+    Raised when the LLM provider cannot serve a call: the circuit breaker is open (503), the
+    call ran out of time (504) or the provider kept failing (502). Subclasses AdmissionRejected
+    so callers report it the same way, with its status code and Retry-After. A provider error
+    that retrying cannot fix (e.g. 400, 401 or 403) is a 502 with no Retry-After (retry_after
+    is None).
+    """
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether a failed provider call may succeed if it is tried again.
+
+    Parameters:
+        error (Exception): The error raised by the call.
+
+    Returns:
+        bool: True for timeouts, connection errors and retryable HTTP status codes.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (TimeoutError, httpx.TransportError))
+
+def _retry_after_header(error: Exception) -> float | None:
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    try:
+        return float(error.response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the LLM provider is down.
+
+    After failure_threshold consecutive failures the circuit opens and every call is refused
+    for reset_timeout seconds. Then a single trial call is let through (half-open): if it
+    succeeds the circuit closes, otherwise it opens again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._trial_started = 0.0
+        self.opened = 0
+
+    def allow(self) -> bool:
+        """
+        Check whether a call may go to the provider, starting the trial call when the
+        reset timeout has passed.
+
+        Returns:
+            bool: True if the call may proceed.
+        """
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if self.state == "open" and now - self._opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._trial_running = False
+        # A trial call that never reported back (e.g. cancelled) is replaced after reset_timeout
+        if self.state == "half_open" and (not self._trial_running or now - self._trial_started >= self.reset_timeout):
+            self._trial_running = True
+            self._trial_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_running = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def retry_after(self) -> int:
+        """
+        Estimate how long until the circuit lets a call through again.
+
+        Returns:
+            int: Seconds, at least 1.
+        """
+        if self.state != "open":
+            return 1
+        return max(1, round(self.reset_timeout - (time.monotonic() - self._opened_at)))
+
+class LLMResilience:
+    """
+    Deadlines, retries, hedging and circuit breaking around LLM provider calls.
+
+    Every attempt has its own timeout and the whole call has an overall deadline. Retryable
+    failures are tried again after a jittered exponential backoff (at least the provider's
+    Retry-After), as long as the deadline allows. When a hedge backend is given, a second
+    request goes to it if the first has not answered after the hedge delay (the configured
+    percentile of recent provider latencies), and the first reply wins. Streams are retried
+    only until their first chunk, and are not hedged.
+    """
+
+    def __init__(
+        self,
+        attempt_timeout: float,
+        deadline: float,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        hedge_delay: float,
+        hedge_percentile: float,
+        breaker: CircuitBreaker,
+    ):
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.default_hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker
+        # Recent primary latencies (a lower bound when the hedge won)
+        self._latencies = deque(maxlen=500)
+        self._random = random.Random()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedges_won = 0
+        self.short_circuited = 0
+        self.deadlines_exceeded = 0
+
+    def hedge_delay(self) -> float:
+        """
+        Return how long to wait for the provider before sending a hedged request.
+
+        Returns:
+            float: Seconds; the hedge percentile of recent latencies, or the configured
+                delay until enough calls have been observed.
+        """
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return self.default_hedge_delay
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """
+        Return the delay before the next attempt ("full jitter" exponential backoff).
+
+        Parameters:
+            attempt (int): The number of the attempt that failed, from 1.
+            error (Exception): Its error; a Retry-After header sets the minimum delay.
+
+        Returns:
+            float: Seconds.
+        """
+        delay = self._random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+        retry_after = _retry_after_header(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            raise LLMUnavailable(503, self.breaker.retry_after(), "The LLM provider is unavailable, please try again")
+
+    def _unavailable(self, error: Exception) -> LLMUnavailable:
+        if isinstance(error, TimeoutError):
+            return LLMUnavailable(504, 1, "The LLM provider did not answer in time")
+        if not is_retryable(error):
+            return LLMUnavailable(502, None, "The LLM provider rejected the request")
+        return LLMUnavailable(502, max(1, round(_retry_after_header(error) or 1)), "The LLM provider returned an error")
+
+    def _record(self, error: Exception | None):
+        # Only failures that suggest the provider is down count against the circuit
+        if error is None or not is_retryable(error):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    async def _retry(self, operation):
+        """
+        Run attempts of an operation until one succeeds, retrying within the deadline.
+
+        Parameters:
+            operation (Callable): Coroutine function taking the attempt timeout in seconds.
+
+        Returns:
+            The result of the first successful attempt.
+        """
+        self._check_circuit()
+        self.calls += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            self.attempts += 1
+            timeout = min(self.attempt_timeout, deadline - loop.time())
+            try:
+                result = await operation(timeout)
+            except (TimeoutError, httpx.HTTPError) as error:
+                if isinstance(error, TimeoutError):
+                    self.timeouts += 1
+                self._record(error)
+                if not is_retryable(error) or attempt >= self.max_attempts:
+                    raise self._unavailable(error) from error
+                delay = self.backoff(attempt, error)
+                if loop.time() + delay >= deadline:
+                    self.deadlines_exceeded += 1
+                    raise LLMUnavailable(504, 1, "The LLM provider did not answer in time") from error
+                self._check_circuit()
+                self.retries += 1
+                await asyncio.sleep(delay)
+                continue
+            self._record(None)
+            return result
+
+    async def _hedged_complete(self, backend, messages: list, hedge_backend, timeout: float) -> str:
+        started = time.perf_counter()
+        primary = asyncio.ensure_future(backend.complete(messages))
+        tasks = {primary}
+        first_error = None
+        try:
+            async with asyncio.timeout(timeout):
+                if hedge_backend is not None:
+                    done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+                    if not done:
+                        self.hedges += 1
+                        tasks.add(asyncio.ensure_future(hedge_backend.complete(messages)))
+                while tasks:
+                    done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            # When the hedge wins, the primary took at least this long; leaving
+                            # it out would drop the slow tail and shrink the hedge delay
+                            self._latencies.append(time.perf_counter() - started)
+                            if task is not primary:
+                                self.hedges_won += 1
+                            return task.result()
+                        if first_error is None or task is primary:
+                            first_error = task.exception()
+                raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def complete(self, backend, messages: list, hedge_backend=None) -> str:
+        """
+        Request a full completion with deadlines, retries, hedging and circuit breaking.
+
+        Parameters:
+            backend (LLMBackend): The provider.
+            messages (list): The conversation to complete.
+            hedge_backend (LLMBackend | None): Provider for hedged requests (None disables hedging).
+
+        Returns:
+            str: The reply.
+
+        Raises:
+            LLMUnavailable: If the circuit is open, the deadline passes or the provider keeps failing.
+        """
+        return await self._retry(lambda timeout: self._hedged_complete(backend, messages, hedge_backend, timeout))
+
+    async def stream(self, backend, messages: list):
+        """
+        Request a completion in chunks. Attempts are retried until the first chunk arrives;
+        the attempt timeout and the deadline apply to that first chunk.
+
+        Parameters:
+            backend (LLMBackend): The provider.
+            messages (list): The conversation to complete.
+
+        Yields:
+            str: The next chunk of the reply.
+
+        Raises:
+            LLMUnavailable: If the circuit is open, the deadline passes or the provider fails.
+        """
+        async def first_chunk(timeout: float):
+            chunks = backend.stream(messages)
+            try:
+                async with asyncio.timeout(timeout):
+                    return chunks, await chunks.__anext__()
+            except StopAsyncIteration:
+                return chunks, None
+            except BaseException:
+                await chunks.aclose()
+                raise
+
+        chunks, chunk = await self._retry(first_chunk)
+        try:
+            if chunk is None:
+                return
+            yield chunk
+            async for chunk in chunks:
+                yield chunk
+        except httpx.HTTPError as error:
+            self._record(error)
+            raise self._unavailable(error) from error
+        finally:
+            await chunks.aclose()
+
+    def stats(self) -> dict:
+        """
+        Return the resilience counters.
+
+        Returns:
+            dict: Circuit state, calls, attempts, retries, timeouts, hedges and fast failures.
+        """
+        return {
+            "circuit_state": self.breaker.state,
+            "circuit_opened": self.breaker.opened,
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "deadlines_exceeded": self.deadlines_exceeded,
+            "hedges": self.hedges,
+            "hedges_won": self.hedges_won,
+            "short_circuited": self.short_circuited,
+            "hedge_delay_seconds": round(self.hedge_delay(), 3),
+        }
+
+llm_resilience = LLMResilience(
+    attempt_timeout=Config.LLM_ATTEMPT_TIMEOUT_SECONDS,
+    deadline=Config.LLM_DEADLINE_SECONDS,
+    max_attempts=Config.LLM_MAX_ATTEMPTS,
+    backoff_base=Config.LLM_RETRY_BACKOFF_MS / 1000,
+    backoff_max=Config.LLM_RETRY_BACKOFF_MAX_MS / 1000,
+    hedge_delay=Config.LLM_HEDGE_DELAY_MS / 1000,
+    hedge_percentile=Config.LLM_HEDGE_PERCENTILE,
+    breaker=CircuitBreaker(Config.LLM_CIRCUIT_FAILURE_THRESHOLD, Config.LLM_CIRCUIT_RESET_SECONDS),
+)
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+registry.gauge(
+    "llm_circuit_state", "LLM provider circuit breaker state (0 closed, 1 half-open, 2 open).",
+    callback=lambda: {(): CIRCUIT_STATES[llm_resilience.breaker.state]},
+)
+registry.gauge(
+    "llm_hedge_delay_seconds", "Wait before a hedged LLM request is sent.",
+    callback=lambda: {(): llm_resilience.hedge_delay()},
+)
+registry.counter(
+    "llm_resilience_events_total", "LLM provider attempts, retries, timeouts, hedges and fast failures.", ("event",),
+    lambda: {
+        ("attempt",): llm_resilience.attempts,
+        ("retry",): llm_resilience.retries,
+        ("timeout",): llm_resilience.timeouts,
+        ("deadline_exceeded",): llm_resilience.deadlines_exceeded,
+        ("hedge",): llm_resilience.hedges,
+        ("hedge_won",): llm_resilience.hedges_won,
+        ("short_circuited",): llm_resilience.short_circuited,
+        ("circuit_opened",): llm_resilience.breaker.opened,
+    },
+)
@@ -0,0 +1,122 @@
+import html
+import re
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict
+
+SEARCH_TABLE = "messages_fts"
+# Markers placed around matches by the database, replaced after the snippet is HTML-escaped
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+SNIPPET_TOKENS = 16
+
+class SearchUnavailable(Exception):
+    """
+    Raised when the database has no full-text index (e.g. SQLite built without FTS5).
+    """
+
+def _terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query.lower())
+
+def to_fts_query(query: str) -> str | None:
+    """
+    Turn free text typed by a user into an FTS5 query: every word must match, and the last
+    word also matches as a prefix (for search-as-you-type). Operators and quotes typed by
+    the user are treated as plain text.
+
+    Parameters:
+        query (str): The text typed by the user.
+
+    Returns:
+        str | None: The FTS5 query, or None if the text contains no words.
+    """
+    terms = _terms(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def highlight(snippet: str) -> str:
+    """
+    HTML-escape a snippet and wrap its matches in <mark> tags.
+
+    Parameters:
+        snippet (str): The snippet with MATCH_START/MATCH_END markers.
+
+    Returns:
+        str: Safe HTML.
+    """
+    return html.escape(snippet).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>")
+
+async def search_messages(db: AsyncSession, conversation_id: int, query: str, limit: int, offset: int = 0) -> List[Dict]:
+    """
+    Search the messages of a conversation, best matches first.
+
+    Parameters:
+        db (AsyncSession): The database session.
+        conversation_id (int): The ID of the conversation to search.
+        query (str): The text typed by the user.
+        limit (int): The maximum number of results.
+        offset (int): The number of results to skip.
+
+    Returns:
+        List[Dict]: The results, with "seq", "role", "snippet" (HTML with <mark> around
+            matches) and "score" (higher is better).
+
+    Raises:
+        SearchUnavailable: If the database has no full-text index.
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        terms = _terms(query)
+        if not terms:
+            return []
+        result = await db.execute(
+            text(
+                "SELECT seq, role, ts_headline('english', content, query, :options) AS snippet, "
+                "ts_rank(to_tsvector('english', content), query) AS score "
+                "FROM messages, to_tsquery('english', :query) AS query "
+                "WHERE conversation_id = :conversation_id AND to_tsvector('english', content) @@ query "
+                "ORDER BY score DESC, seq DESC LIMIT :limit OFFSET :offset"
+            ),
+            {
+                "query": " & ".join(terms[:-1] + [f"{terms[-1]}:*"]),
+                "options": f"StartSel={MATCH_START}, StopSel={MATCH_END}, MaxWords={SNIPPET_TOKENS * 2}",
+                "conversation_id": conversation_id,
+                "limit": limit,
+                "offset": offset,
+            },
+        )
+    elif dialect == "sqlite":
+        fts_query = to_fts_query(query)
+        if fts_query is None:
+            return []
+        try:
+            result = await db.execute(
+                text(
+                    f"SELECT seq, role, snippet({SEARCH_TABLE}, 0, :start, :end, '…', {SNIPPET_TOKENS}) AS snippet, "
+                    f"-bm25({SEARCH_TABLE}) AS score FROM {SEARCH_TABLE} "
+                    f"WHERE {SEARCH_TABLE} MATCH :query AND conversation_id = :conversation_id "
+                    f"ORDER BY bm25({SEARCH_TABLE}), seq DESC LIMIT :limit OFFSET :offset"
+                ),
+                {
+                    "start": MATCH_START,
+                    "end": MATCH_END,
+                    "query": fts_query,
+                    "conversation_id": conversation_id,
+                    "limit": limit,
+                    "offset": offset,
+                },
+            )
+        except Exception as searchError:
+            if f"no such table: {SEARCH_TABLE}" in str(searchError):
+                raise SearchUnavailable() from searchError
+            raise
+    else:
+        raise SearchUnavailable()
+
+    return [
+        {"seq": row.seq, "role": row.role, "snippet": highlight(row.snippet), "score": round(float(row.score), 4)}
+        for row in result.all()
+    ]
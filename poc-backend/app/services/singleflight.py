@@ -0,0 +1,169 @@
+import asyncio
+from contextlib import asynccontextmanager
+from app.metrics import registry
+from app.services.llm_cache import normalize_text
+
+class TurnHandle:
+    """
+    Handle given to the request that executes a chat turn, used to publish its reply to
+    identical requests waiting on it.
+    """
+
+    def __init__(self, future: asyncio.Future):
+        self._future = future
+
+    def set_result(self, reply: str):
+        """
+        Publish the reply of the turn.
+
+        Parameters:
+            reply (str): The LLM reply.
+        """
+        if not self._future.done():
+            self._future.set_result(reply)
+
+class TurnCoordinator:
+    """
+    Serializes chat turns per user and coalesces identical in-flight requests.
+
+    Distinct turns of the same user run one at a time in arrival order (asyncio.Lock is FIFO),
+    so each turn sees the previous one in its history. A request identical to one already
+    in flight for the same user (e.g. a double submit) does not start a turn of its own; it
+    waits for the original and shares its reply. Coordination is per worker process.
+
+    Attributes:
+        coalesced (int): Requests answered by sharing an identical in-flight turn.
+        queued (int): Turns that had to wait for an earlier turn of the same user.
+        waiting (int): Turns currently waiting for an earlier turn of the same user.
+        in_flight (int): Turns currently executing or waiting.
+    """
+
+    def __init__(self):
+        self._locks = {}  # user_id -> [asyncio.Lock, number of turns using it]
+        self._flights = {}  # (user_id, normalized message) -> asyncio.Future
+        self.coalesced = 0
+        self.queued = 0
+        self.waiting = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def find(self, user_id: int, message: str) -> asyncio.Future | None:
+        """
+        Find an identical turn already in flight.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            message (str): The user message.
+
+        Returns:
+            asyncio.Future | None: A future resolving to the reply of that turn, or None.
+        """
+        return self._flights.get((user_id, normalize_text(message)))
+
+    async def wait_for(self, flight: asyncio.Future) -> str:
+        """
+        Wait for the reply of an identical in-flight turn.
+
+        Parameters:
+            flight (asyncio.Future): The future returned by find().
+
+        Returns:
+            str: The reply of the turn.
+        """
+        self.coalesced += 1
+        return await asyncio.shield(flight)
+
+    @asynccontextmanager
+    async def turn(self, user_id: int, message: str):
+        """
+        Run a chat turn: register it for coalescing and wait until the user's earlier turns finish.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            message (str): The user message.
+
+        Yields:
+            TurnHandle: Handle used to publish the reply.
+        """
+        key = (user_id, normalize_text(message))
+        future = asyncio.get_running_loop().create_future()
+        self._flights[key] = future
+
+        slot = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+        slot[1] += 1
+        lock = slot[0]
+        try:
+            if lock.locked():
+                self.queued += 1
+            self.waiting += 1
+            try:
+                await lock.acquire()
+            finally:
+                self.waiting -= 1
+
+            try:
+                yield TurnHandle(future)
+            finally:
+                lock.release()
+        except BaseException as error:
+            if not future.done():
+                future.set_exception(error if isinstance(error, Exception) else asyncio.CancelledError())
+                # Mark the exception as retrieved in case no duplicate was waiting for it
+                future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            if self._flights.get(key) is future:
+                del self._flights[key]
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[user_id]
+
+    async def run(self, user_id: int, message: str, turn_function) -> str:
+        """
+        Run a chat turn, or share the reply of an identical one already in flight.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            message (str): The user message.
+            turn_function (Callable[[], Awaitable[str]]): Executes the turn and returns the reply.
+
+        Returns:
+            str: The reply.
+        """
+        flight = self.find(user_id, message)
+        if flight is not None:
+            return await self.wait_for(flight)
+
+        async with self.turn(user_id, message) as handle:
+            reply = await turn_function()
+            handle.set_result(reply)
+            return reply
+
+    def stats(self) -> dict:
+        """
+        Return the contention counters.
+
+        Returns:
+            dict: The counters.
+        """
+        return {
+            "coalesced": self.coalesced,
+            "queued": self.queued,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+        }
+
+turn_coordinator = TurnCoordinator()
+
+registry.counter(
+    "chat_turns_contended_total", "Chat turns that were coalesced with, or queued behind, another turn.", ("kind",),
+    lambda: {("coalesced",): turn_coordinator.coalesced, ("queued",): turn_coordinator.queued},
+)
+registry.gauge(
+    "chat_turns_active", "Chat turns currently in flight or waiting for an earlier turn of the same user.", ("state",),
+    lambda: {("in_flight",): turn_coordinator.in_flight, ("waiting",): turn_coordinator.waiting},
+)
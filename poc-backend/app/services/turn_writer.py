@@ -0,0 +1,265 @@
+import asyncio
+from collections import deque
+from sqlalchemy import func, insert
+from sqlalchemy.future import select
+from app.config import Config
+from app.metrics import COUNT_BUCKETS, registry
+from app.models import LLMUsage, Message
+from app.services.conversation_service import lock_conversations
+
+# Delay before retrying a batch whose transaction failed
+RETRY_DELAY_SECONDS = 0.5
+# Retries of a failed batch before its turns are written one per transaction
+MAX_BATCH_RETRIES = 3
+
+class PendingTurn:
+    """
+    A completed chat turn waiting to be written.
+    """
+
+    __slots__ = ("user_id", "message", "reply", "usage", "future", "attempts")
+
+    def __init__(self, user_id: int, message: str, reply: str, usage: tuple | None, future: asyncio.Future):
+        self.user_id = user_id
+        self.message = message
+        self.reply = reply
+        self.usage = usage
+        self.future = future
+        self.attempts = 0
+
+class TurnWriter:
+    """
+    Write-behind persistence of chat turns with group commit.
+
+    Chat turns are queued in memory and a background task writes everything pending, from
+    all users, in one transaction every flush interval. The request that produced a turn
+    does not wait for the commit. The queue is bounded: when it is full, submit() refuses
+    the turn and the caller writes it synchronously instead.
+
+    Queued turns live only in this process: they are flushed at shutdown, but a crash loses
+    the turns of the last flush interval. Per user, turns are written in submission order,
+    and drain() lets a reader wait until a user's queued turns are visible in the database.
+    A batch whose transaction keeps failing is written one turn per transaction after
+    MAX_BATCH_RETRIES retries, so a bad turn fails on its own instead of blocking the queue.
+    """
+
+    def __init__(self, max_queue: int, flush_interval: float, max_batch: int):
+        self.max_queue = max_queue
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._session_factory = None
+        self._pending = deque()
+        self._last_turn = {}  # user_id -> future of the user's newest queued turn
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self.batches = 0
+        self.turns_written = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def queued(self) -> int:
+        return len(self._pending)
+
+    def start(self, session_factory):
+        """
+        Start the background writer. Called from the application lifespan.
+
+        Parameters:
+            session_factory (sessionmaker): Factory of the sessions used to write turns.
+        """
+        if self.running:
+            return
+        self._session_factory = session_factory
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Write every queued turn, then stop the background writer. Called at shutdown.
+        """
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+    def submit(self, user_id: int, message: str, reply: str, usage: tuple | None = None) -> bool:
+        """
+        Queue a completed chat turn for writing.
+
+        Parameters:
+            user_id (int): The ID of the user.
+            message (str): The message sent by the user.
+            reply (str): The reply returned by the LLM.
+            usage (tuple | None): The prompt and completion tokens of the turn.
+
+        Returns:
+            bool: True if the turn was queued, False if the writer is not running or its
+                queue is full (the caller must then write the turn itself).
+        """
+        if not self.running or self._closing:
+            return False
+        if len(self._pending) >= self.max_queue:
+            self.fallbacks += 1
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(PendingTurn(user_id, message, reply, usage, future))
+        self._last_turn[user_id] = future
+        self._wakeup.set()
+        return True
+
+    async def drain(self, user_id: int):
+        """
+        Wait until every queued turn of a user has been written.
+
+        Parameters:
+            user_id (int): The ID of the user.
+        """
+        future = self._last_turn.get(user_id)
+        if future is None or future.done():
+            return
+        try:
+            await asyncio.shield(future)
+        except Exception:
+            # The failure has already been reported by the writer
+            pass
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if not self._closing:
+                    # Let turns from other requests join this transaction
+                    await asyncio.sleep(self.flush_interval)
+
+            batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+            if not batch:
+                continue
+            try:
+                await self._write(batch)
+            except Exception as writeError:
+                self.failures += 1
+                print(f"Error writing chat turns: {writeError}")
+                if self._closing or max(turn.attempts for turn in batch) >= MAX_BATCH_RETRIES:
+                    await self._write_each(batch)
+                    continue
+                # Put the batch back in front, in order, and retry it
+                for turn in batch:
+                    turn.attempts += 1
+                self._pending.extendleft(reversed(batch))
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                continue
+
+            self.batches += 1
+            self.turns_written += len(batch)
+            turn_batch_size.observe(len(batch))
+            for turn in batch:
+                self._finish(turn)
+
+    async def _write_each(self, batch: list):
+        """
+        Write turns one per transaction, failing only the turns that cannot be written.
+
+        Parameters:
+            batch (list): The turns, in submission order.
+        """
+        for turn in batch:
+            try:
+                await self._write([turn])
+            except Exception as writeError:
+                self.dropped += 1
+                print(f"Error writing a chat turn, dropping it: {writeError}")
+                self._finish(turn, writeError)
+            else:
+                self.batches += 1
+                self.turns_written += 1
+                self._finish(turn)
+
+    def _finish(self, turn: PendingTurn, error: Exception | None = None):
+        if not turn.future.done():
+            if error is None:
+                turn.future.set_result(None)
+            else:
+                turn.future.set_exception(error)
+                # Mark the exception as retrieved in case nobody drains this user
+                turn.future.exception()
+        if self._last_turn.get(turn.user_id) is turn.future:
+            del self._last_turn[turn.user_id]
+
+    async def _write(self, batch: list):
+        """
+        Write a batch of turns in a single transaction.
+
+        Parameters:
+            batch (list): The turns, in submission order.
+        """
+        async with self._session_factory() as db:
+            conversations = await lock_conversations(db, [turn.user_id for turn in batch])
+            result = await db.execute(
+                select(Message.conversation_id, func.max(Message.seq))
+                .where(Message.conversation_id.in_(list(conversations.values())))
+                .group_by(Message.conversation_id)
+            )
+            last_seqs = dict(result.all())
+
+            rows = []
+            for turn in batch:
+                conversation_id = conversations[turn.user_id]
+                last_seq = last_seqs.get(conversation_id) or 0
+                rows.append({"conversation_id": conversation_id, "seq": last_seq + 1, "role": "user", "content": turn.message})
+                rows.append({"conversation_id": conversation_id, "seq": last_seq + 2, "role": "llm", "content": turn.reply})
+                last_seqs[conversation_id] = last_seq + 2
+
+            await db.execute(insert(Message), rows)
+            usage_rows = [
+                {"user_id": turn.user_id, "prompt_tokens": turn.usage[0], "completion_tokens": turn.usage[1]}
+                for turn in batch if turn.usage is not None
+            ]
+            if usage_rows:
+                await db.execute(insert(LLMUsage), usage_rows)
+            await db.commit()
+
+    def stats(self) -> dict:
+        """
+        Return the writer counters.
+
+        Returns:
+            dict: Queue depth, batches and turns written, synchronous fallbacks, failed
+                transactions and turns dropped after failing on their own.
+        """
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "batches": self.batches,
+            "turns_written": self.turns_written,
+            "fallbacks": self.fallbacks,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+turn_writer = TurnWriter(
+    Config.WRITE_BEHIND_MAX_QUEUE, Config.WRITE_BEHIND_FLUSH_INTERVAL_MS / 1000, Config.WRITE_BEHIND_MAX_BATCH
+)
+
+turn_batch_size = registry.histogram(
+    "chat_turn_write_batch_size", "Chat turns written per write-behind transaction.", buckets=COUNT_BUCKETS
+)
+registry.gauge("chat_turn_write_queue", "Chat turns waiting to be written.", callback=lambda: {(): turn_writer.queued})
+registry.counter(
+    "chat_turn_writes_total", "Chat turns by persistence path.", ("path",),
+    lambda: {("write_behind",): turn_writer.turns_written, ("synchronous_fallback",): turn_writer.fallbacks},
+)
@@ -0,0 +1,49 @@
+"""
+Run chat job workers against the configured database.
+
+Usage:
+    python -m app.worker
+
+Claims jobs submitted through POST /api/llm/jobs, runs them against the configured LLM
+backend and writes each turn into the user's conversation. Start as many worker processes
+as the LLM capacity needs, independently of the web workers; JOB_WORKER_CONCURRENCY sets
+the number of jobs each process runs at once. Stops on SIGINT/SIGTERM after finishing the
+jobs it is running.
+"""
+import asyncio
+import signal
+from contextlib import suppress
+from app.config import Config
+from app.db import create_engine_from_config, create_session_factory, init_db
+from app.services.job_service import JobWorker
+from app.services.llm_service import close_llm_backend, init_llm_backend
+
+async def main(config=Config):
+    """
+    Run job workers until the process is asked to stop.
+
+    Parameters:
+        config (Config): The application configuration.
+    """
+    engine = create_engine_from_config(config)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(signal_number, stop.set)
+
+    try:
+        await init_db(engine)
+        await init_llm_backend()
+        worker = JobWorker(create_session_factory(engine), config=config)
+        worker.start()
+        print(f"Chat job worker {worker.worker_id} running {worker.concurrency} jobs at a time")
+        await stop.wait()
+        print("Stopping the chat job worker...")
+        await worker.stop()
+    finally:
+        await close_llm_backend()
+        await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,409 @@
+"""
+End-to-end benchmark of the auth, chat and history endpoints.
+
+Simulated users register, log in, call /me, chat and page through their history, all
+concurrently. Each phase is timed separately and reports throughput, latency percentiles
+and the number of SQL statements executed. The LLM is replaced by the local stub backend.
+
+Usage:
+    python -m benchmarks.harness --users 1,10,50 --history 0,200 --transport asgi,uvicorn --output bench.json
+
+The app reads its configuration at import time, so configure() must run before anything
+from the app package is imported; main() takes care of that.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+PASSWORD = "benchmark-password"
+
+def configure(database_path: str, bcrypt_rounds: int, llm_latency_ms: float, llm_tokens_per_second: float):
+    """
+    Point the app at a scratch database and the stub LLM backend.
+
+    Parameters:
+        database_path (str): Path of the SQLite database file to create.
+        bcrypt_rounds (int): bcrypt cost used for register/login.
+        llm_latency_ms (float): Mean time to first token of the stub LLM.
+        llm_tokens_per_second (float): Token rate of the stub LLM.
+    """
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{database_path}"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(llm_latency_ms)
+    os.environ["LLM_STUB_TOKENS_PER_SECOND"] = str(llm_tokens_per_second)
+    os.environ["BCRYPT_ROUNDS"] = str(bcrypt_rounds)
+    # SQL echo would turn the benchmark into a logging benchmark
+    os.environ["DB_ECHO"] = "false"
+    os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+    # Large enough that the benchmark measures the app, not the admission queue
+    os.environ.setdefault("LLM_MAX_QUEUED_CALLS", "100000")
+    os.environ.setdefault("LLM_QUEUE_TIMEOUT_SECONDS", "600")
+    os.environ.setdefault("QUOTA_REQUESTS_PER_WINDOW", "0")
+    os.environ.setdefault("QUOTA_TOKENS_PER_WINDOW", "0")
+
+def load_app():
+    """
+    Create an application instance from the configuration.
+
+    Returns:
+        FastAPI: The application (not started yet).
+    """
+    from app.main import create_app
+
+    return create_app()
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+
+    Parameters:
+        sorted_values (list): The values, in ascending order.
+        fraction (float): The percentile as a fraction (0.99 for p99).
+
+    Returns:
+        float: The percentile, or 0.0 for an empty list.
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+class QueryCounter:
+    """
+    Counts SQL statements executed by an engine.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+class Phase:
+    """
+    Latency samples and error count of one benchmark phase.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.queries = 0
+        self.duration = 0.0
+
+    async def request(self, client, method: str, url: str, expected: int = 200, **kwargs):
+        """
+        Send one timed request.
+
+        Parameters:
+            client (AsyncClient): The HTTP client.
+            method (str): The HTTP method.
+            url (str): The request path.
+            expected (int): The status code counted as a success.
+
+        Returns:
+            Response | None: The response, or None if the request failed.
+        """
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception as requestError:
+            print(f"Benchmark request {method} {url} failed: {requestError}")
+            self.errors += 1
+            return None
+        self.latencies.append(time.perf_counter() - started)
+        if response.status_code != expected:
+            self.errors += 1
+            return None
+        return response
+
+    def report(self) -> dict:
+        """
+        Summarize the phase.
+
+        Returns:
+            dict: Request and error counts, throughput, latency percentiles (ms) and query counts.
+        """
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        return {
+            "requests": requests,
+            "errors": self.errors,
+            "duration_s": round(self.duration, 4),
+            "throughput_rps": round(requests / self.duration, 2) if self.duration else 0.0,
+            "latency_ms": {
+                "mean": round(sum(latencies) / requests * 1000, 3) if requests else 0.0,
+                "p50": round(percentile(latencies, 0.50) * 1000, 3),
+                "p95": round(percentile(latencies, 0.95) * 1000, 3),
+                "p99": round(percentile(latencies, 0.99) * 1000, 3),
+                "max": round(latencies[-1] * 1000, 3) if requests else 0.0,
+            },
+            "db_queries": self.queries,
+            "db_queries_per_request": round(self.queries / requests, 2) if requests else 0.0,
+        }
+
+async def run_phase(name: str, counter: QueryCounter, users: list, action) -> Phase:
+    """
+    Run one phase: every simulated user performs the action concurrently.
+
+    Parameters:
+        name (str): The phase name.
+        counter (QueryCounter): The SQL statement counter.
+        users (list): The simulated users (dicts shared across phases).
+        action (Callable[[Phase, dict], Awaitable[None]]): The work done by one user.
+
+    Returns:
+        Phase: The measured phase.
+    """
+    phase = Phase(name)
+    queries_before = counter.count
+    started = time.perf_counter()
+    await asyncio.gather(*(action(phase, user) for user in users))
+    phase.duration = time.perf_counter() - started
+    phase.queries = counter.count - queries_before
+    return phase
+
+async def seed_history(app, user_ids: list, history_size: int):
+    """
+    Give each user a conversation of history_size messages, inserted directly in the database.
+
+    Parameters:
+        app (FastAPI): The application.
+        user_ids (list): The IDs of the users.
+        history_size (int): The number of messages per user.
+    """
+    if history_size <= 0:
+        return
+    from sqlalchemy import insert
+    from app.models import Conversation, Message
+
+    async with app.state.session_factory() as db:
+        for user_id in user_ids:
+            conversation = Conversation(user_id=user_id)
+            db.add(conversation)
+            await db.flush()
+            await db.execute(
+                insert(Message),
+                [
+                    {
+                        "conversation_id": conversation.id,
+                        "seq": seq,
+                        "role": "user" if seq % 2 else "llm",
+                        "content": f"Seeded message {seq} about the customer's device and its settings.",
+                    }
+                    for seq in range(1, history_size + 1)
+                ],
+            )
+        await db.commit()
+
+async def run_scenario(
+    app, client, counter: QueryCounter, concurrency: int, history_size: int, iterations: int
+) -> dict:
+    """
+    Run every phase for one combination of concurrency and history size.
+
+    Parameters:
+        app (FastAPI): The application.
+        client (AsyncClient): The HTTP client bound to the app.
+        counter (QueryCounter): The SQL statement counter.
+        concurrency (int): The number of simulated users.
+        history_size (int): The number of messages seeded into each user's history.
+        iterations (int): Requests per user in the /me, chat and history phases.
+
+    Returns:
+        dict: The report of each phase.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    users = [{"email": f"bench-{run_id}-{index}@example.com"} for index in range(concurrency)]
+
+    async def register(phase, user):
+        await phase.request(
+            client, "POST", "/api/auth/register", expected=201, json={"emailId": user["email"], "password": PASSWORD}
+        )
+
+    async def login(phase, user):
+        response = await phase.request(
+            client, "POST", "/api/auth/login", json={"emailId": user["email"], "password": PASSWORD}
+        )
+        if response is not None:
+            user["id"] = response.json()["user_id"]
+            user["headers"] = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def me(phase, user):
+        for _ in range(iterations):
+            await phase.request(client, "GET", "/api/auth/me", headers=user.get("headers"))
+
+    async def chat(phase, user):
+        for index in range(iterations):
+            await phase.request(
+                client, "POST", "/api/llm/", headers=user.get("headers"),
+                json={"message": f"Benchmark question {index} from {user['email']}"},
+            )
+
+    async def history(phase, user):
+        for _ in range(iterations):
+            await phase.request(client, "GET", "/api/llm/history", headers=user.get("headers"))
+
+    phases = [await run_phase("register", counter, users, register), await run_phase("login", counter, users, login)]
+    await seed_history(app, [user["id"] for user in users if "id" in user], history_size)
+    for name, action in (("me", me), ("chat", chat), ("history", history)):
+        phases.append(await run_phase(name, counter, users, action))
+    return {phase.name: phase.report() for phase in phases}
+
+class UvicornServer:
+    """
+    Runs the app on a real local socket with uvicorn, inside the current event loop.
+    """
+
+    def __init__(self, app):
+        import uvicorn
+
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self._task = None
+
+    async def __aenter__(self) -> str:
+        self._task = asyncio.create_task(self.server.serve())
+        while not self.server.started:
+            if self._task.done():
+                self._task.result()
+            await asyncio.sleep(0.01)
+        return f"http://127.0.0.1:{self.port}"
+
+    async def __aexit__(self, *exc_info):
+        self.server.should_exit = True
+        await self._task
+
+async def run_benchmark(
+    app, concurrency_levels: list, history_sizes: list, transports: list, iterations: int
+) -> dict:
+    """
+    Run the benchmark matrix.
+
+    Parameters:
+        app (FastAPI): The application returned by load_app() (not started yet).
+        concurrency_levels (list): Numbers of simulated users.
+        history_sizes (list): Numbers of messages seeded into each user's history.
+        transports (list): "asgi" (in-process, no sockets) and/or "uvicorn" (real HTTP over localhost).
+        iterations (int): Requests per user in the /me, chat and history phases.
+
+    Returns:
+        dict: Environment details and the report of every scenario.
+    """
+    import httpx
+    from app.config import Config
+
+    counter = QueryCounter(app.state.engine)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    timeout = httpx.Timeout(300)
+
+    scenarios = []
+    for transport in transports:
+        for concurrency in concurrency_levels:
+            for history_size in history_sizes:
+                if transport == "asgi":
+                    # ASGITransport does not run the lifespan; uvicorn does
+                    async with app.router.lifespan_context(app), httpx.AsyncClient(
+                        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout
+                    ) as client:
+                        phases = await run_scenario(app, client, counter, concurrency, history_size, iterations)
+                elif transport == "uvicorn":
+                    async with UvicornServer(app) as base_url:
+                        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+                            phases = await run_scenario(app, client, counter, concurrency, history_size, iterations)
+                else:
+                    raise ValueError(f"Unknown transport: {transport}")
+                scenarios.append({
+                    "transport": transport,
+                    "concurrency": concurrency,
+                    "history_size": history_size,
+                    "iterations": iterations,
+                    "phases": phases,
+                })
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {
+            "bcrypt_rounds": Config.BCRYPT_ROUNDS,
+            "llm_backend": Config.LLM_BACKEND,
+            "llm_stub_latency_ms": Config.LLM_STUB_LATENCY_MS,
+            "llm_stub_tokens_per_second": Config.LLM_STUB_TOKENS_PER_SECOND,
+            "llm_max_concurrent_calls": Config.LLM_MAX_CONCURRENT_CALLS,
+        },
+        "scenarios": scenarios,
+    }
+
+def _git_commit() -> str | None:
+    """
+    Return the current git commit, so reports from different commits can be compared.
+
+    Returns:
+        str | None: The commit hash, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def main(argv: list | None = None):
+    """
+    Command line entry point.
+
+    Parameters:
+        argv (list | None): The arguments (defaults to sys.argv).
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the auth, chat and history endpoints.")
+    parser.add_argument("--users", type=_int_list, default=[10], help="Comma-separated concurrency levels")
+    parser.add_argument("--history", type=_int_list, default=[0], help="Comma-separated history sizes (messages)")
+    parser.add_argument("--transport", default="asgi", help="Comma-separated transports: asgi, uvicorn")
+    parser.add_argument("--iterations", type=int, default=5, help="Requests per user in the me/chat/history phases")
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="bcrypt cost for register/login")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Mean stub LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0, help="Stub LLM token rate (0 = instant)")
+    parser.add_argument("--database", help="SQLite database file (default: a temporary file)")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        configure(
+            args.database or os.path.join(scratch, "benchmark.db"),
+            args.bcrypt_rounds, args.llm_latency_ms, args.llm_tokens_per_second,
+        )
+        # Keep the app's startup output out of the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            app = load_app()
+            report = asyncio.run(run_benchmark(
+                app, args.users, args.history, [name.strip() for name in args.transport.split(",")], args.iterations
+            ))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
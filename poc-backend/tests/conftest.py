@@ -1,81 +1,60 @@
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
-from app.db import Base, get_db
-from app.main import app
+from app.config import Config
+from app.main import create_app
 
-# Test database (in-memory SQLite)
-TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
-engine = create_async_engine(TEST_DATABASE_URL, echo=False)
-TestingSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
-
-async def override_get_db():
+def pytest_addoption(parser):
     """
-    Override the get_db dependency to use a test database.
-
-    Yields:
-        AsyncSession: The test database session.
+    Register the --benchmark option, which enables tests marked with @pytest.mark.benchmark.
     """
-    async with TestingSessionLocal() as session:
-        yield session
+    parser.addoption("--benchmark", action="store_true", default=False, help="Run the benchmark tests")
 
-async def ensure_test_tables_exist():
+def pytest_configure(config):
     """
-    Ensures all tables are created in the test database.
-
-    Raises:
-        SQLAlchemyError: If an error occurs during table creation.
+    Register the custom markers.
     """
-    try:
-        async with engine.begin() as conn:
-            result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='users'"))
-            users_table_exists = result.scalar() is not None
-
-            result = await conn.execute(text("SELECT name FROM sqlite_master WHERE type='table' AND name='conversations'"))
-            conversations_table_exists = result.scalar() is not None
+    config.addinivalue_line("markers", "benchmark: slow end-to-end benchmark, only run with --benchmark")
 
-            if not users_table_exists or not conversations_table_exists:
-                print("🔹 Tables not found in test DB, creating tables...")
-                await conn.run_sync(Base.metadata.create_all)
-            else:
-                print("All tables exist in test DB.")
-    except SQLAlchemyError as sqlError:
-        print(f"Error ensuring test tables exist: {sqlError}")
-        raise
+def pytest_collection_modifyitems(config, items):
+    """
+    Skip benchmark tests unless --benchmark was given.
+    """
+    if config.getoption("--benchmark"):
+        return
+    skip_benchmark = pytest.mark.skip(reason="benchmark tests only run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
 
-async def init_test_db():
+@pytest.fixture(scope="session")
+def test_config(tmp_path_factory):
     """
-    Initializes the test database by creating all tables.
+    Configuration for the test application: a fresh SQLite database file per test session.
 
-    Raises:
-        SQLAlchemyError: If an error occurs during database initialization.
+    Returns:
+        type: A Config subclass.
     """
-    try:
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        print("Test database initialized successfully.")
-    except SQLAlchemyError as sqlError:
-        print(f"Error initializing test database: {sqlError}")
-        raise
+    class TestConfig(Config):
+        DATABASE_URL = f"sqlite+aiosqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+        DB_ECHO = False
+
+    return TestConfig
 
-@pytest.fixture(scope="session", autouse=True)
-async def setup_test_db():
+@pytest_asyncio.fixture(scope="session")
+async def app(test_config):
     """
-    Pytest fixture to ensure tables exist before any test runs.
+    Fixture to provide an isolated FastAPI application, started through its lifespan.
 
-    This ensures that tables exist in the in-memory test database.
+    Yields:
+        FastAPI: The started application.
     """
-    await ensure_test_tables_exist()  # Ensure tables exist before tests start
-    yield
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)  # Cleanup after tests
+    test_app = create_app(test_config)
+    async with test_app.router.lifespan_context(test_app):
+        yield test_app
 
 @pytest_asyncio.fixture(scope="session")
-async def client():
+async def client(app):
     """
     Fixture to provide a test FastAPI client.
 
@@ -0,0 +1,79 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.config import Config
+from app.db import Base
+from app.models import Conversation, Message, MessageArchive
+from app.services.archive_service import compact_all, compress_messages, decompress_messages
+from app.services.conversation_service import load_history_page
+
+def test_compress_messages_round_trip():
+    """
+    Test that archived message chunks decompress to the original messages.
+
+    Asserts:
+        - zlib chunks round-trip, and zstd falls back to zlib when zstandard is not installed.
+    """
+    messages = [{"seq": seq, "role": "user", "content": f"message {seq}", "created_at": datetime(2024, 1, 1)} for seq in (1, 2)]
+    for codec in ("zlib", "zstd"):
+        used_codec, payload = compress_messages(messages, codec)
+        assert decompress_messages(used_codec, payload) == [
+            {"seq": 1, "role": "user", "content": "message 1"},
+            {"seq": 2, "role": "user", "content": "message 2"},
+        ]
+
+@pytest.mark.asyncio
+async def test_compaction_and_archived_history(tmp_path):
+    """
+    Test compacting a long conversation and paging through it afterwards.
+
+    Asserts:
+        - Only old messages already folded into the summary are archived, in chunks.
+        - The newest messages stay in the messages table.
+        - History pages read archived messages transparently, in both directions.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'archive.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    old = datetime.utcnow() - timedelta(days=30)
+    async with session_factory() as db:
+        conversation = Conversation(user_id=1, summary="Earlier discussion", summary_seq=20)
+        db.add(conversation)
+        await db.flush()
+        conversation_id = conversation.id
+        await db.execute(insert(Message), [
+            {"conversation_id": conversation_id, "seq": seq, "role": "user" if seq % 2 else "llm",
+             "content": f"message {seq}", "created_at": old if seq <= 28 else datetime.utcnow()}
+            for seq in range(1, 31)
+        ])
+        await db.commit()
+
+    class CompactionConfig(Config):
+        COMPACTION_KEEP_MESSAGES = 5
+        COMPACTION_MIN_AGE_HOURS = 24
+        COMPACTION_CHUNK_MESSAGES = 7
+
+    assert await compact_all(session_factory, CompactionConfig) == {"conversations": 1, "messages": 20}
+    assert await compact_all(session_factory, CompactionConfig) == {"conversations": 0, "messages": 0}
+
+    async with session_factory() as db:
+        assert (await db.execute(select(func.min(Message.seq)))).scalar() == 21
+        chunks = (await db.execute(select(MessageArchive.first_seq, MessageArchive.last_seq).order_by(MessageArchive.first_seq))).all()
+        assert [tuple(chunk) for chunk in chunks] == [(1, 7), (8, 14), (15, 20)]
+
+        async def seqs(**kwargs):
+            page, has_more = await load_history_page(db, conversation_id, **kwargs)
+            return [message["seq"] for message in page], has_more
+
+        assert await seqs(limit=8) == (list(range(23, 31)), True)
+        assert await seqs(limit=8, before=23) == (list(range(15, 23)), True)
+        assert await seqs(limit=8, before=3) == ([1, 2], False)
+        assert await seqs(limit=5, since=10) == (list(range(11, 16)), True)
+        assert await seqs(limit=5, since=18) == (list(range(19, 24)), True)
+        assert await seqs(limit=50, since=0) == (list(range(1, 31)), False)
+
+    await engine.dispose()
@@ -0,0 +1,51 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from benchmarks.harness import percentile
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def test_percentile():
+    """
+    Test the nearest-rank percentile used in benchmark reports.
+
+    Asserts:
+        - Percentiles pick the expected samples and an empty list yields 0.
+    """
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.95) == 7
+    assert percentile([], 0.5) == 0.0
+
+@pytest.mark.benchmark
+def test_benchmark_harness(tmp_path):
+    """
+    Run a small benchmark matrix end to end, in-process and over a real socket.
+
+    Runs in a subprocess so the app is configured with a scratch database and the stub LLM.
+
+    Asserts:
+        - Every scenario and phase is reported, without errors.
+        - Latency percentiles are ordered and DB queries are counted.
+    """
+    output = tmp_path / "benchmark.json"
+    subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.harness",
+            "--users", "4", "--history", "0,50", "--transport", "asgi,uvicorn",
+            "--iterations", "2", "--llm-latency-ms", "5", "--output", str(output),
+        ],
+        cwd=BACKEND_DIR, check=True, timeout=300,
+    )
+    report = json.loads(output.read_text())
+
+    assert len(report["scenarios"]) == 4
+    for scenario in report["scenarios"]:
+        assert set(scenario["phases"]) == {"register", "login", "me", "chat", "history"}
+        for phase in scenario["phases"].values():
+            assert phase["errors"] == 0
+            assert phase["latency_ms"]["p50"] <= phase["latency_ms"]["p95"] <= phase["latency_ms"]["p99"]
+        assert scenario["phases"]["chat"]["db_queries"] > 0
@@ -0,0 +1,145 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.config import Config
+from app.services import llm_cache
+from app.services.llm_cache import (
+    CacheStats, MemoryCacheStore, SQLiteCacheStore, cache_key, cached_query_llm, hamming_distance, simhash,
+)
+
+def prompt(message: str, history=()):
+    """
+    Build a prompt the way build_context does.
+
+    Parameters:
+        message (str): The latest user message.
+        history (tuple): Earlier messages.
+
+    Returns:
+        list: The prompt messages.
+    """
+    return [{"role": "system", "content": "Be helpful."}, *history, {"role": "user", "content": message}]
+
+def test_cache_key_normalization():
+    """
+    Test that the cache key ignores case, whitespace and trailing punctuation but not context.
+
+    Asserts:
+        - Trivially different phrasings share a key.
+        - The same message after a different previous turn, or with a different conversation
+          summary, gets a different key.
+    """
+    assert cache_key(prompt("How do I reset  my router?"))[0] == cache_key(prompt("how do i reset my router"))[0]
+
+    earlier = ({"role": "user", "content": "My printer is jammed"}, {"role": "assistant", "content": "Open the tray."})
+    assert cache_key(prompt("What next?", earlier))[0] != cache_key(prompt("What next?"))[0]
+
+    summary = ({"role": "system", "content": "Summary of the earlier conversation:\nThe printer is jammed."},)
+    assert cache_key(prompt("What next?", summary))[0] != cache_key(prompt("What next?"))[0]
+
+def test_simhash_near_duplicates():
+    """
+    Test that SimHash fingerprints of near-identical messages are close.
+
+    Asserts:
+        - A one-word change gives a much smaller distance than an unrelated message.
+    """
+    base = simhash("how do i reset the wifi router in the server room")
+    near = simhash("how do i reset the wifi router in the server room please")
+    far = simhash("the printer on floor two shows error code 49")
+    assert hamming_distance(base, near) < hamming_distance(base, far)
+
+@pytest.mark.asyncio
+async def test_memory_store_lru_and_ttl():
+    """
+    Test the eviction policy of the in-process store.
+
+    Asserts:
+        - The least recently used entry is evicted when the entry limit is exceeded.
+        - Expired entries are not returned.
+    """
+    stats = CacheStats()
+    store = MemoryCacheStore(max_entries=2, max_bytes=1024, ttl_seconds=60, stats=stats)
+    await store.set("a", "reply a", "bucket", 1)
+    await store.set("b", "reply b", "bucket", 2)
+    assert await store.get("a") == "reply a"
+    await store.set("c", "reply c", "bucket", 3)
+
+    assert await store.get("b") is None
+    assert await store.get("a") == "reply a"
+    assert stats.evictions == 1
+
+    expired = MemoryCacheStore(max_entries=2, max_bytes=1024, ttl_seconds=0, stats=stats)
+    await expired.set("a", "reply a", "bucket", 1)
+    assert await expired.get("a") is None
+
+@pytest.mark.asyncio
+async def test_sqlite_store_shared_between_instances(tmp_path):
+    """
+    Test that the SQLite-backed store is shared between store instances (i.e. workers).
+
+    Asserts:
+        - An entry written by one instance is read by another, exactly and as a near duplicate.
+        - The size limit evicts the least recently used entry.
+    """
+    path = str(tmp_path / "cache.db")
+    writer = SQLiteCacheStore(path, max_entries=2, max_bytes=1024, ttl_seconds=60, stats=CacheStats())
+    reader = SQLiteCacheStore(path, max_entries=2, max_bytes=1024, ttl_seconds=60, stats=CacheStats())
+
+    fingerprint = simhash("reset the router")
+    await writer.set("a", "reply a", "bucket", fingerprint)
+    assert await reader.get("a") == "reply a"
+    assert await reader.find_near("bucket", fingerprint ^ 0b101, 3) == "reply a"
+    assert await reader.find_near("other", fingerprint, 3) is None
+
+    await writer.set("b", "reply b", "bucket", 2)
+    await writer.set("c", "reply c", "bucket", 3)
+    assert await reader.get("a") is None
+
+@pytest.mark.asyncio
+async def test_cached_query_llm():
+    """
+    Test that repeated and near-duplicate questions are answered from the cache.
+
+    Asserts:
+        - The LLM is queried once for an exact repeat and once more for a new question.
+        - A near-duplicate question is served from the cache when enabled.
+        - Hit and miss counters are updated.
+    """
+    store = MemoryCacheStore(max_entries=10, max_bytes=1024, ttl_seconds=60, stats=llm_cache.cache_stats)
+    with patch.object(Config, "LLM_CACHE_ENABLED", True), patch.object(Config, "LLM_CACHE_NEAR_DUPLICATES", True), \
+            patch.object(Config, "LLM_CACHE_SIMHASH_DISTANCE", 6), \
+            patch.object(llm_cache, "_cache_store", store), \
+            patch.object(llm_cache, "cache_stats", CacheStats()) as stats, \
+            patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "Unplug it for ten seconds."
+        assert await cached_query_llm(prompt("How do I reset the router in the lab?")) == "Unplug it for ten seconds."
+        assert await cached_query_llm(prompt("how do I reset the router in the lab")) == "Unplug it for ten seconds."
+        assert mock_llm.await_count == 1
+
+        near = await llm_cache.get_cached_reply(prompt("How do I reset the router in the lab, thanks"))
+        assert near == "Unplug it for ten seconds."
+
+        mock_llm.return_value = "Check the toner."
+        assert await cached_query_llm(prompt("Why are my prints faded?")) == "Check the toner."
+        assert mock_llm.await_count == 2
+
+    assert stats.hits == 1
+    assert stats.near_hits == 1
+    assert stats.misses == 2
+
+@pytest.mark.asyncio
+async def test_placeholder_replies_not_cached():
+    """
+    Test that empty and placeholder replies are not cached.
+
+    Asserts:
+        - The LLM is queried again after an empty reply or the "No response" placeholder.
+    """
+    store = MemoryCacheStore(max_entries=10, max_bytes=1024, ttl_seconds=60, stats=llm_cache.cache_stats)
+    with patch.object(Config, "LLM_CACHE_ENABLED", True), \
+            patch.object(llm_cache, "_cache_store", store), \
+            patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        for reply in ("", llm_cache.NO_RESPONSE_REPLY, llm_cache.NO_RESPONSE_REPLY):
+            mock_llm.return_value = reply
+            assert await cached_query_llm(prompt("Is the printer fixed?")) == reply
+        assert mock_llm.await_count == 3
@@ -1,22 +1,135 @@
+import asyncio
+import uuid
 import pytest
 from unittest.mock import patch
-from app.services.call_service import generate_jitsi_link
+from sqlalchemy import update
+from app.models import User
+from app.services.dispatch_service import DispatchError, TechnicianDispatcher
+
+async def login(client, email: str) -> dict:
+    """
+    Register and log in a user.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+        email (str): The email of the user.
+
+    Returns:
+        dict: The authorization headers of the user.
+    """
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    return {"Authorization": f"Bearer {login_response.json()['access_token']}"}
 
 @pytest.mark.asyncio
-async def test_call_technician(client):
+async def test_call_technician(app, client):
     """
     Test the call-technician API.
 
-    Calls the API to generate a Jitsi Meet link and verifies the response.
+    Queues a call, puts a technician on duty and follows the call until it is completed.
 
     Parameters:
+        app (FastAPI): The test application.
         client (AsyncClient): The test HTTP client.
 
     Asserts:
         - The response status code is 200 (OK).
-        - The response contains a valid Jitsi Meet link.
+        - The response contains a valid Jitsi Meet link and the place of the call in the queue.
+        - A technician going on duty is assigned the waiting call, with the same Jitsi Meet link.
+        - Only technicians can go on duty, only the caller can see the call, and only
+          administrators can read the dispatch counters.
     """
-    response = await client.get("/api/call/call-technician")
+    caller_headers = await login(client, f"caller-{uuid.uuid4().hex}@example.com")
+    response = await client.get("/api/call/call-technician", headers=caller_headers)
     assert response.status_code == 200
-    assert "jitsi_url" in response.json()
-    assert response.json()["jitsi_url"].startswith("https://meet.jit.si/")
+    call = response.json()
+    assert call["jitsi_url"].startswith("https://meet.jit.si/")
+    assert (call["status"], call["position"]) == ("waiting", 1)
+    assert (await client.get("/api/call/call-technician", headers=caller_headers)).json()["call_id"] == call["call_id"]
+
+    technician_email = f"technician-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": technician_email, "password": "testpass"})
+    async with app.state.session_factory() as db:
+        await db.execute(update(User).where(User.username == technician_email).values(tier="technician"))
+        await db.commit()
+    technician_headers = await login(client, technician_email)
+
+    on_duty = (await client.post("/api/call/technicians", headers=technician_headers)).json()
+    assert on_duty["status"] == "on_call"
+    assert on_duty["call"]["jitsi_url"] == call["jitsi_url"]
+
+    assigned = (await client.get(f"/api/call/calls/{call['call_id']}", headers=caller_headers)).json()
+    assert (assigned["status"], assigned["technician"]) == ("assigned", technician_email)
+    assert (await client.get(f"/api/call/calls/{call['call_id']}", headers=technician_headers)).status_code == 404
+    assert (await client.post("/api/call/technicians", headers=caller_headers)).status_code == 403
+    assert (await client.get("/api/call/dispatch/stats", headers=caller_headers)).status_code == 403
+
+    completed = await client.post(f"/api/call/technicians/calls/{call['call_id']}/complete", headers=technician_headers)
+    assert completed.json()["status"] == "free"
+    assert (await client.get(f"/api/call/calls/{call['call_id']}", headers=caller_headers)).status_code == 404
+    assert (await client.delete("/api/call/technicians", headers=technician_headers)).status_code == 200
+
+@pytest.mark.asyncio
+async def test_technician_dispatcher():
+    """
+    Test matching callers with technicians.
+
+    Asserts:
+        - Callers are served in call order, with priority tiers going ahead of recent callers.
+        - Cancelled calls are skipped, and positions and estimated waits follow the queue.
+        - A technician that stops sending heartbeats is taken off duty and their call requeued.
+        - Waiters are woken when the queue changes.
+    """
+    dispatcher = TechnicianDispatcher(["escalated"], 300, 30, 60)
+    with patch("app.services.dispatch_service.time.monotonic", return_value=1000.0):
+        first = dispatcher.request_call(User(id=1, username="first", tier="standard"))
+        second = dispatcher.request_call(User(id=2, username="second", tier="standard"))
+        cancelled = dispatcher.request_call(User(id=3, username="cancelled", tier="standard"))
+        urgent = dispatcher.request_call(User(id=4, username="urgent", tier="escalated"))
+    assert [dispatcher.position(call) for call in (urgent, first, second, cancelled)] == [1, 2, 3, 4]
+    assert dispatcher.eta_seconds(dispatcher.position(first)) is None
+
+    with patch("app.services.dispatch_service.time.monotonic", return_value=1005.0):
+        dispatcher.cancel_call(cancelled)
+    assert dispatcher.waiting == 3
+    with pytest.raises(DispatchError):
+        dispatcher.heartbeat(10)
+
+    waiter = asyncio.create_task(dispatcher.wait_for_change(5))
+    await asyncio.sleep(0)
+    with patch("app.services.dispatch_service.time.monotonic", return_value=1010.0):
+        technician = dispatcher.register_technician(User(id=10, username="technician", tier="technician"))
+    await asyncio.wait_for(waiter, 1)
+    assert (technician.call, urgent.status, urgent.technician) == (urgent, "assigned", technician)
+    assert (dispatcher.position(first), dispatcher.eta_seconds(1), dispatcher.eta_seconds(2)) == (1, 60, 120)
+
+    with patch("app.services.dispatch_service.time.monotonic", return_value=1040.0):
+        dispatcher.complete_call(10, urgent.id)
+    assert (urgent.status, technician.call) == ("completed", first)
+    with pytest.raises(DispatchError):
+        dispatcher.complete_call(10, urgent.id)
+
+    with patch("app.services.dispatch_service.time.monotonic", return_value=1100.0):
+        helper = dispatcher.register_technician(User(id=11, username="helper", tier="technician"))
+    assert 10 not in dispatcher.technicians
+    assert (helper.call, first.technician, dispatcher.position(second)) == (first, helper, 1)
+
+    with patch("app.services.dispatch_service.time.monotonic", return_value=1110.0):
+        dispatcher.complete_call(11, first.id)
+    assert (helper.call, second.status, dispatcher.waiting) == (second, "assigned", 0)
+    assert dispatcher.stats()["requeued"] == 1
+
+def test_cancelled_calls_leave_the_queue():
+    """
+    Test that calls cancelled while no technician is on duty do not pile up in the queue.
+
+    Asserts:
+        - The heap is rebuilt once cancelled calls make up more than half of it.
+        - The remaining caller keeps its place.
+    """
+    dispatcher = TechnicianDispatcher(["escalated"], 300, 30, 60)
+    waiting = dispatcher.request_call(User(id=1, username="waiting", tier="standard"))
+    for user_id in range(2, 102):
+        dispatcher.cancel_call(dispatcher.request_call(User(id=user_id, username=f"user-{user_id}", tier="standard")))
+        assert len(dispatcher._waiting) <= 2
+    assert (dispatcher.waiting, dispatcher.position(waiting), dispatcher.stats()["cancelled"]) == (1, 1, 100)
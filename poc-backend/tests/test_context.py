@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.future import select
+from app.config import Config
+from app.db import Base
+from app.models import Conversation
+from app.services.context_service import build_context, split_history, message_tokens
+from app.services.conversation_service import save_turn
+
+def test_split_history_keeps_recent_messages():
+    """
+    Test that the most recent messages are kept when the history overflows the budget.
+
+    Asserts:
+        - A history that fits is kept whole.
+        - An overflowing history is folded so the kept tail starts with a user message and fits.
+    """
+    history = []
+    for turn in range(10):
+        history.append({"role": "user", "content": f"question {turn} " * 10})
+        history.append({"role": "assistant", "content": f"answer {turn} " * 10})
+    per_message = message_tokens(history[0])
+
+    assert split_history(history[:2], 1000) == (0, False)
+
+    cut, overflowed = split_history(history, per_message * 8)
+    assert overflowed
+    assert history[cut]["role"] == "user"
+    assert sum(message_tokens(message) for message in history[cut:]) <= per_message * 8
+
+@pytest.mark.asyncio
+async def test_build_context_folds_old_turns_into_summary():
+    """
+    Test that old turns are folded into a stored rolling summary once the budget is exceeded.
+
+    Asserts:
+        - The prompt starts with the pinned system prompt and the summary, and ends with the new message.
+        - The prompt and every summarization request stay within the token budget.
+        - The summary and the seq of the last folded message are stored on the conversation.
+        - A later turn reuses the stored summary without summarizing again.
+    """
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    with patch.object(Config, "LLM_CONTEXT_TOKEN_BUDGET", 600), patch.object(Config, "LLM_SUMMARY_TOKEN_BUDGET", 50):
+        async with session_factory() as db:
+            for turn in range(20):
+                await save_turn(db, 1, f"question {turn} " * 10, f"answer {turn} " * 10)
+
+            with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+                mock_llm.return_value = "The user asked many questions."
+                context = await build_context(db, 1, "latest question")
+
+            # The folded backlog is larger than one prompt, so it is summarized in budget-sized chunks
+            assert mock_llm.await_count > 1
+            for call in mock_llm.await_args_list:
+                assert sum(message_tokens(message) for message in call.args[0]) <= 600
+            assert context[0] == {"role": "system", "content": Config.LLM_SYSTEM_PROMPT}
+            assert context[1]["content"].endswith("The user asked many questions.")
+            assert context[-1] == {"role": "user", "content": "latest question"}
+            assert context[2]["role"] == "user"
+            assert sum(message_tokens(message) for message in context) <= 600
+
+            conversation = (await db.execute(select(Conversation).where(Conversation.user_id == 1))).scalars().first()
+            assert conversation.summary == "The user asked many questions."
+            assert 0 < conversation.summary_seq < 40
+
+            with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+                await build_context(db, 1, "another question")
+            mock_llm.assert_not_awaited()
+
+    await engine.dispose()
@@ -0,0 +1,48 @@
+import pytest
+from sqlalchemy import inspect, text
+from app.config import Config
+from app.db import create_engine_from_config, init_db
+
+@pytest.mark.asyncio
+async def test_sqlite_engine_tuning(tmp_path):
+    """
+    Test the engine built from the configuration on a SQLite file.
+
+    Asserts:
+        - WAL journaling, synchronous=NORMAL, the busy timeout and mmap size are applied on connect.
+        - The connection pool uses the configured size.
+        - init_db creates the schema on an empty database, detected through the inspector.
+    """
+    class TuningConfig(Config):
+        DATABASE_URL = f"sqlite+aiosqlite:///{tmp_path / 'tuning.db'}"
+        DB_POOL_SIZE = 3
+        SQLITE_BUSY_TIMEOUT_MS = 1234
+
+    engine = create_engine_from_config(TuningConfig)
+    try:
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 1234
+            assert (await conn.execute(text("PRAGMA mmap_size"))).scalar() == Config.SQLITE_MMAP_SIZE
+        assert engine.sync_engine.pool.size() == 3
+
+        await init_db(engine)
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+        assert {"users", "conversations", "messages"} <= tables
+    finally:
+        await engine.dispose()
+
+def test_in_memory_sqlite_engine():
+    """
+    Test that pool sizing is skipped for in-memory SQLite, which uses a single connection.
+
+    Asserts:
+        - The engine is created without pool size errors.
+    """
+    class MemoryConfig(Config):
+        DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+
+    engine = create_engine_from_config(MemoryConfig)
+    assert engine.url.database == ":memory:"
@@ -0,0 +1,118 @@
+import gzip
+import importlib
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, update
+from app import export
+from app.config import Config
+from app.db import create_engine_from_config, create_session_factory, init_db
+from app.models import Conversation, Message, MessageArchive, User
+from app.services.archive_service import compact_all
+from app.services.conversation_service import load_history_page
+from tests.test_call import login
+
+# "import" is a keyword, so the import CLI cannot be imported with an import statement
+import_cli = importlib.import_module("app.import")
+
+def database_config(path) -> type:
+    class DatabaseConfig(Config):
+        DATABASE_URL = f"sqlite+aiosqlite:///{path}"
+        DB_ECHO = False
+        EXPORT_BATCH_ROWS = 4
+        COMPACTION_KEEP_MESSAGES = 5
+        COMPACTION_MIN_AGE_HOURS = 24
+        COMPACTION_CHUNK_MESSAGES = 7
+
+    return DatabaseConfig
+
+@pytest.mark.asyncio
+async def test_export_import_round_trip(tmp_path):
+    """
+    Test exporting a database with the CLI and importing it into an empty one.
+
+    Asserts:
+        - Users, summaries and messages (archived ones included) are exported in seq order.
+        - The import recreates them, and history reads the same in the new database.
+        - Re-running an interrupted import only adds the missing messages.
+    """
+    source_config, target_config = database_config(tmp_path / "source.db"), database_config(tmp_path / "target.db")
+    engine = create_engine_from_config(source_config)
+    await init_db(engine)
+    session_factory = create_session_factory(engine)
+    old = datetime.utcnow() - timedelta(days=30)
+    async with session_factory() as db:
+        db.add_all([User(username="alice", password_hash="hash-a"), User(username="bob", password_hash="hash-b", tier="escalated")])
+        await db.flush()
+        conversations = [Conversation(user_id=user_id, summary="Earlier", summary_seq=20) for user_id in (1, 2)]
+        db.add_all(conversations)
+        await db.flush()
+        await db.execute(insert(Message), [
+            {"conversation_id": conversation.id, "seq": seq, "role": "user" if seq % 2 else "llm",
+             "content": f"{conversation.user_id}: message {seq}", "created_at": old}
+            for conversation in conversations for seq in range(1, 31 if conversation.user_id == 1 else 4)
+        ])
+        await db.commit()
+    assert (await compact_all(session_factory, source_config))["messages"] == 20
+    await engine.dispose()
+
+    await export.main(str(tmp_path / "export.ndjson.gz"), config=source_config)
+    with gzip.open(tmp_path / "export.ndjson.gz", "rt") as dump:
+        lines = dump.read().splitlines()
+    assert len(lines) == 1 + 2 + 2 + 30 + 3
+    assert lines[1].startswith('{"type":"user","username":"alice"')
+    assert [line[:40] for line in lines[3:5]] == ['{"type":"conversation","username":"alice', '{"type":"message","seq":1,"role":"user",']
+
+    # An import that stopped part-way through alice's messages
+    with open(tmp_path / "partial.ndjson", "w") as partial:
+        partial.write("\n".join(lines[:20]) + "\n")
+    await import_cli.main(str(tmp_path / "partial.ndjson"), config=target_config)
+    await import_cli.main(str(tmp_path / "export.ndjson.gz"), config=target_config)
+
+    engine = create_engine_from_config(target_config)
+    async with create_session_factory(engine)() as db:
+        users = (await db.execute(select(User.username, User.tier, User.password_hash).order_by(User.id))).all()
+        assert [tuple(user) for user in users] == [("alice", "standard", "hash-a"), ("bob", "escalated", "hash-b")]
+        assert (await db.execute(select(func.count()).select_from(Message))).scalar() == 33
+        assert (await db.execute(select(func.count()).select_from(MessageArchive))).scalar() == 0
+        conversation = (await db.execute(select(Conversation).where(Conversation.user_id == 1))).scalar_one()
+        assert (conversation.summary, conversation.summary_seq) == ("Earlier", 20)
+        page, has_more = await load_history_page(db, conversation.id, 3, None, None)
+        assert ([message["content"] for message in page], has_more) == (["1: message 28", "1: message 29", "1: message 30"], True)
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_admin_export_import(app, client):
+    """
+    Test the admin export and import APIs.
+
+    Asserts:
+        - Only users in ADMIN_TIERS can export and import.
+        - The export streams NDJSON, gzipped when the client accepts it.
+        - A gzipped export can be posted back; existing users and messages are skipped.
+        - A body that is not an export is rejected with 400.
+    """
+    user_headers = await login(client, f"user-{uuid.uuid4().hex}@example.com")
+    assert (await client.get("/api/admin/export", headers=user_headers)).status_code == 403
+
+    email = f"admin-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    async with app.state.session_factory() as db:
+        await db.execute(update(User).where(User.username == email).values(tier="admin"))
+        await db.commit()
+    headers = await login(client, email)
+
+    response = await client.get("/api/admin/export", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-encoding"] == "gzip"
+    body = response.text
+    assert body.startswith('{"type":"export","version":1')
+    assert f'"username":"{email}"' in body
+
+    imported = await client.post(
+        "/api/admin/import", content=gzip.compress(body.encode()), headers={**headers, "Content-Encoding": "gzip"}
+    )
+    assert imported.status_code == 200
+    assert (imported.json()["users"], imported.json()["messages"]) == (0, 0)
+    assert (await client.post("/api/admin/import", content=b"not an export\n", headers=headers)).status_code == 400
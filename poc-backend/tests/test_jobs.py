@@ -0,0 +1,113 @@
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from app.config import Config
+from app.db import Base
+from app.models import ChatJob, Message
+from app.services.job_service import JobWorker, claim_job, enqueue_job
+from app.services.resilience import LLMUnavailable
+
+@pytest.mark.asyncio
+async def test_job_queue_claims_and_worker(tmp_path):
+    """
+    Test claiming and running chat jobs.
+
+    Asserts:
+        - Jobs are claimed one at a time per user, in submission order.
+        - A running job whose lease expired is claimed again.
+        - A worker writes the turn and the reply together, and queues the job again when the
+          LLM is unavailable.
+        - A job the provider rejects with a non-retryable error fails at once.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        first = await enqueue_job(db, 1, "first question")
+        second = await enqueue_job(db, 1, "second question")
+        other = await enqueue_job(db, 2, "other question")
+
+        assert (await claim_job(db, "a", 60, 3)).id == first.id
+        claimed_other = await claim_job(db, "b", 60, 3)
+        assert claimed_other.id == other.id
+        assert await claim_job(db, "b", 60, 3) is None
+
+        await db.execute(update(ChatJob).where(ChatJob.id == first.id).values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        await db.commit()
+        reclaimed = await claim_job(db, "b", 60, 3)
+        assert (reclaimed.id, reclaimed.attempts, reclaimed.worker_id) == (first.id, 2, "b")
+
+    class WorkerConfig(Config):
+        JOB_WORKER_CONCURRENCY = 1
+        JOB_MAX_ATTEMPTS = 3
+
+    worker = JobWorker(session_factory, "worker", WorkerConfig)
+    with patch("app.services.job_service.cached_query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "first answer"
+        await worker.run_job(reclaimed)
+        mock_llm.side_effect = LLMUnavailable(503, 0, "The LLM provider is unavailable, please try again")
+        assert await worker.process_next()
+        mock_llm.side_effect = LLMUnavailable(502, None, "The LLM provider rejected the request")
+        await worker.run_job(claimed_other)
+
+    async with session_factory() as db:
+        jobs = {job.id: job for job in (await db.execute(select(ChatJob))).scalars()}
+        assert (jobs[first.id].status, jobs[first.id].reply, jobs[first.id].reply_seq) == ("done", "first answer", 2)
+        assert (jobs[second.id].status, jobs[second.id].attempts) == ("queued", 1)
+        assert (jobs[other.id].status, jobs[other.id].error) == ("failed", "The LLM provider rejected the request")
+        messages = (await db.execute(select(Message.content).order_by(Message.conversation_id, Message.seq))).scalars().all()
+        assert messages == ["first question", "first answer"]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_job_api(app, client):
+    """
+    Test submitting a chat job and following it to completion.
+
+    Parameters:
+        app (FastAPI): The test application.
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - Submitting a job returns 202 with its location.
+        - Once a worker ran it, the job carries the reply, and its events end with "done".
+        - Other users cannot see the job.
+    """
+    email = f"jobs-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    response = await client.post("/api/llm/jobs", json={"message": "Is the lab printer fixed?"}, headers=headers)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued"
+    assert response.headers["Location"] == f"/api/llm/jobs/{job['id']}"
+
+    worker = JobWorker(app.state.session_factory, "test-worker", app.state.config)
+    with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "Yes, it was repaired."
+        while await worker.process_next():
+            pass
+
+    finished = (await client.get(f"/api/llm/jobs/{job['id']}", headers=headers)).json()
+    assert (finished["status"], finished["reply"]) == ("done", "Yes, it was repaired.")
+
+    events = await client.get(f"/api/llm/jobs/{job['id']}/events", headers=headers)
+    assert events.text.startswith("event: done\n")
+
+    history = (await client.get("/api/llm/history", headers=headers)).json()["history"]
+    assert [message["content"] for message in history] == ["Is the lab printer fixed?", "Yes, it was repaired."]
+
+    other_email = f"jobs-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": other_email, "password": "testpass"})
+    other_login = await client.post("/api/auth/login", json={"emailId": other_email, "password": "testpass"})
+    other_headers = {"Authorization": f"Bearer {other_login.json()['access_token']}"}
+    assert (await client.get(f"/api/llm/jobs/{job['id']}", headers=other_headers)).status_code == 404
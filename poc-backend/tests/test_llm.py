@@ -1,5 +1,10 @@
+import asyncio
+import uuid
 import pytest
 from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from app.services import quota
 
 @pytest.mark.asyncio
 async def test_llm_chat(client):
@@ -32,3 +37,255 @@ async def test_llm_chat(client):
 
     assert response.status_code == 200
     assert response.json()["reply"] == "Hello, how can I help you?"
+
+async def fake_stream_llm(conversation_history):
+    """
+    Stand-in for llm_service.stream_llm that yields a fixed reply in chunks.
+
+    Parameters:
+        conversation_history (list): The conversation history (ignored).
+
+    Yields:
+        str: The next chunk of the reply.
+    """
+    for chunk in ["Hello", ", how can", " I help you?"]:
+        yield chunk
+
+@pytest.mark.asyncio
+async def test_llm_chat_stream(client):
+    """
+    Test streaming a chat reply from the LLM API as server-sent events.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - The response status code is 200 (OK) with an event-stream content type.
+        - Every chunk is forwarded as a "token" event.
+        - A final "done" event carries the assembled reply.
+    """
+    await client.post("/api/auth/register", json={"emailId": "testuser@example.com", "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": "testuser@example.com", "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    with patch("app.services.llm_service.stream_llm", new=fake_stream_llm):
+        response = await client.post("/api/llm/stream", json={"message": "Hello"}, headers=headers)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block for block in response.text.split("\n\n") if block]
+    assert events[:3] == [
+        'event: token\ndata: {"content":"Hello"}',
+        'event: token\ndata: {"content":", how can"}',
+        'event: token\ndata: {"content":" I help you?"}',
+    ]
+    assert events[-1] == 'event: done\ndata: {"reply":"Hello, how can I help you?"}'
+
+def test_llm_chat_websocket(app):
+    """
+    Test streaming a chat reply from the LLM API over a WebSocket.
+
+    Parameters:
+        app (FastAPI): The test application.
+
+    Asserts:
+        - A connection without a valid token is rejected.
+        - Every chunk is sent as a "token" frame, followed by a "done" frame with the full reply.
+    """
+    test_client = TestClient(app)
+    test_client.post("/api/auth/register", json={"emailId": "testuser@example.com", "password": "testpass"})
+    token = test_client.post("/api/auth/login", json={"emailId": "testuser@example.com", "password": "testpass"}).json()["access_token"]
+
+    with pytest.raises(WebSocketDisconnect):
+        with test_client.websocket_connect("/api/llm/ws?token=invalid") as websocket:
+            websocket.receive_json()
+
+    with patch("app.services.llm_service.stream_llm", new=fake_stream_llm):
+        with test_client.websocket_connect(f"/api/llm/ws?token={token}") as websocket:
+            websocket.send_json({"message": "Hello"})
+            frames = [websocket.receive_json() for _ in range(4)]
+
+    assert [frame["type"] for frame in frames] == ["token", "token", "token", "done"]
+    assert frames[-1]["reply"] == "Hello, how can I help you?"
+
+@pytest.mark.asyncio
+async def test_history_pagination(client):
+    """
+    Test cursor pagination and conditional requests on the history API.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - Pages are returned newest-first with a "next_before" cursor, in chronological order.
+        - A matching If-None-Match header gets a 304 (Not Modified).
+        - "since" returns only the messages added after a previous response.
+    """
+    email = f"history-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        for turn in range(3):
+            mock_llm.return_value = f"reply {turn}"
+            await client.post("/api/llm/", json={"message": f"question {turn}"}, headers=headers)
+
+    response = await client.get("/api/llm/history?limit=4", headers=headers)
+    assert response.status_code == 200
+    page = response.json()
+    assert [message["content"] for message in page["history"]] == ["question 1", "reply 1", "question 2", "reply 2"]
+    assert page["next_before"] == 3
+    assert page["last_seq"] == 6
+
+    older = (await client.get(f"/api/llm/history?limit=4&before={page['next_before']}", headers=headers)).json()
+    assert [message["seq"] for message in older["history"]] == [1, 2]
+    assert older["next_before"] is None
+
+    not_modified = await client.get("/api/llm/history?limit=4", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert not_modified.status_code == 304
+
+    with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "reply 3"
+        await client.post("/api/llm/", json={"message": "question 3"}, headers=headers)
+
+    changed = await client.get("/api/llm/history?limit=4", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert changed.status_code == 200
+
+    newer = (await client.get(f"/api/llm/history?since={page['last_seq']}", headers=headers)).json()
+    assert [message["content"] for message in newer["history"]] == ["question 3", "reply 3"]
+
+@pytest.mark.asyncio
+async def test_response_compression(client):
+    """
+    Test compressing responses as negotiated with the Accept-Encoding header.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - A large history page is gzip-compressed for a client accepting gzip.
+        - It is sent uncompressed to a client that does not, and small responses are never
+          compressed.
+    """
+    email = f"compression-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "Restart the router, then check the cables. " * 50
+        await client.post("/api/llm/", json={"message": "My internet is down"}, headers=headers)
+
+    compressed = await client.get("/api/llm/history", headers={**headers, "Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert compressed.json()["history"][1]["content"] == mock_llm.return_value
+
+    identity = await client.get("/api/llm/history", headers={**headers, "Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+    assert identity.json() == compressed.json()
+
+    small = await client.get("/api/llm/history?limit=1&before=2", headers={**headers, "Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+@pytest.mark.asyncio
+async def test_idempotency_key(client):
+    """
+    Test retrying chat requests with an Idempotency-Key header.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - A retry of a completed request replays the reply without another LLM call or turn.
+        - Concurrent requests with the same key share one LLM call.
+        - A key reused for a different message is rejected with 422.
+        - The streaming endpoint replays the reply as a single token.
+    """
+    email = f"idempotency-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}", "Idempotency-Key": "turn-1"}
+
+    async def slow_reply(conversation_history):
+        await asyncio.sleep(0.05)
+        return "Restart the router."
+
+    with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.side_effect = slow_reply
+        first, second = await asyncio.gather(
+            client.post("/api/llm/", json={"message": "My wifi is down"}, headers=headers),
+            client.post("/api/llm/", json={"message": "My wifi is down"}, headers=headers),
+        )
+        retry = await client.post("/api/llm/", json={"message": "My wifi is down"}, headers=headers)
+        assert mock_llm.await_count == 1
+
+    assert first.json() == second.json() == retry.json() == {"reply": "Restart the router."}
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    reused = await client.post("/api/llm/", json={"message": "Something else"}, headers=headers)
+    assert reused.status_code == 422
+
+    streamed = await client.post("/api/llm/stream", json={"message": "My wifi is down"}, headers=headers)
+    assert streamed.headers["Idempotent-Replayed"] == "true"
+    assert streamed.text.startswith('event: token\ndata: {"content":"Restart the router."}')
+
+    history = (await client.get("/api/llm/history", headers=headers)).json()["history"]
+    assert [message["content"] for message in history] == ["My wifi is down", "Restart the router."]
+
+@pytest.mark.asyncio
+async def test_quota_and_usage(client):
+    """
+    Test per-user quotas and LLM usage accounting.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - Every turn records its prompt and completion tokens.
+        - Requests over the quota get a 429 with Retry-After, on both the chat and stream APIs.
+        - A refused request does not keep its Idempotency-Key, and replays of completed
+          requests are served without using the quota.
+    """
+    email = f"quota-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    store = quota.MemoryQuotaStore(quota.TokenBuckets(2, 100000, 86400))
+    with patch.object(quota, "_quota_store", store), \
+            patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "Please restart the router."
+        for turn in range(2):
+            response = await client.post(
+                "/api/llm/", json={"message": f"question {turn}"}, headers={**headers, "Idempotency-Key": f"turn-{turn}"}
+            )
+            assert response.status_code == 200
+
+        rejected = await client.post("/api/llm/", json={"message": "question 2"}, headers=headers)
+        assert rejected.status_code == 429
+        assert int(rejected.headers["Retry-After"]) >= 1
+        rejected_stream = await client.post("/api/llm/stream", json={"message": "question 2"}, headers=headers)
+        assert rejected_stream.status_code == 429
+        for attempt in range(2):
+            rejected_key = await client.post(
+                "/api/llm/", json={"message": "question 2"}, headers={**headers, "Idempotency-Key": "turn-2"}
+            )
+            assert rejected_key.status_code == 429
+
+        # Retries of completed requests replay the stored reply without using the quota
+        replayed = await client.post("/api/llm/", json={"message": "question 1"}, headers={**headers, "Idempotency-Key": "turn-1"})
+        assert (replayed.status_code, replayed.headers["Idempotent-Replayed"]) == (200, "true")
+        replayed_stream = await client.post(
+            "/api/llm/stream", json={"message": "question 1"}, headers={**headers, "Idempotency-Key": "turn-1"}
+        )
+        assert replayed_stream.status_code == 200
+        assert "Please restart the router." in replayed_stream.text
+        assert mock_llm.await_count == 2
+
+        usage = (await client.get("/api/llm/usage", headers=headers)).json()
+    assert usage["turns"] == 2
+    assert usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+    assert usage["quota"]["requests_remaining"] == 0
+    assert 100000 - usage["prompt_tokens"] - usage["completion_tokens"] <= usage["quota"]["tokens_remaining"] < 100000
@@ -0,0 +1,108 @@
+import asyncio
+import uuid
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from starlette.routing import Route
+from app.db import Base
+from app.metrics import Registry, _route_template, db_pool_wait_seconds, instrument_engine
+from app.models import User
+
+def test_metrics_exposition_format():
+    """
+    Test the Prometheus text rendering of counters, gauges and histograms.
+
+    Asserts:
+        - Counters and gauges render one sample per label set, with HELP and TYPE lines.
+        - Histogram buckets are cumulative and end with +Inf, _count and _sum.
+        - Callback metrics read their values at render time.
+    """
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+    state = {"value": 1}
+    registry.gauge("queue_depth", "Queue depth.", callback=lambda: {(): state["value"]})
+
+    requests.inc(route="/a")
+    requests.inc(2, route="/a")
+    latency.observe(0.05, route="/a")
+    latency.observe(0.5, route="/a")
+    latency.observe(5, route="/a")
+    state["value"] = 7
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/a"} 3' in lines
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{route="/a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{route="/a"} 3' in lines
+    assert 'latency_seconds_sum{route="/a"} 5.55' in lines
+    assert "queue_depth 7" in lines
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    """
+    Test that requests are recorded and exposed at /metrics.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - Requests are counted per route template and status code.
+        - Per-request database statement counts and pool waits are recorded.
+    """
+    email = f"metrics-{uuid.uuid4().hex[:8]}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+    await client.get("/api/llm/history", headers=headers)
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_requests_total{method="POST",route="/api/auth/login",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/llm/history",le="+Inf"}' in body
+    assert 'db_queries_per_request_count{route="/api/llm/history"}' in body
+    assert "db_pool_wait_seconds_count" in body
+    assert "llm_admission_calls" in body
+
+def test_route_template():
+    """
+    Test the route label of handled requests.
+
+    Asserts:
+        - The label is the matched route's path template, even when a parameter value is
+          the same as a literal segment or contains slashes.
+        - Requests that matched no route are labelled "unmatched".
+    """
+    route = Route("/api/items/{name:path}", lambda request: None)
+    assert _route_template({"route": route, "path": "/api/items/items"}) == "/api/items/{name:path}"
+    assert _route_template({"route": route, "path": "/api/items/a/b"}) == "/api/items/{name:path}"
+    # A route of a router included with the "/api" prefix
+    route = Route("/items/{name}", lambda request: None)
+    assert _route_template({"route": route, "path": "/api/items/items"}) == "/api/items/{name}"
+    assert _route_template({"path": "/missing"}) == "unmatched"
+
+@pytest.mark.asyncio
+async def test_pool_wait_excludes_session_work():
+    """
+    Test that db_pool_wait_seconds times the connection checkout only.
+
+    Asserts:
+        - A session that waits between add() and commit() records one short checkout.
+    """
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    instrument_engine(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    count, total = db_pool_wait_seconds.count(), db_pool_wait_seconds.total()
+
+    async with AsyncSession(engine) as db:
+        db.add(User(username=f"pool-{uuid.uuid4().hex[:8]}@example.com", password_hash="hash"))
+        await asyncio.sleep(0.2)
+        await db.commit()
+
+    assert db_pool_wait_seconds.count() == count + 1
+    assert db_pool_wait_seconds.total() - total < 0.1
+    await engine.dispose()
@@ -0,0 +1,68 @@
+import json
+from sqlalchemy import create_engine, inspect, text
+from app.db import Base
+from app.migrations import LEGACY_BLOBS_TABLE, run_migrations
+
+def test_explode_conversation_blobs():
+    """
+    Test migrating a legacy database that stores each conversation as one JSON blob.
+
+    Asserts:
+        - Every message of the blob becomes one row in the messages table, in order.
+        - The legacy 'messages' column is dropped from 'conversations', and the blobs are
+          kept in the legacy blobs table.
+        - The index on conversations.user_id is created.
+    """
+    engine = create_engine("sqlite://")
+    history = [
+        {"role": "user", "content": "My printer is jammed"},
+        {"role": "llm", "content": "Open the rear tray."},
+        {"role": "user", "content": "Thanks"},
+    ]
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE conversations (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, messages JSON NOT NULL)"))
+        conn.execute(text("INSERT INTO conversations (id, user_id, messages) VALUES (7, 3, :messages)"), {"messages": json.dumps(history)})
+        Base.metadata.create_all(conn)
+        run_migrations(conn)
+
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT conversation_id, seq, role, content FROM messages ORDER BY seq")).all()
+        blobs = conn.execute(text(f"SELECT conversation_id, messages FROM {LEGACY_BLOBS_TABLE}")).all()
+        inspector = inspect(conn)
+        columns = {column["name"] for column in inspector.get_columns("conversations")}
+        indexes = {index["name"] for index in inspector.get_indexes("conversations")}
+
+    assert [(row.conversation_id, row.seq, row.role, row.content) for row in rows] == [
+        (7, 1, "user", "My printer is jammed"),
+        (7, 2, "llm", "Open the rear tray."),
+        (7, 3, "user", "Thanks"),
+    ]
+    assert "messages" not in columns
+    assert [(conversation_id, json.loads(blob)) for conversation_id, blob in blobs] == [(7, history)]
+    assert "ix_conversations_user_id" in indexes
+
+    # Running the migrations again is a no-op
+    with engine.begin() as conn:
+        run_migrations(conn)
+
+def test_conversation_user_index_made_unique():
+    """
+    Test upgrading the index on conversations.user_id to a unique one.
+
+    Asserts:
+        - The non-unique index of an older database is replaced with a unique one.
+        - While users have duplicate conversations the index is left as it is.
+    """
+    for user_ids, unique in (((1, 2), True), ((1, 1), False)):
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE conversations (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL)"))
+            conn.execute(text("CREATE INDEX ix_conversations_user_id ON conversations (user_id)"))
+            for user_id in user_ids:
+                conn.execute(text("INSERT INTO conversations (user_id) VALUES (:user_id)"), {"user_id": user_id})
+            Base.metadata.create_all(conn)
+            run_migrations(conn)
+
+        with engine.connect() as conn:
+            indexes = {index["name"]: bool(index["unique"]) for index in inspect(conn).get_indexes("conversations")}
+        assert indexes["ix_conversations_user_id"] is unique
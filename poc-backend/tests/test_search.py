@@ -0,0 +1,116 @@
+import uuid
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, patch
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.db import Base
+from app.migrations import run_migrations
+from app.models import Conversation, Message, MessageArchive
+from app.services.archive_service import compress_messages
+from app.services.search_service import highlight, search_messages, to_fts_query
+
+def test_query_and_snippet_escaping():
+    """
+    Test turning user input into a search query and highlighting results safely.
+
+    Asserts:
+        - Words are quoted so FTS operators typed by the user are plain text; the last word is a prefix.
+        - Input without words gives no query.
+        - Snippets are HTML-escaped and matches are wrapped in <mark> tags.
+    """
+    assert to_fts_query('printer OR "jam') == '"printer" "or" "jam"*'
+    assert to_fts_query("  *() ") is None
+    assert highlight("<b>\x02printer\x03</b>") == "&lt;b&gt;<mark>printer</mark>&lt;/b&gt;"
+
+@pytest.mark.asyncio
+async def test_search_index_covers_new_and_archived_messages(tmp_path):
+    """
+    Test the search index on an existing database holding live and archived messages.
+
+    Asserts:
+        - Messages present before the index existed, including archived ones, are backfilled.
+        - Messages inserted afterwards are indexed by the trigger.
+        - Results are scoped to one conversation, ranked, stemmed and paginated.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'search.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        mine, other = Conversation(user_id=1), Conversation(user_id=2)
+        db.add_all([mine, other])
+        await db.flush()
+        codec, payload = compress_messages([
+            {"seq": 1, "role": "user", "content": "The printer is jammed again", "created_at": datetime(2024, 1, 1)},
+            {"seq": 2, "role": "llm", "content": "Open the rear tray.", "created_at": datetime(2024, 1, 1)},
+        ])
+        db.add(MessageArchive(
+            conversation_id=mine.id, first_seq=1, last_seq=2, message_count=2, codec=codec, payload=payload
+        ))
+        await db.execute(insert(Message), [
+            {"conversation_id": mine.id, "seq": 3, "role": "user", "content": "Printer printer jams every morning"},
+            {"conversation_id": other.id, "seq": 1, "role": "user", "content": "My printer jammed too"},
+        ])
+        await db.commit()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(run_migrations)
+
+    async with session_factory() as db:
+        await db.execute(insert(Message), [{"conversation_id": mine.id, "seq": 4, "role": "llm", "content": "A technician will fix the printer"}])
+        await db.commit()
+
+        results = await search_messages(db, mine.id, "printer", limit=10)
+        assert sorted(result["seq"] for result in results) == [1, 3, 4]
+        assert results[0]["seq"] == 3
+        assert results[0]["snippet"] == "<mark>Printer</mark> <mark>printer</mark> jams every morning"
+
+        # Stemming matches "jammed" and "jams"; the last word is matched as a prefix
+        assert sorted(result["seq"] for result in await search_messages(db, mine.id, "jam printe", limit=10)) == [1, 3]
+        assert await search_messages(db, mine.id, "scanner", limit=10) == []
+
+        first_page = await search_messages(db, mine.id, "printer", limit=2)
+        second_page = await search_messages(db, mine.id, "printer", limit=2, offset=2)
+        assert [result["seq"] for result in first_page + second_page] == [result["seq"] for result in results]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_search_endpoint(client):
+    """
+    Test the search API.
+
+    Parameters:
+        client (AsyncClient): The test HTTP client.
+
+    Asserts:
+        - Users find their own messages right after chatting, with highlighted snippets.
+        - "next_offset" pages through the results.
+        - Other users' messages are never returned.
+    """
+    email = f"search-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": email, "password": "testpass"})
+    login_response = await client.post("/api/auth/login", json={"emailId": email, "password": "testpass"})
+    headers = {"Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    with patch("app.services.llm_service.query_llm", new_callable=AsyncMock) as mock_llm:
+        mock_llm.return_value = "Try restarting the router"
+        await client.post("/api/llm/", json={"message": "My router keeps dropping wifi"}, headers=headers)
+
+    response = await client.get("/api/llm/search?q=router&limit=1", headers=headers)
+    assert response.status_code == 200
+    page = response.json()
+    assert len(page["results"]) == 1 and page["next_offset"] == 1
+    assert "<mark>router</mark>" in page["results"][0]["snippet"]
+
+    next_page = (await client.get(f"/api/llm/search?q=router&limit=1&offset={page['next_offset']}", headers=headers)).json()
+    assert len(next_page["results"]) == 1 and next_page["next_offset"] is None
+    assert {page["results"][0]["seq"], next_page["results"][0]["seq"]} == {1, 2}
+
+    other_email = f"search-{uuid.uuid4().hex}@example.com"
+    await client.post("/api/auth/register", json={"emailId": other_email, "password": "testpass"})
+    other_login = await client.post("/api/auth/login", json={"emailId": other_email, "password": "testpass"})
+    other_headers = {"Authorization": f"Bearer {other_login.json()['access_token']}"}
+    assert (await client.get("/api/llm/search?q=router", headers=other_headers)).json() == {"results": [], "next_offset": None}
@@ -1,6 +1,27 @@
+import asyncio
+import httpx
 import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from app.config import Config
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.db import Base
+from app.models import User
+from app.dependencies import (
+    hash_password_async, verify_password_async, create_access_token, authenticate_token, get_current_principal,
+)
+from app.services.principal_cache import principal_cache
+from app.services import chat_service, idempotency
+from app.services.admission import AdmissionController, AdmissionRejected, llm_priority
+from app.services.singleflight import TurnCoordinator
+from app.compression import choose_encoding
+from app.serialization import json_dumps, json_loads
 from app.services.call_service import generate_jitsi_link
-from app.services.llm_service import query_llm
+from app.services.llm_backends import NO_RESPONSE_REPLY, HuggingFaceBackend, LLMBackend, StubBackend, create_llm_backend
+from app.services.resilience import CircuitBreaker, LLMResilience, LLMUnavailable
+from app.services.quota import MemoryQuotaStore, SQLiteQuotaStore, TokenBuckets
+from app.services.llm_service import query_llm, stream_llm, init_llm_backend, close_llm_backend, get_llm_backend
 from unittest.mock import AsyncMock, patch
 
 def test_generate_jitsi_link():
@@ -23,8 +44,484 @@ async def test_query_llm():
     Asserts:
         - The function correctly returns the mock AI response.
     """
+    mock_response = httpx.Response(
+        200,
+        json={"choices": [{"message": {"role": "assistant", "content": "Hello! How can I help you today?"}}]},
+        request=httpx.Request("POST", "https://router.huggingface.co/v1/chat/completions"),
+    )
     with patch("httpx.AsyncClient.post", new_callable=AsyncMock) as mock_post:
-        mock_post.return_value.json.return_value = [{"generated_text": "Hello! How can I help you today?"}]
+        mock_post.return_value = mock_response
         response = await query_llm([{"role": "user", "content": "Hello. Please say Hello! How can I help you today?"}])
 
-    assert response == "Hello! How can I help you today?"
\ No newline at end of file
+    assert response == "Hello! How can I help you today?"
+
+@pytest.mark.asyncio
+async def test_completion_without_content():
+    """
+    Test completions whose message has no text (e.g. refusals or tool calls).
+
+    Asserts:
+        - A message without content, or with null content, gives the no-response reply.
+    """
+    for message in ({"role": "assistant"}, {"role": "assistant", "content": None}):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"choices": [{"message": message}]}))
+        async with httpx.AsyncClient(transport=transport) as mock_client:
+            reply = await HuggingFaceBackend(client=mock_client).complete([{"role": "user", "content": "Hi"}])
+        assert reply == NO_RESPONSE_REPLY
+
+@pytest.mark.asyncio
+async def test_llm_backend_lifecycle():
+    """
+    Test that the shared LLM backend and its HTTP client are reused and closed at shutdown.
+
+    Asserts:
+        - Repeated lookups return the same backend and pooled client.
+        - Closing the backend closes its client so a fresh backend is created next time.
+    """
+    with patch.object(Config, "LLM_BACKEND", "huggingface"):
+        await close_llm_backend()
+        await init_llm_backend()
+        backend = get_llm_backend()
+        client = backend.client
+        assert get_llm_backend() is backend
+        assert backend.client is client
+
+        await close_llm_backend()
+        assert client.is_closed
+        assert get_llm_backend() is not backend
+        await close_llm_backend()
+
+@pytest.mark.asyncio
+async def test_stream_llm():
+    """
+    Test that `stream_llm` yields the content of each server-sent completion chunk.
+
+    Asserts:
+        - Chunks are yielded in order, empty deltas are skipped and "[DONE]" ends the stream.
+    """
+    body = (
+        'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": "Hello"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": " there"}}]}\n\n'
+        "data: [DONE]\n\n"
+    )
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, text=body))
+    async with httpx.AsyncClient(transport=transport) as mock_client:
+        with patch("app.services.llm_service.get_llm_backend", return_value=HuggingFaceBackend(client=mock_client)):
+            chunks = [chunk async for chunk in stream_llm([{"role": "user", "content": "Hi"}])]
+
+    assert chunks == ["Hello", " there"]
+
+@pytest.mark.asyncio
+async def test_stub_backend():
+    """
+    Test the local stub LLM backend.
+
+    Asserts:
+        - Backends are selected by name and unknown names are rejected.
+        - A backend missing one of the interface methods cannot be created.
+        - Replies are deterministic for a conversation and streamed token by token.
+        - Injected failures surface as HTTP status errors.
+    """
+    assert isinstance(create_llm_backend("stub"), StubBackend)
+    with pytest.raises(ValueError):
+        create_llm_backend("nope")
+
+    class CompleteOnlyBackend(LLMBackend):
+        async def complete(self, messages):
+            return "reply"
+
+    with pytest.raises(TypeError):
+        CompleteOnlyBackend()
+
+    messages = [{"role": "user", "content": "My router keeps rebooting"}]
+    backend = StubBackend(latency_ms=1, latency_distribution="constant", tokens_per_second=0, reply_tokens=5)
+    reply = await backend.complete(messages)
+    chunks = [chunk async for chunk in backend.stream(messages)]
+    assert len(chunks) == 5
+    assert "".join(chunks) == reply
+    assert await StubBackend(latency_ms=0, tokens_per_second=0, reply_tokens=5).complete(messages) == reply
+
+    delays = [StubBackend(latency_ms=100, seed=seed).first_token_delay() for seed in range(200)]
+    assert 0.07 < sum(delays) / len(delays) < 0.13
+
+    failing = StubBackend(latency_ms=0, failure_rate=1.0, failure_status=429)
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        await failing.complete(messages)
+    assert error.value.response.status_code == 429
+
+@pytest.mark.asyncio
+async def test_password_hashing_off_event_loop():
+    """
+    Test hashing and verifying passwords on the hashing thread pool.
+
+    Asserts:
+        - A hashed password verifies, and a wrong password does not.
+        - A hash made with a different bcrypt cost is replaced on successful verification.
+    """
+    with patch("app.dependencies.pwd_context", CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=4)):
+        hashed = await hash_password_async("testpass")
+        assert await verify_password_async("testpass", hashed) == (True, None)
+        assert (await verify_password_async("wrongpass", hashed))[0] is False
+
+        outdated = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash("testpass")
+        valid, new_hash = await verify_password_async("testpass", outdated)
+        assert valid
+        assert new_hash.startswith("$2b$04$")
+
+@pytest.mark.asyncio
+async def test_password_hashing_queue_timeout():
+    """
+    Test that password hashing is refused when all hashing slots stay busy.
+
+    Asserts:
+        - An HTTPException with status 503 and a Retry-After header is raised.
+    """
+    with patch("app.dependencies.password_hash_slots", asyncio.Semaphore(0)), \
+            patch.object(Config, "PASSWORD_HASH_QUEUE_TIMEOUT_SECONDS", 0.01):
+        with pytest.raises(HTTPException) as error:
+            await hash_password_async("testpass")
+
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "1"
+
+@pytest.mark.asyncio
+async def test_principal_cache():
+    """
+    Test that authenticated users are cached and dropped when their password changes.
+
+    Asserts:
+        - The second authentication with the same token does not query the database.
+        - Changing the user's password hash removes the cached entry.
+        - With AUTH_TRUST_TOKEN_CLAIMS, read-only routes build the user from the token alone.
+    """
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        user = User(username="cached@example.com", password_hash="hash")
+        db.add(user)
+        await db.commit()
+        token = create_access_token(data={"sub": str(user.id), "username": user.username})
+        principal_cache.invalidate(user.id)
+
+        with patch.object(db, "execute", wraps=db.execute) as execute:
+            assert (await authenticate_token(token, db)).username == "cached@example.com"
+            assert (await authenticate_token(token, db)).username == "cached@example.com"
+        assert execute.await_count == 1
+
+        user.password_hash = "new hash"
+        await db.commit()
+        assert principal_cache.get(user.id) is None
+
+        mock_db = AsyncMock()
+        with patch.object(Config, "AUTH_TRUST_TOKEN_CLAIMS", True):
+            principal = await get_current_principal(token, mock_db)
+        assert (principal.id, principal.username) == (user.id, "cached@example.com")
+        mock_db.execute.assert_not_awaited()
+
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_turn_coordinator_coalesces_and_orders_turns():
+    """
+    Test per-user single-flight handling of chat turns.
+
+    Asserts:
+        - Identical concurrent requests share one execution and its reply.
+        - Distinct concurrent turns of the same user run one at a time, in arrival order.
+        - Turns of different users run concurrently.
+        - Contention is reflected in the counters.
+    """
+    coordinator = TurnCoordinator()
+    events = []
+
+    def make_turn(name: str, delay: float):
+        async def execute():
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+            return f"reply to {name}"
+        return execute
+
+    results = await asyncio.gather(
+        coordinator.run(1, "Hello", make_turn("first", 0.05)),
+        coordinator.run(1, "hello ", make_turn("duplicate", 0.05)),
+        coordinator.run(1, "Second question", make_turn("second", 0.01)),
+        coordinator.run(2, "Hello", make_turn("other user", 0.01)),
+    )
+
+    assert results == ["reply to first", "reply to first", "reply to second", "reply to other user"]
+    assert "start duplicate" not in events
+    assert events.index("end first") < events.index("start second")
+    assert events.index("start other user") < events.index("end first")
+    assert coordinator.stats() == {"coalesced": 1, "queued": 1, "waiting": 0, "in_flight": 0}
+
+@pytest.mark.asyncio
+async def test_admission_control():
+    """
+    Test the LLM admission controller.
+
+    Asserts:
+        - No more than max_concurrent calls run at once.
+        - Waiting priority calls are admitted before calls that queued earlier.
+        - A call finding the queue full is rejected with 429 and a Retry-After estimate.
+        - A call not admitted before the queue timeout is rejected with 503.
+    """
+    controller = AdmissionController(max_concurrent=1, max_queue=2, queue_timeout=1)
+    order = []
+    release = asyncio.Event()
+
+    async def call(name: str, priority: bool = False):
+        async with controller.admit(priority=priority):
+            order.append(name)
+            assert controller.active == 1
+            await release.wait()
+
+    first = asyncio.create_task(call("first"))
+    await asyncio.sleep(0)
+    normal = asyncio.create_task(call("normal"))
+    await asyncio.sleep(0)
+    priority = asyncio.create_task(call("priority", priority=True))
+    await asyncio.sleep(0)
+    assert controller.stats()["queued"] == 1
+    assert controller.stats()["priority_queued"] == 1
+
+    with pytest.raises(AdmissionRejected) as error:
+        await call("rejected")
+    assert error.value.status_code == 429
+    assert error.value.retry_after >= 1
+
+    release.set()
+    await asyncio.gather(first, normal, priority)
+    assert order == ["first", "priority", "normal"]
+    assert controller.active == 0
+
+    controller.queue_timeout = 0.01
+    release.clear()
+    blocker = asyncio.create_task(call("blocker"))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejected) as error:
+        await call("late")
+    assert error.value.status_code == 503
+    assert controller.queued == 0
+    release.set()
+    await blocker
+
+    stats = controller.stats()
+    assert (stats["admitted"], stats["rejected_queue_full"], stats["rejected_timeout"]) == (4, 1, 1)
+
+class ScriptedBackend(StubBackend):
+    """
+    Stub backend whose calls fail with the given HTTP status codes before succeeding.
+    """
+
+    def __init__(self, failures: list, latency_ms: float = 0):
+        super().__init__(latency_ms=latency_ms, latency_distribution="constant", tokens_per_second=0, reply_tokens=3)
+        self.failures = list(failures)
+        self.calls = 0
+
+    async def _start(self):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_delay())
+        if self.failures:
+            self.failure_status = self.failures.pop(0)
+            self._fail()
+
+def make_resilience(**overrides) -> LLMResilience:
+    settings = dict(
+        attempt_timeout=1.0, deadline=2.0, max_attempts=3, backoff_base=0.001, backoff_max=0.01,
+        hedge_delay=0.05, hedge_percentile=95, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=0.05),
+    )
+    settings.update(overrides)
+    return LLMResilience(**settings)
+
+@pytest.mark.asyncio
+async def test_resilience_retries_and_timeouts():
+    """
+    Test retries and deadlines around LLM provider calls.
+
+    Asserts:
+        - Retryable failures are retried and the call succeeds, for completions and streams.
+        - Non-retryable failures are not retried and surface as a 502 without Retry-After.
+        - An attempt that exceeds its timeout surfaces as a 504.
+    """
+    messages = [{"role": "user", "content": "Hi"}]
+    resilience = make_resilience()
+    backend = ScriptedBackend([503, 429])
+    assert await resilience.complete(backend, messages) == await ScriptedBackend([]).complete(messages)
+    assert backend.calls == 3
+    assert resilience.retries == 2
+
+    backend = ScriptedBackend([502])
+    assert len([chunk async for chunk in resilience.stream(backend, messages)]) == 3
+    assert backend.calls == 2
+
+    backend = ScriptedBackend([400])
+    with pytest.raises(LLMUnavailable) as error:
+        await resilience.complete(backend, messages)
+    assert (error.value.status_code, error.value.retry_after, backend.calls) == (502, None, 1)
+
+    with pytest.raises(LLMUnavailable) as error:
+        await make_resilience(attempt_timeout=0.01, max_attempts=1).complete(ScriptedBackend([], latency_ms=200), messages)
+    assert error.value.status_code == 504
+
+@pytest.mark.asyncio
+async def test_resilience_circuit_breaker_and_hedging():
+    """
+    Test the circuit breaker and hedged requests.
+
+    Asserts:
+        - After repeated failures the circuit opens and calls fail fast with a 503.
+        - After the reset timeout a trial call goes through and closes the circuit.
+        - A slow provider is hedged and the hedge's reply is returned.
+    """
+    messages = [{"role": "user", "content": "Hi"}]
+    resilience = make_resilience(max_attempts=1)
+    failing = ScriptedBackend([503] * 3)
+    for _ in range(3):
+        with pytest.raises(LLMUnavailable):
+            await resilience.complete(failing, messages)
+    with pytest.raises(LLMUnavailable) as error:
+        await resilience.complete(failing, messages)
+    assert error.value.status_code == 503
+    assert (failing.calls, resilience.short_circuited, resilience.breaker.state) == (3, 1, "open")
+
+    await asyncio.sleep(0.06)
+    assert await resilience.complete(failing, messages)
+    assert resilience.breaker.state == "closed"
+
+    slow, hedge = ScriptedBackend([], latency_ms=500), ScriptedBackend([])
+    hedge.reply_tokens = 1
+    reply = await make_resilience().complete(slow, messages, hedge_backend=hedge)
+    assert reply == await hedge.complete(messages)
+    assert (slow.calls, hedge.calls) == (1, 2)
+
+@pytest.mark.asyncio
+async def test_hedge_delay_keeps_slow_calls():
+    """
+    Test that calls won by the hedge still count towards the hedge delay.
+
+    Asserts:
+        - With half the calls slow and hedged, the 75th percentile hedge delay does not fall
+          to the latency of the fast calls.
+    """
+    messages = [{"role": "user", "content": "Hi"}]
+    resilience = make_resilience(hedge_delay=0.02, hedge_percentile=75)
+    fast, slow, hedge = ScriptedBackend([]), ScriptedBackend([], latency_ms=500), ScriptedBackend([])
+    for _ in range(20):
+        await resilience.complete(fast, messages, hedge_backend=hedge)
+        await resilience.complete(slow, messages, hedge_backend=hedge)
+    assert resilience.hedges_won == 20
+    assert resilience.hedge_delay() >= 0.015
+
+def test_serialization_and_encoding_negotiation():
+    """
+    Test the JSON helpers and the response encoding negotiation.
+
+    Asserts:
+        - json_dumps writes compact UTF-8 JSON that json_loads reads back.
+        - The accepted encoding with the highest q-value is chosen, ties going to the most
+          preferred one, and None is returned when nothing supported is accepted.
+    """
+    value = {"content": "Café ☕", "seq": 3, "items": [1.5, None, True]}
+    assert json_dumps(value) == '{"content":"Café ☕","seq":3,"items":[1.5,null,true]}'
+    assert json_loads(json_dumps(value)) == value
+
+    assert choose_encoding("gzip, deflate, br", ("br", "gzip")) == "br"
+    assert choose_encoding("br;q=0.5, gzip", ("br", "gzip")) == "gzip"
+    assert choose_encoding("*", ("br", "gzip")) == "br"
+    assert choose_encoding("gzip;q=0, identity", ("gzip",)) is None
+    assert choose_encoding("", ("gzip",)) is None
+
+@pytest.mark.asyncio
+async def test_quota_token_buckets(tmp_path):
+    """
+    Test the per-user request and LLM token buckets, in memory and in SQLite.
+
+    Asserts:
+        - A user can burst up to the request limit, then waits for the bucket to refill.
+        - Tokens are charged after the turn and may go negative, refusing requests until the
+          bucket is positive again.
+        - Users have separate buckets, and both stores behave the same.
+    """
+    buckets = TokenBuckets(2, 100, 60)
+    state, refused = buckets.take(None, 1000.0)
+    state, refused = buckets.take(state, 1000.0)
+    assert refused is None
+    state, refused = buckets.take(state, 1000.0)
+    assert refused == ("requests", 30.0)
+    state, refused = buckets.take(state, 1030.0)
+    assert refused is None
+
+    state = buckets.charge(state, 160, 1030.0)
+    assert state[1] == -60
+    state, refused = buckets.take(state, 1060.0)
+    assert refused[0] == "tokens" and round(refused[1], 6) == 6.6
+    state, refused = buckets.take(state, 1066.6)
+    assert refused is None
+
+    for store in (MemoryQuotaStore(TokenBuckets(2, 100, 60)), SQLiteQuotaStore(str(tmp_path / "quota.db"), TokenBuckets(2, 100, 60))):
+        assert await store.take(1) is None
+        await store.charge(1, 150)
+        assert (await store.take(1))[0] == "tokens"
+        assert await store.take(2) is None
+        requests, tokens = await store.remaining(2)
+        assert (round(requests), round(tokens)) == (1, 100)
+
+@pytest.mark.asyncio
+async def test_stream_chat_turn_resets_priority():
+    """
+    Test that a streamed priority turn does not leave the priority lane set for the caller.
+
+    Asserts:
+        - The turn's LLM call runs in the priority lane.
+        - The caller's priority flag is restored once the stream ends.
+    """
+    lanes = []
+
+    async def fake_stream_llm(conversation_history):
+        lanes.append(llm_priority.get())
+        yield "Restart the router."
+
+    with patch.object(chat_service, "build_context", AsyncMock(return_value=[])), \
+            patch.object(chat_service, "get_cached_reply", AsyncMock(return_value=None)), \
+            patch.object(chat_service, "store_reply", AsyncMock()), \
+            patch.object(chat_service, "finish_turn", AsyncMock()), \
+            patch.object(chat_service.llm_service, "stream_llm", fake_stream_llm):
+        chunks = [chunk async for chunk in chat_service.stream_chat_turn(AsyncMock(), 1, "Help", priority=True)]
+
+    assert (chunks, lanes) == (["Restart the router."], [True])
+    assert llm_priority.get() is False
+
+@pytest.mark.asyncio
+async def test_attached_idempotent_request_cancellation():
+    """
+    Test waiting on a request with the same Idempotency-Key running on this worker.
+
+    Asserts:
+        - Cancelling the waiting request stops it, while the original keeps running.
+        - The wait ends with a 409 after IDEMPOTENCY_WAIT_SECONDS.
+    """
+    class WaitConfig(Config):
+        IDEMPOTENCY_WAIT_SECONDS = 0.05
+
+    original = asyncio.get_running_loop().create_future()
+    flight_key = (1, "turn-1")
+    idempotency._in_flight[flight_key] = (idempotency.request_hash("Help"), original)
+    try:
+        waiting = asyncio.create_task(idempotency.begin_idempotent_request(AsyncMock(), 1, "turn-1", "Help"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiting, 1)
+        assert not original.done()
+
+        with pytest.raises(idempotency.IdempotencyConflict) as error:
+            await asyncio.wait_for(idempotency.begin_idempotent_request(AsyncMock(), 1, "turn-1", "Help", WaitConfig), 1)
+        assert error.value.status_code == 409
+    finally:
+        idempotency._in_flight.pop(flight_key, None)
+        original.cancel()
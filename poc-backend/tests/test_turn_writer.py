@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.db import Base
+from app.models import Conversation, Message, User
+from app.services.turn_writer import TurnWriter
+
+@pytest.mark.asyncio
+async def test_turn_writer_group_commit(tmp_path):
+    """
+    Test write-behind persistence of chat turns.
+
+    Asserts:
+        - Turns from several users submitted together are written in a single transaction.
+        - Each user's turns keep their order and get consecutive seqs after existing messages.
+        - drain() waits until a user's queued turns are written.
+        - A full queue refuses turns so the caller can write them synchronously.
+        - Stopping the writer flushes the turns still queued.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'writer.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    async with session_factory() as db:
+        users = [User(username=f"writer{index}@example.com", password_hash="hash") for index in range(3)]
+        db.add_all(users)
+        await db.flush()
+        conversation = Conversation(user_id=users[0].id)
+        db.add(conversation)
+        await db.flush()
+        db.add(Message(conversation_id=conversation.id, seq=1, role="user", content="earlier"))
+        await db.commit()
+        user_ids = [user.id for user in users]
+
+    commits = []
+    event.listen(engine.sync_engine, "commit", lambda conn: commits.append(1))
+
+    writer = TurnWriter(max_queue=4, flush_interval=0.01, max_batch=100)
+    assert not writer.submit(user_ids[0], "ignored", "writer not running")
+    writer.start(session_factory)
+
+    assert writer.submit(user_ids[0], "first", "reply 1")
+    assert writer.submit(user_ids[1], "hello", "hi")
+    assert writer.submit(user_ids[0], "second", "reply 2")
+    assert writer.submit(user_ids[2], "question", "answer")
+    assert not writer.submit(user_ids[1], "overflow", "queue full")
+
+    await writer.drain(user_ids[0])
+    assert writer.queued == 0
+    assert len(commits) == 1
+    assert writer.stats()["batches"] == 1
+    assert writer.stats()["fallbacks"] == 1
+
+    writer.submit(user_ids[1], "late", "flushed at shutdown")
+    await writer.stop()
+
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Conversation.user_id, Message.seq, Message.content)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .order_by(Conversation.user_id, Message.seq)
+        )
+        rows = result.all()
+
+    assert [(seq, content) for user_id, seq, content in rows if user_id == user_ids[0]] == [
+        (1, "earlier"), (2, "first"), (3, "reply 1"), (4, "second"), (5, "reply 2"),
+    ]
+    assert [content for user_id, seq, content in rows if user_id == user_ids[1]] == [
+        "hello", "hi", "late", "flushed at shutdown",
+    ]
+    assert [content for user_id, seq, content in rows if user_id == user_ids[2]] == ["question", "answer"]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_turn_writer_isolates_failing_turn(tmp_path):
+    """
+    Test that a turn that cannot be written does not block the turns queued with it.
+
+    Asserts:
+        - After MAX_BATCH_RETRIES failed retries the batch is written one turn per transaction.
+        - Only the bad turn fails; the other users' turns are written.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'writer.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    writer = TurnWriter(max_queue=10, flush_interval=0.01, max_batch=100)
+    with patch("app.services.turn_writer.RETRY_DELAY_SECONDS", 0):
+        writer.start(session_factory)
+        assert writer.submit(1, "hello", "hi")
+        assert writer.submit(2, None, "content is required")
+        assert writer.submit(3, "question", "answer")
+        await asyncio.wait_for(writer.drain(3), 5)
+        await writer.stop()
+
+    assert (writer.stats()["failures"], writer.stats()["dropped"], writer.stats()["turns_written"]) == (4, 1, 2)
+    async with session_factory() as db:
+        result = await db.execute(
+            select(Conversation.user_id, Message.content)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .order_by(Conversation.user_id, Message.seq)
+        )
+        assert result.all() == [(1, "hello"), (1, "hi"), (3, "question"), (3, "answer")]
+    await engine.dispose()
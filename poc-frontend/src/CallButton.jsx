@@ -3,7 +3,7 @@ import axios from "axios";
 import { PhoneCall } from "lucide-react";
 
 const CallButton = () => {
-    const [jitsiUrl, setJitsiUrl] = useState("");
+    const [queueStatus, setQueueStatus] = useState("");
 
     const callTechnician = async () => {
         try {
@@ -12,17 +12,26 @@ const CallButton = () => {
                 headers: { Authorization: `Bearer ${token}` },
             });
 
-            setJitsiUrl(response.data.jitsi_url);
-            window.open(jitsiUrl, "_blank"); // Opens Jitsi Meet in a new tab
+            const { jitsi_url, status, position, eta_seconds } = response.data;
+            if (status === "waiting") {
+                const eta = eta_seconds == null ? "" : ` (about ${Math.ceil(eta_seconds / 60)} min)`;
+                setQueueStatus(`You are number ${position} in line${eta}`);
+            } else {
+                setQueueStatus("A technician is joining the call");
+            }
+            window.open(jitsi_url, "_blank"); // Opens Jitsi Meet in a new tab
         } catch (error) {
             console.error("Error initiating call:", error);
         }
     };
 
     return (
-        <button onClick={callTechnician} className="m-3 p-4 bg-green-500 text-white flex items-center rounded-lg justify-center gap-2 border-t border-green-700">
-            <PhoneCall className="w-5 h-5" /> Call Technician
-        </button>
+        <>
+            <button onClick={callTechnician} className="m-3 p-4 bg-green-500 text-white flex items-center rounded-lg justify-center gap-2 border-t border-green-700">
+                <PhoneCall className="w-5 h-5" /> Call Technician
+            </button>
+            {queueStatus && <p className="mx-3 text-sm text-gray-600">{queueStatus}</p>}
+        </>
     );
 };
 
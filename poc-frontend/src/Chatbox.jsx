@@ -41,13 +41,15 @@ const ChatBox = () => {
         setMessages(newMessages);
         setInput("");
         setLoading(true);
+        const idempotencyKey = crypto.randomUUID();
 
         try {
             const token = localStorage.getItem("access_token");
             const response = await axios.post(
                 "http://localhost:8000/api/llm",
                 { message: input, user_id: localStorage.getItem("user_id") },
-                { headers: { Authorization: `Bearer ${token}` } }
+                // A retried request reuses its key, so the server answers it without a second turn
+                { headers: { Authorization: `Bearer ${token}`, "Idempotency-Key": idempotencyKey } }
             );
             setMessages([...newMessages, { role: "llm", text: response.data.reply }]);
         } catch (error) {